@@ -0,0 +1,196 @@
+# ----------------------------------------------------------------------
+# asyncparse.py
+#
+# Parsing from asyncio code without blocking the event loop. Parses run
+# in a thread or process pool, files are read in the loop's default
+# executor, and no more than a set number of parses are under way at
+# once. Needs Python 3.6 or later; the module is a syntax error before
+# that.
+# ----------------------------------------------------------------------
+
+import asyncio
+import collections
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+
+from . import budget
+from . import project
+from .phpparse import make_parser
+
+ParseResult = collections.namedtuple('ParseResult', ['path', 'nodes', 'error'])
+
+try:
+    _running_loop = asyncio.get_running_loop
+except AttributeError:
+    # Python 3.6, where this is the running loop when called from a
+    # coroutine
+    _running_loop = asyncio.get_event_loop
+
+_local = threading.local()
+
+def _get_parser(limited):
+    # parsers are not thread-safe, so every thread gets its own
+    name = 'limited' if limited else 'parser'
+    parser = getattr(_local, name, None)
+    if parser is None:
+        parser = make_parser()
+        if limited:
+            budget.limit_parser(parser)
+        setattr(_local, name, parser)
+    return parser
+
+def _parse(source, filename, doc_comments, limits, cancel=None):
+    # run in the executor; the lexer checks cancel even without limits
+    limits = limits or {}
+    parser = _get_parser('max_nodes' in limits or 'max_depth' in limits)
+    return budget.parse(source, budget.Budget(cancel=cancel, **limits),
+                        filename, doc_comments, parser)
+
+
+class AsyncParser(object):
+    """Parses for asyncio code.
+
+    Parses run in executor, or in a pool of worker threads (or
+    processes, with processes) made for the purpose and shut down by
+    close(). Threads share the GIL with the event loop, so processes give
+    more throughput on several cores; threads avoid copying sources and
+    trees between processes, and a thread's parse stops soon after the
+    task awaiting it is cancelled.
+
+    At most concurrency parses and file reads are under way at once
+    (twice the number of workers by default); further calls wait for a
+    slot. limits are budget.Budget limits for every parse, as a dict."""
+
+    def __init__(self, executor=None, processes=False, workers=None,
+                 concurrency=None, limits=None, doc_comments=False):
+        workers = workers or multiprocessing.cpu_count()
+        self.owned = executor is None
+        if executor is None:
+            if processes:
+                executor = concurrent.futures.ProcessPoolExecutor(workers)
+            else:
+                executor = concurrent.futures.ThreadPoolExecutor(workers)
+        self.executor = executor
+        self.processes = isinstance(executor,
+                                    concurrent.futures.ProcessPoolExecutor)
+        self.concurrency = concurrency or workers * 2
+        self.limits = limits
+        self.doc_comments = doc_comments
+        self._loop = None
+        self._slots = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.owned:
+            self.executor.shutdown(wait=False)
+
+    def _semaphore(self):
+        # semaphores belong to one loop; make one for each loop used
+        loop = _running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.concurrency)
+        return self._slots
+
+    async def _run(self, source, filename):
+        loop = _running_loop()
+        cancel = None if self.processes else threading.Event()
+        future = loop.run_in_executor(self.executor, _parse, source, filename,
+                                      self.doc_comments, self.limits, cancel)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if cancel is not None:
+                cancel.set()
+            raise
+
+    async def parse(self, source, filename=None):
+        """Return the nodes of source, raising what parse_source would
+        and budget.BudgetExceeded."""
+        async with self._semaphore():
+            return await self._run(source, filename)
+
+    async def read_file(self, path):
+        return await _running_loop().run_in_executor(
+            None, project.read_source, path)
+
+    async def parse_file(self, path):
+        async with self._semaphore():
+            source = await self.read_file(path)
+            return await self._run(source, os.path.abspath(path))
+
+    async def _parse_result(self, path):
+        try:
+            return ParseResult(path, await self.parse_file(path), None)
+        except (SyntaxError, RuntimeError, budget.BudgetExceeded,
+                IOError, OSError) as e:
+            return ParseResult(path, None, '%s: %s' % (e.__class__.__name__,
+                                                       e))
+
+    async def parse_many(self, paths):
+        """Parse every file in paths, an iterable or async iterable, and
+        yield a ParseResult for each as it is done, so not necessarily in
+        the order of paths.
+
+        Paths are taken from paths only as parses finish and their results
+        are consumed: no more than concurrency files are read, parsed or
+        waiting to be consumed at any time. Closing the generator early
+        cancels the parses still under way."""
+        if hasattr(paths, '__aiter__'):
+            paths = paths.__aiter__()
+            async def next_path():
+                try:
+                    return await paths.__anext__()
+                except StopAsyncIteration:
+                    return None
+        else:
+            paths = iter(paths)
+            async def next_path():
+                return next(paths, None)
+        pending = set()
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < self.concurrency:
+                    path = await next_path()
+                    if path is None:
+                        exhausted = True
+                    else:
+                        pending.add(asyncio.ensure_future(
+                            self._parse_result(path)))
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            # let the cancelled tasks finish before the loop can be closed
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+
+_default = None
+
+def _get_default():
+    global _default
+    if _default is None:
+        _default = AsyncParser()
+    return _default
+
+async def parse_async(source, filename=None):
+    """Parse source in a shared thread pool."""
+    return await _get_default().parse(source, filename)
+
+def parse_many(paths):
+    """Parse files in a shared thread pool; see AsyncParser.parse_many."""
+    return _get_default().parse_many(paths)
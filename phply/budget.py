@@ -0,0 +1,182 @@
+# ----------------------------------------------------------------------
+# budget.py
+#
+# Limits on how much work parsing one source may take, for services that
+# parse untrusted input: sizes, token and node counts, nesting depth, a
+# deadline and cooperative cancellation.
+# ----------------------------------------------------------------------
+
+import collections
+import sys
+import time
+
+from . import phpast as ast
+from . import phplex
+from .phpparse import make_parser
+
+# what had been done when a budget ran out
+ParseStats = collections.namedtuple('ParseStats', ['tokens', 'nodes', 'depth',
+                                                   'elapsed', 'lineno'])
+
+_unlimited = sys.maxsize
+
+
+class BudgetExceeded(Exception):
+    """Parsing went over a Budget. limit is the name of the limit that was
+    reached (max_size, max_tokens, max_nodes, max_depth, deadline or
+    cancelled) and stats the ParseStats up to that point."""
+
+    def __init__(self, limit, stats):
+        Exception.__init__(self, '%s reached after %d tokens at line %s'
+                           % (limit, stats.tokens, stats.lineno))
+        self.limit = limit
+        self.stats = stats
+
+    def __reduce__(self):
+        # to come back from worker processes in one piece
+        return (self.__class__, (self.limit, self.stats))
+
+
+class Budget(object):
+    """Limits for one parse; None means no limit.
+
+    max_size is checked before starting, in characters. max_tokens counts
+    every token the lexer produces, whitespace and comments included, and
+    max_nodes the nodes as they are built. max_depth limits the depth of
+    the parser's stack, which grows with any kind of nesting, and is
+    checked as every token is handed to the parser. timeout is in seconds
+    from the start of the parse and deadline a time.time() value. cancel
+    is anything with an is_set() method, such as a threading.Event, for
+    stopping a parse from another thread.
+
+    The clock and cancel are looked at every check_every tokens, the rest
+    on every token or reduction."""
+
+    def __init__(self, max_size=None, max_tokens=None, max_nodes=None,
+                 max_depth=None, timeout=None, deadline=None, cancel=None,
+                 check_every=256):
+        self.max_size = max_size
+        self.max_tokens = max_tokens
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.timeout = timeout
+        self.deadline = deadline
+        self.cancel = cancel
+        self.check_every = check_every
+
+
+class LimitedLexer(phplex.FilteredLexer):
+    """A FilteredLexer that keeps to a Budget. It counts tokens itself and
+    holds the counts that parsers prepared with limit_parser() update."""
+
+    def __init__(self, lexer, budget, doc_comments=False):
+        phplex.FilteredLexer.__init__(self, lexer, doc_comments)
+        self.budget = budget
+        self.max_tokens = budget.max_tokens or _unlimited
+        self.max_nodes = budget.max_nodes or _unlimited
+        self.max_depth = budget.max_depth or _unlimited
+        self.reset()
+
+    def clone(self):
+        return LimitedLexer(self.lexer.clone(), self.budget, self.doc_comments)
+
+    def reset(self):
+        budget = self.budget
+        self.tokens = self.nodes = self.depth = 0
+        # the parser's symbol stack, known from its first reduction, and
+        # the tokens handed to the parser
+        self.stack = None
+        self.passed = 0
+        self.started = time.time()
+        deadline = budget.deadline
+        if budget.timeout is not None:
+            timeout = self.started + budget.timeout
+            deadline = timeout if deadline is None else min(deadline, timeout)
+        self.deadline = deadline
+        self.next_check = 0
+
+    def input(self, input):
+        if self.budget.max_size is not None and \
+           len(input) > self.budget.max_size:
+            self.exceeded('max_size')
+        phplex.FilteredLexer.input(self, input)
+        self.reset()
+
+    def next_lexer_token(self):
+        self.tokens += 1
+        if self.tokens > self.max_tokens:
+            self.exceeded('max_tokens')
+        if self.tokens >= self.next_check:
+            self.next_check = self.tokens + self.budget.check_every
+            self.check()
+        return self.lexer.token()
+
+    def token(self):
+        # Every shifted token goes on the parser's stack, so nesting like
+        # '((((' is caught here, long before the reductions that end it.
+        # Until the first reduction the stack holds every token so far.
+        stack = self.stack
+        depth = len(stack) if stack is not None else self.passed + 1
+        if depth > self.depth:
+            self.depth = depth
+            if depth > self.max_depth:
+                self.exceeded('max_depth')
+        self.passed += 1
+        return phplex.FilteredLexer.token(self)
+
+    def check(self):
+        """Raise BudgetExceeded if the deadline has passed or the parse
+        was cancelled."""
+        if self.deadline is not None and time.time() > self.deadline:
+            self.exceeded('deadline')
+        cancel = self.budget.cancel
+        if cancel is not None and cancel.is_set():
+            self.exceeded('cancelled')
+
+    def stats(self):
+        return ParseStats(self.tokens, self.nodes, self.depth,
+                          time.time() - self.started, self.lexer.lineno)
+
+    def exceeded(self, limit):
+        raise BudgetExceeded(limit, self.stats())
+
+def _limit(action):
+    def limited(p):
+        action(p)
+        lexer = p.lexer
+        lexer.stack = p.stack
+        if isinstance(p[0], ast.Node):
+            lexer.nodes += 1
+            if lexer.nodes > lexer.max_nodes:
+                lexer.exceeded('max_nodes')
+        depth = len(p.stack)
+        if depth > lexer.depth:
+            lexer.depth = depth
+            if depth > lexer.max_depth:
+                lexer.exceeded('max_depth')
+    return limited
+
+def limit_parser(parser):
+    """Make a parser count nodes and nesting for a LimitedLexer, which it
+    must then always be used with. The parser's actions are changed in
+    place, so use a parser of its own."""
+    for production in parser.productions:
+        if production.callable is not None:
+            production.callable = _limit(production.callable)
+    return parser
+
+_parser = None
+
+def _get_parser():
+    global _parser
+    if _parser is None:
+        _parser = limit_parser(make_parser())
+    return _parser
+
+def parse(source, budget, filename=None, doc_comments=False, parser=None):
+    """Parse source within budget, raising BudgetExceeded when a limit is
+    reached. parser, if given, must come from limit_parser()."""
+    lexer = LimitedLexer(phplex.new_lexer(), budget, doc_comments)
+    lexer.filename = filename
+    lexer.input(source)
+    return (parser or _get_parser()).parse(None, lexer=lexer)
@@ -0,0 +1,147 @@
+# ----------------------------------------------------------------------
+# cache.py
+#
+# An in-process LRU cache of parse results, for services that parse the
+# same snippets over and over.
+# ----------------------------------------------------------------------
+
+import collections
+import hashlib
+import sys
+import threading
+
+from . import phpast as ast
+from . import project
+from .phpparse import make_parser
+
+CacheStats = collections.namedtuple('CacheStats', ['hits', 'misses',
+                                                   'evictions', 'entries',
+                                                   'size', 'hit_rate'])
+
+
+def copy_tree(nodes):
+    """Return a copy of a list of nodes (or a single node) that shares
+    nothing mutable with it."""
+    def copy(value):
+        if isinstance(value, ast.Node):
+            new = object.__new__(value.__class__)
+            new.__dict__ = dict(value.__dict__)
+            pending.append(new)
+            return new
+        if value.__class__ is list:
+            new = list(value)
+            pending.append(new)
+            return new
+        return value
+    pending = []
+    result = copy(nodes)
+    while pending:
+        item = pending.pop()
+        if item.__class__ is list:
+            item[:] = [copy(value) for value in item]
+        else:
+            for field in item.fields:
+                setattr(item, field, copy(getattr(item, field)))
+    return result
+
+def tree_size(nodes):
+    """Estimate the memory used by a tree, in bytes."""
+    size = 0
+    stack = [nodes]
+    getsizeof = sys.getsizeof
+    while stack:
+        value = stack.pop()
+        if isinstance(value, ast.Node):
+            size += getsizeof(value) + getsizeof(value.__dict__)
+            stack.extend(getattr(value, field) for field in value.fields)
+        elif value.__class__ is list:
+            size += getsizeof(value)
+            stack.extend(value)
+        elif value is not None and value is not True and value is not False:
+            # None and the booleans are shared
+            size += getsizeof(value)
+    return size
+
+def _key(source, filename):
+    # __FILE__ and __DIR__ parse to the filename, so it is part of the key
+    if not isinstance(source, bytes):
+        source = source.encode('utf-8', 'surrogateescape')
+    return hashlib.sha1(source).digest(), filename
+
+
+class ParseCache(object):
+    """Parses PHP source, remembering the results of the most recently used
+    sources. The cache holds at most max_entries trees and about max_bytes
+    of them, as estimated by tree_size(); the least recently used ones are
+    dropped first.
+
+    Sources are looked up by their SHA-1 digest and filename. Each call
+    gets its own copy of the tree, so callers may change it freely; with
+    copy=False the cached tree itself is returned, which is faster but
+    must be left alone.
+    Sources that don't parse are not cached.
+
+    Safe to use from several threads: each thread parses with a parser of
+    its own, and the cache is only locked while it is looked up or
+    updated."""
+
+    def __init__(self, max_entries=1024, max_bytes=64 << 20, copy=True):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.copy = copy
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.size = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def _parser(self):
+        parser = getattr(self._local, 'parser', None)
+        if parser is None:
+            parser = self._local.parser = make_parser()
+        return parser
+
+    def parse(self, source, filename=None):
+        """Return the list of top-level nodes for source. filename goes
+        into error messages and the values of __FILE__ and __DIR__."""
+        key = _key(source, filename)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                del self._entries[key]
+                self._entries[key] = entry
+            else:
+                self.misses += 1
+        if entry is None:
+            nodes = project.parse_source(source, filename, self._parser())
+            entry = (nodes, tree_size(nodes) + sys.getsizeof(key))
+            self._add(key, entry)
+        return copy_tree(entry[0]) if self.copy else entry[0]
+
+    def _add(self, key, entry):
+        if entry[1] > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                # another thread got there first
+                return
+            self._entries[key] = entry
+            self.size += entry[1]
+            while len(self._entries) > self.max_entries or \
+                    self.size > self.max_bytes:
+                _, (_, size) = self._entries.popitem(last=False)
+                self.size -= size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return CacheStats(self.hits, self.misses, self.evictions,
+                              len(self._entries), self.size,
+                              float(self.hits) / lookups if lookups else 0.0)
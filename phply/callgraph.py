@@ -0,0 +1,337 @@
+# ----------------------------------------------------------------------
+# callgraph.py
+#
+# Project-wide call graph in compressed sparse row form.
+# ----------------------------------------------------------------------
+
+import array
+import sys
+
+from . import phpast as ast
+from . import project
+from .nameresolve import import_sections
+
+if sys.version_info[0] == 3:
+    string_type = str
+else:
+    string_type = basestring
+
+
+def function_key(name):
+    return name.lstrip('\\').lower()
+
+def method_key(class_key, name):
+    return '%s::%s' % (class_key, name.lower())
+
+
+class FileCalls(object):
+    """Definitions and call sites found in one file.
+
+    Everything is stored with plain strings and tuples so that results can
+    be sent back from worker processes cheaply.
+
+    functions: (key, lineno) for every function and method defined
+    classes: (key, parent, traits) for every class, interface and trait
+    calls: (caller, kind, target, method, lineno) where kind is one of
+        'function' - target is a tuple of candidate function keys
+        'method'   - target is a class key, or None if the receiver is unknown
+        'static'   - target is a class key
+        'new'      - target is a class key, method is '__construct'
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.functions = []
+        self.classes = []
+        self.calls = []
+
+def _class_key(imports, class_, parent, name):
+    lowered = name.lower()
+    if lowered in ('self', 'static'):
+        return class_
+    if lowered == 'parent':
+        return parent
+    return function_key(imports.resolve_class(name))
+
+def extract_calls(nodes, path):
+    result = FileCalls(path)
+    for imports, section in import_sections(nodes):
+        stack = [(node, path, None, None) for node in reversed(section)]
+        while stack:
+            node, caller, class_, parent = stack.pop()
+            if not isinstance(node, ast.Node):
+                continue
+            if isinstance(node, (ast.Class, ast.Interface, ast.Trait)):
+                class_ = function_key(imports.resolve_class(node.name))
+                parent = None
+                if isinstance(node, ast.Class) and node.extends:
+                    parent = function_key(imports.resolve_class(node.extends))
+                traits = [function_key(imports.resolve_class(t.name))
+                          for t in getattr(node, 'traits', ())]
+                result.classes.append((class_, parent, traits))
+            elif isinstance(node, ast.Function):
+                caller = function_key(imports.qualify(node.name))
+                result.functions.append((caller, node.lineno))
+            elif isinstance(node, ast.Method) and class_:
+                caller = method_key(class_, node.name)
+                result.functions.append((caller, node.lineno))
+            elif isinstance(node, ast.FunctionCall) and \
+                 isinstance(node.name, string_type):
+                name = node.name
+                if '\\' in name:
+                    candidates = (function_key(imports.resolve_function(name)),)
+                elif imports.namespace:
+                    # unqualified calls fall back to the global function
+                    candidates = (function_key(imports.qualify(name)),
+                                  function_key(name))
+                else:
+                    candidates = (function_key(name),)
+                result.calls.append((caller, 'function', candidates, None,
+                                     node.lineno))
+            elif isinstance(node, ast.MethodCall) and \
+                 isinstance(node.name, string_type):
+                target = None
+                if isinstance(node.node, ast.Variable) and \
+                   node.node.name == '$this':
+                    target = class_
+                result.calls.append((caller, 'method', target,
+                                     node.name.lower(), node.lineno))
+            elif isinstance(node, ast.StaticMethodCall) and \
+                 isinstance(node.class_, string_type) and \
+                 isinstance(node.name, string_type):
+                target = _class_key(imports, class_, parent, node.class_)
+                result.calls.append((caller, 'static', target,
+                                     node.name.lower(), node.lineno))
+            elif isinstance(node, ast.New) and isinstance(node.name, string_type):
+                target = _class_key(imports, class_, parent, node.name)
+                result.calls.append((caller, 'new', target, '__construct',
+                                     node.lineno))
+
+            for field in reversed(node.fields):
+                value = getattr(node, field)
+                if isinstance(value, list):
+                    for item in reversed(value):
+                        stack.append((item, caller, class_, parent))
+                elif isinstance(value, ast.Node):
+                    stack.append((value, caller, class_, parent))
+    return result
+
+def _extract_file(path):
+    try:
+        return path, extract_calls(project.parse_file(path), path), None
+    except (SyntaxError, RuntimeError) as e:
+        return path, None, '%s: %s' % (e.__class__.__name__, e)
+
+
+class CallGraph(object):
+    """Call graph between functions, methods and files.
+
+    Each function, method and file is a numbered vertex; calls made by code
+    outside of any function belong to the file's vertex. Edges are kept in
+    compressed sparse row form: the callees of vertex i are
+    targets[offsets[i]:offsets[i + 1]]. Functions that are called but not
+    defined in the project (builtins, for example) get vertices of their own
+    so that they can be queried as well.
+
+    Method calls on receivers other than $this can not be resolved without
+    type information; with resolve_unknown_receivers they are linked to
+    every method with that name, otherwise they are dropped."""
+
+    def __init__(self, resolve_unknown_receivers=True):
+        self.resolve_unknown_receivers = resolve_unknown_receivers
+        # path -> (mtime, size, FileCalls or None, error)
+        self.files = {}
+        self.names = []
+        self.ids = {}
+        self.offsets = array.array('i', [0])
+        self.targets = array.array('i')
+        self._reverse = None
+        self._linked = True
+
+    # Building
+
+    def add_file(self, path, nodes, mtime=0, size=0):
+        self.files[path] = (mtime, size, extract_calls(nodes, path), None)
+        self._linked = False
+
+    def remove_file(self, path):
+        del self.files[path]
+        self._linked = False
+
+    def update(self, paths, processes=None):
+        """Extract calls from new and changed files under paths and forget
+        files that no longer exist. Returns the number of parsed files."""
+        if isinstance(paths, string_type):
+            paths = [paths]
+        current, changed = project.changed_files(paths, self.files)
+        sizes = dict((path, (mtime, size)) for path, mtime, size in changed)
+        for path, calls, error in project.map_files(_extract_file, sorted(sizes),
+                                                    processes):
+            current[path] = sizes[path] + (calls, error)
+        self.files = current
+        self._linked = False
+        return len(changed)
+
+    def _vertex(self, name):
+        try:
+            return self.ids[name]
+        except KeyError:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+            return self.ids[name]
+
+    def _link(self):
+        if self._linked:
+            return
+        self.names = []
+        self.ids = {}
+        self._reverse = None
+        parents = {}
+        traits = {}
+        defined = set()
+        by_name = {}
+        records = [self.files[path][2] for path in sorted(self.files)]
+        records = [r for r in records if r is not None]
+        for record in records:
+            self._vertex(record.path)
+            for class_, parent, used in record.classes:
+                parents[class_] = parent
+                traits[class_] = used
+            for key, lineno in record.functions:
+                self._vertex(key)
+                defined.add(key)
+                if '::' in key:
+                    by_name.setdefault(key.split('::', 1)[1], []).append(key)
+
+        def resolve_method(class_, name):
+            seen = set()
+            while class_ is not None and class_ not in seen:
+                seen.add(class_)
+                key = method_key(class_, name)
+                if key in defined:
+                    return key
+                todo = list(traits.get(class_, ()))
+                while todo:
+                    trait = todo.pop(0)
+                    if trait in seen:
+                        continue
+                    seen.add(trait)
+                    key = method_key(trait, name)
+                    if key in defined:
+                        return key
+                    todo.extend(traits.get(trait, ()))
+                class_ = parents.get(class_)
+            return None
+
+        edges = {}
+        for record in records:
+            for caller, kind, target, method, lineno in record.calls:
+                if kind == 'function':
+                    callees = [next((c for c in target if c in defined),
+                                    target[-1])]
+                elif target is not None:
+                    callee = resolve_method(target, method)
+                    if callee is None:
+                        if kind == 'new':
+                            continue
+                        callee = method_key(target, method)
+                    callees = [callee]
+                elif self.resolve_unknown_receivers:
+                    callees = by_name.get(method, ())
+                else:
+                    callees = ()
+                source = self._vertex(caller)
+                for callee in callees:
+                    edges.setdefault(source, set()).add(self._vertex(callee))
+
+        offsets = array.array('i', [0])
+        targets = array.array('i')
+        for vertex in range(len(self.names)):
+            targets.extend(sorted(edges.get(vertex, ())))
+            offsets.append(len(targets))
+        self.offsets = offsets
+        self.targets = targets
+        self._linked = True
+
+    # Queries
+
+    def vertex(self, name):
+        self._link()
+        try:
+            return self.ids[name]
+        except KeyError:
+            return self.ids[function_key(name)]
+
+    @property
+    def edge_count(self):
+        self._link()
+        return len(self.targets)
+
+    def reverse(self):
+        """Return (offsets, targets) of the reversed graph."""
+        self._link()
+        if self._reverse is None:
+            counts = array.array('i', [0] * (len(self.names) + 1))
+            for target in self.targets:
+                counts[target + 1] += 1
+            for i in range(len(self.names)):
+                counts[i + 1] += counts[i]
+            offsets = array.array('i', counts)
+            sources = array.array('i', [0] * len(self.targets))
+            fill = array.array('i', counts)
+            for source in range(len(self.names)):
+                for i in range(self.offsets[source], self.offsets[source + 1]):
+                    target = self.targets[i]
+                    sources[fill[target]] = source
+                    fill[target] += 1
+            self._reverse = (offsets, sources)
+        return self._reverse
+
+    def callees(self, name):
+        i = self.vertex(name)
+        return [self.names[t] for t in
+                self.targets[self.offsets[i]:self.offsets[i + 1]]]
+
+    def callers(self, name):
+        offsets, sources = self.reverse()
+        i = self.vertex(name)
+        return [self.names[s] for s in sources[offsets[i]:offsets[i + 1]]]
+
+    def _bfs(self, starts, offsets, targets):
+        seen = bytearray(len(self.names))
+        todo = []
+        for name in starts:
+            i = self.vertex(name)
+            if not seen[i]:
+                seen[i] = 1
+                todo.append(i)
+        while todo:
+            i = todo.pop()
+            for j in targets[offsets[i]:offsets[i + 1]]:
+                if not seen[j]:
+                    seen[j] = 1
+                    todo.append(j)
+        return seen
+
+    def reachable(self, entries):
+        """Names of everything reachable from the given entry points, which
+        are usually file paths."""
+        self._link()
+        seen = self._bfs(entries, self.offsets, self.targets)
+        return set(self.names[i] for i in range(len(seen)) if seen[i])
+
+    def is_reachable(self, name, entries):
+        self._link()
+        return bool(self._bfs(entries, self.offsets,
+                              self.targets)[self.vertex(name)])
+
+    def unreachable_functions(self, entries):
+        """Defined functions and methods not reachable from entries."""
+        reachable = self.reachable(entries)
+        result = []
+        for path in sorted(self.files):
+            record = self.files[path][2]
+            if record is not None:
+                result.extend(key for key, lineno in record.functions
+                              if key not in reachable)
+        return result
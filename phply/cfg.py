@@ -0,0 +1,433 @@
+# ----------------------------------------------------------------------
+# cfg.py
+#
+# Control-flow graphs of function bodies.
+# ----------------------------------------------------------------------
+
+import array
+import collections
+import copy
+import hashlib
+from . import phpast as ast
+
+ENTRY = 0
+EXIT = 1
+
+
+def structural_hash(node, with_lineno=True):
+    """Hash a subtree by its shape and values, without recursion.
+
+    With with_lineno, equal code at different lines hashes differently,
+    which is what caches keyed on reparsed files want."""
+    digest = hashlib.sha1()
+    stack = [node]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, ast.Node):
+            if with_lineno:
+                digest.update(('<%s:%s' % (value.__class__.__name__,
+                                           value.lineno)).encode('utf-8'))
+            else:
+                digest.update(('<' + value.__class__.__name__).encode('utf-8'))
+            stack.append(_close)
+            stack.extend(getattr(value, field)
+                         for field in reversed(value.fields))
+        elif isinstance(value, list):
+            digest.update(b'[')
+            stack.append(_close_list)
+            stack.extend(reversed(value))
+        elif value is _close:
+            digest.update(b'>')
+        elif value is _close_list:
+            digest.update(b']')
+        else:
+            digest.update(('%s:%r,' % (type(value).__name__, value))
+                          .encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest()
+
+_close = object()
+_close_list = object()
+
+
+class CFG(object):
+    """Basic blocks and edges of one function body.
+
+    Block 0 is the entry and block 1 the exit, both always empty. Each other
+    block holds the statements and conditions that execute in it, in order:
+    statements as they appear in the AST and the `expr` of conditions.
+    Compound statements are not stored, except that the header of a foreach
+    loop holds the Foreach node, standing for fetching the next element into
+    the key and value variables, and a catch handler starts with its Catch
+    node, standing for the assignment of the exception. The successors
+    of block b are succ_targets[succ_offsets[b]:succ_offsets[b + 1]], and
+    predecessors are stored the same way."""
+
+    def __init__(self, function, blocks, edges):
+        self.function = function
+        self.blocks = blocks
+        self.succ_offsets, self.succ_targets = _csr(len(blocks), edges)
+        self.pred_offsets, self.pred_targets = _csr(
+            len(blocks), [(dst, src) for src, dst in edges])
+        self._rpo = None
+
+    def __len__(self):
+        return len(self.blocks)
+
+    @property
+    def edge_count(self):
+        return len(self.succ_targets)
+
+    def successors(self, block):
+        return self.succ_targets[self.succ_offsets[block]:
+                                 self.succ_offsets[block + 1]]
+
+    def predecessors(self, block):
+        return self.pred_targets[self.pred_offsets[block]:
+                                 self.pred_offsets[block + 1]]
+
+    def reverse_postorder(self):
+        """Blocks reachable from the entry, in reverse postorder."""
+        if self._rpo is None:
+            seen = bytearray(len(self.blocks))
+            order = []
+            seen[ENTRY] = 1
+            stack = [(ENTRY, iter(self.successors(ENTRY)))]
+            while stack:
+                block, children = stack[-1]
+                for child in children:
+                    if not seen[child]:
+                        seen[child] = 1
+                        stack.append((child, iter(self.successors(child))))
+                        break
+                else:
+                    stack.pop()
+                    order.append(block)
+            order.reverse()
+            self._rpo = array.array('i', order)
+        return self._rpo
+
+    def unreachable_blocks(self):
+        reachable = set(self.reverse_postorder())
+        return [b for b in range(len(self.blocks))
+                if b not in reachable and self.blocks[b]]
+
+def _csr(count, edges):
+    counts = [0] * (count + 1)
+    for src, dst in edges:
+        counts[src + 1] += 1
+    for i in range(count):
+        counts[i + 1] += counts[i]
+    offsets = array.array('i', counts)
+    targets = array.array('i', [0] * len(edges))
+    fill = list(counts)
+    for src, dst in sorted(edges):
+        targets[fill[src]] = dst
+        fill[src] += 1
+    return offsets, targets
+
+
+Loop = collections.namedtuple('Loop', ['break_to', 'continue_to'])
+
+
+class CFGBuilder(object):
+    """Builds a CFG from a function body.
+
+    Only control flow at statement level is modelled: `exit` and `die` end
+    the function when used as statements, but not inside expressions such
+    as `$f or die()`. Any block inside a try body may jump to its catch
+    handlers, while returns from within a try/finally go straight to the
+    exit without visiting the finally block."""
+
+    def __init__(self):
+        self.blocks = []
+        self.edges = set()
+        self.loops = []
+        self.handlers = []
+
+    def new_block(self):
+        self.blocks.append([])
+        return len(self.blocks) - 1
+
+    def edge(self, src, dst):
+        self.edges.add((src, dst))
+
+    def add(self, current, node):
+        self.blocks[current].append(node)
+        if self.handlers and _may_throw(node):
+            for handler in self.handlers[-1]:
+                self.edge(current, handler)
+
+    def build(self, function):
+        if isinstance(function, (ast.Function, ast.Method, ast.Closure)):
+            body = function.nodes
+        else:
+            body = function
+        self.new_block()
+        self.new_block()
+        start = self.new_block()
+        self.edge(ENTRY, start)
+        end = self.statements(body, start)
+        self.edge(end, EXIT)
+        return CFG(function, self.blocks, sorted(self.edges))
+
+    def statements(self, nodes, current):
+        for node in nodes:
+            current = self.statement(node, current)
+        return current
+
+    def body(self, node, current):
+        if isinstance(node, ast.Block):
+            return self.statements(node.nodes, current)
+        if node is None:
+            return current
+        return self.statement(node, current)
+
+    def jump(self, current, target):
+        self.edge(current, target)
+        # code after an unconditional jump is unreachable, but still gets a
+        # block of its own
+        return self.new_block()
+
+    def loop_target(self, node, kind):
+        level = 1
+        if isinstance(node, int) and node > 0:
+            level = node
+        if level > len(self.loops):
+            return None
+        return getattr(self.loops[-level], kind)
+
+    def statement(self, node, current):
+        method = getattr(self, 'statement_' + node.__class__.__name__, None) \
+            if isinstance(node, ast.Node) else None
+        if method is not None:
+            return method(node, current)
+        if node is not None:
+            self.add(current, node)
+        return current
+
+    def statement_Block(self, node, current):
+        return self.statements(node.nodes, current)
+
+    def statement_Declare(self, node, current):
+        return self.body(node.node, current)
+
+    def statement_If(self, node, current):
+        after = self.new_block()
+        branches = [(node.expr, node.node)]
+        branches.extend((elseif.expr, elseif.node) for elseif in node.elseifs)
+        for expr, body in branches:
+            self.add(current, expr)
+            then = self.new_block()
+            self.edge(current, then)
+            self.edge(self.body(body, then), after)
+            otherwise = self.new_block()
+            self.edge(current, otherwise)
+            current = otherwise
+        if node.else_ is not None:
+            current = self.body(node.else_.node, current)
+        self.edge(current, after)
+        return after
+
+    def statement_While(self, node, current):
+        header = self.new_block()
+        after = self.new_block()
+        self.edge(current, header)
+        self.add(header, node.expr)
+        body = self.new_block()
+        self.edge(header, body)
+        self.edge(header, after)
+        self.loops.append(Loop(after, header))
+        self.edge(self.body(node.node, body), header)
+        self.loops.pop()
+        return after
+
+    def statement_DoWhile(self, node, current):
+        body = self.new_block()
+        test = self.new_block()
+        after = self.new_block()
+        self.edge(current, body)
+        self.loops.append(Loop(after, test))
+        self.edge(self.body(node.node, body), test)
+        self.loops.pop()
+        self.add(test, node.expr)
+        self.edge(test, body)
+        self.edge(test, after)
+        return after
+
+    def statement_For(self, node, current):
+        for expr in node.start or ():
+            self.add(current, expr)
+        header = self.new_block()
+        count = self.new_block()
+        after = self.new_block()
+        self.edge(current, header)
+        for expr in node.test or ():
+            self.add(header, expr)
+        body = self.new_block()
+        self.edge(header, body)
+        if node.test:
+            self.edge(header, after)
+        self.loops.append(Loop(after, count))
+        self.edge(self.body(node.node, body), count)
+        self.loops.pop()
+        for expr in node.count or ():
+            self.add(count, expr)
+        self.edge(count, header)
+        return after
+
+    def statement_Foreach(self, node, current):
+        self.add(current, node.expr)
+        header = self.new_block()
+        after = self.new_block()
+        self.edge(current, header)
+        body = self.new_block()
+        self.edge(header, body)
+        self.edge(header, after)
+        self.add(header, node)
+        self.loops.append(Loop(after, header))
+        self.edge(self.body(node.node, body), header)
+        self.loops.pop()
+        return after
+
+    def statement_Switch(self, node, current):
+        self.add(current, node.expr)
+        after = self.new_block()
+        # `continue` inside a switch behaves like `break`
+        self.loops.append(Loop(after, after))
+        bodies = [self.new_block() for _ in node.nodes]
+        default = None
+        test = current
+        for case, body in zip(node.nodes, bodies):
+            if isinstance(case, ast.Default):
+                default = body
+                continue
+            next_test = self.new_block()
+            self.edge(test, next_test)
+            test = next_test
+            self.add(test, case.expr)
+            self.edge(test, body)
+        self.edge(test, default if default is not None else after)
+        for i, (case, body) in enumerate(zip(node.nodes, bodies)):
+            end = self.statements(case.nodes, body)
+            # fall through to the next case
+            self.edge(end, bodies[i + 1] if i + 1 < len(bodies) else after)
+        self.loops.pop()
+        return after
+
+    def statement_Try(self, node, current):
+        after = self.new_block()
+        handlers = [self.new_block() for _ in node.catches]
+        finally_ = getattr(node, 'finally')
+        final = self.new_block() if finally_ is not None else None
+        body = self.new_block()
+        self.edge(current, body)
+        self.handlers.append(handlers)
+        end = self.statements(node.nodes, body)
+        self.handlers.pop()
+        ends = [end]
+        for catch, handler in zip(node.catches, handlers):
+            self.blocks[handler].append(catch)
+            ends.append(self.statements(catch.nodes, handler))
+        if final is not None:
+            for end in ends:
+                self.edge(end, final)
+            ends = [self.statements(finally_.nodes, final)]
+        for end in ends:
+            self.edge(end, after)
+        return after
+
+    def statement_Break(self, node, current):
+        self.blocks[current].append(node)
+        target = self.loop_target(node.node, 'break_to')
+        return self.jump(current, EXIT if target is None else target)
+
+    def statement_Continue(self, node, current):
+        self.blocks[current].append(node)
+        target = self.loop_target(node.node, 'continue_to')
+        return self.jump(current, EXIT if target is None else target)
+
+    def statement_Return(self, node, current):
+        self.add(current, node)
+        return self.jump(current, EXIT)
+
+    def statement_Exit(self, node, current):
+        self.add(current, node)
+        return self.jump(current, EXIT)
+
+    def statement_Throw(self, node, current):
+        # add() already linked the block to the handlers of an enclosing try
+        self.add(current, node)
+        if self.handlers and self.handlers[-1]:
+            return self.new_block()
+        return self.jump(current, EXIT)
+
+def _may_throw(node):
+    # declarations and plain output can't throw, anything else might call
+    # into code that does
+    return not isinstance(node, (ast.InlineHTML, ast.Function, ast.Class,
+                                 ast.Interface, ast.Trait, ast.Global,
+                                 ast.Static))
+
+def build_cfg(function):
+    """Build the CFG of a Function, Method or Closure node, or of a list of
+    statements such as the top level of a file."""
+    return CFGBuilder().build(function)
+
+
+class CFGCache(object):
+    """CFGs built on demand and cached by the structural hash of the
+    function node, so reparsing an unchanged file does not rebuild them.
+    A CFG found for an equal function of another tree is copied with its
+    blocks holding that function's nodes, so it never refers to a tree
+    that has been replaced."""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.cfgs = collections.OrderedDict()
+
+    def get(self, function):
+        key = structural_hash(function)
+        try:
+            cfg = self.cfgs.pop(key)
+        except KeyError:
+            cfg = build_cfg(function)
+            if len(self.cfgs) >= self.max_size:
+                self.cfgs.popitem(last=False)
+        if cfg.function is not function:
+            cfg = _rebind(cfg, function)
+        self.cfgs[key] = cfg
+        return cfg
+
+def _rebind(cfg, function):
+    # the same graph for a function equal to the one cfg was built from
+    nodes = {}
+    stack = [(cfg.function, function)]
+    while stack:
+        old, new = stack.pop()
+        if isinstance(old, ast.Node):
+            nodes[id(old)] = new
+            stack.extend((getattr(old, field), getattr(new, field))
+                         for field in old.fields)
+        elif isinstance(old, list):
+            stack.extend(zip(old, new))
+    result = copy.copy(cfg)
+    result.function = function
+    result.blocks = [[nodes[id(node)] if isinstance(node, ast.Node) else node
+                      for node in block] for block in cfg.blocks]
+    return result
+
+def functions(nodes):
+    """Yield every Function, Method and Closure in a tree."""
+    stack = list(reversed(nodes))
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, ast.Node):
+            continue
+        if isinstance(node, (ast.Function, ast.Method, ast.Closure)):
+            yield node
+        for field in reversed(node.fields):
+            value = getattr(node, field)
+            if isinstance(value, list):
+                stack.extend(reversed(value))
+            elif isinstance(value, ast.Node):
+                stack.append(value)
@@ -0,0 +1,187 @@
+# ----------------------------------------------------------------------
+# clones.py
+#
+# Duplicate code detection with normalized subtree fingerprints.
+# ----------------------------------------------------------------------
+
+import binascii
+import collections
+import functools
+import hashlib
+import sys
+
+from . import phpast as ast
+from . import project
+
+if sys.version_info[0] == 3:
+    string_type = str
+else:
+    string_type = basestring
+
+# fields holding names, operators and flags rather than literal values
+_structural_fields = frozenset(['op', 'name', 'type', 'class_', 'modifiers',
+                                'is_ref', 'once', 'visibility', 'alias', 'to',
+                                'from', 'extends', 'implements'])
+# nodes whose name field is a variable name
+_variable_nodes = (ast.Variable, ast.FormalParameter, ast.LexicalVariable,
+                   ast.StaticVariable)
+
+# end is the last line on which a node of the fragment starts
+Fragment = collections.namedtuple('Fragment', ['path', 'start', 'end', 'size',
+                                               'kind'])
+
+
+def fingerprints(nodes, min_size=30, abstract_literals=False):
+    """Fingerprint every subtree of a file in one bottom-up pass.
+
+    Variable names are replaced by a placeholder, and so are literal
+    strings and numbers with abstract_literals, so that renamed copies get
+    the same fingerprint. Returns a list of
+    (fingerprint, parent fingerprint, start line, end line, size, kind) for
+    the subtrees of at least min_size nodes, plus the fingerprint of the
+    whole file."""
+    results = {}
+    found = []
+    stack = [(nodes, None, False)]
+    while stack:
+        value, parent, done = stack.pop()
+        if not done:
+            stack.append((value, parent, True))
+            children = value if isinstance(value, list) else \
+                [getattr(value, field) for field in value.fields]
+            # parent is the closest enclosing node, skipping lists
+            owner = parent if isinstance(value, list) else value
+            for child in children:
+                if isinstance(child, (ast.Node, list)):
+                    stack.append((child, owner, False))
+            continue
+
+        digest = hashlib.sha1()
+        size = 1
+        end = getattr(value, 'lineno', None) or 0
+        if isinstance(value, list):
+            digest.update(b'[')
+            parts = [(None, item) for item in value]
+        else:
+            digest.update(value.__class__.__name__.encode('ascii'))
+            parts = [(field, getattr(value, field)) for field in value.fields]
+            if isinstance(value, _variable_nodes) and \
+               isinstance(value.name, string_type):
+                parts = [(field, '$' if field == 'name' else part)
+                         for field, part in parts]
+        for field, part in parts:
+            if isinstance(part, (ast.Node, list)):
+                # not popped: the parser puts some nodes in two places,
+                # like the condition of ?: that is also its true branch
+                child_digest, child_size, child_end = results[id(part)]
+                digest.update(child_digest)
+                size += child_size
+                end = max(end, child_end)
+            else:
+                if abstract_literals and field not in _structural_fields and \
+                   isinstance(part, (string_type, int, float)) and \
+                   not isinstance(part, bool):
+                    part = type(part).__name__
+                digest.update(('|%r' % (part,)).encode('utf-8',
+                                                       'surrogateescape'))
+        digest = digest.digest()
+        results[id(value)] = (digest, size, end)
+        if size >= min_size and isinstance(value, ast.Node):
+            found.append((value, parent, digest, end, size))
+
+    hexlify = lambda digest: binascii.hexlify(digest).decode('ascii')
+    digests = dict((id(node), hexlify(digest))
+                   for node, _, digest, _, _ in found)
+    return [(digests[id(node)], digests.get(id(parent)), node.lineno, end,
+             size, node.__class__.__name__)
+            for node, parent, digest, end, size in found], \
+        hexlify(results[id(nodes)][0])
+
+def _fingerprint_file(path, min_size, abstract_literals):
+    try:
+        nodes = project.parse_file(path)
+    except (SyntaxError, RuntimeError) as e:
+        return path, None, None, '%s: %s' % (e.__class__.__name__, e)
+    found, file_digest = fingerprints(nodes, min_size, abstract_literals)
+    return path, found, file_digest, None
+
+
+class CloneDetector(object):
+    """Groups identical subtrees across a set of files.
+
+    Only the largest duplicated subtrees are reported: a group is left out
+    when every one of its fragments lies inside a bigger duplicated
+    subtree."""
+
+    def __init__(self, min_size=30, abstract_literals=False):
+        self.min_size = min_size
+        self.abstract_literals = abstract_literals
+        # fingerprint -> [(Fragment, parent fingerprint)]
+        self.table = collections.defaultdict(list)
+        self.file_digests = collections.defaultdict(list)
+        self.errors = {}
+
+    def add_file(self, path, nodes):
+        found, file_digest = fingerprints(nodes, self.min_size,
+                                          self.abstract_literals)
+        self._add(path, found, file_digest)
+
+    def _add(self, path, found, file_digest):
+        self.file_digests[file_digest].append(path)
+        for digest, parent, start, end, size, kind in found:
+            self.table[digest].append((Fragment(path, start, end, size, kind),
+                                       parent))
+
+    def update(self, paths, processes=None):
+        """Fingerprint every PHP file under paths."""
+        scan = functools.partial(_fingerprint_file, min_size=self.min_size,
+                                 abstract_literals=self.abstract_literals)
+        for path, found, file_digest, error in project.map_files(
+                scan, project.find_php_files(paths), processes):
+            if error is not None:
+                self.errors[path] = error
+            else:
+                self._add(path, found, file_digest)
+
+    def groups(self):
+        """Return lists of Fragments with the same fingerprint, biggest
+        first."""
+        duplicated = set(digest for digest, entries in self.table.items()
+                         if len(entries) > 1)
+        result = []
+        for digest in duplicated:
+            entries = self.table[digest]
+            if all(parent in duplicated for _, parent in entries):
+                continue
+            result.append(sorted(fragment for fragment, _ in entries))
+        result.sort(key=lambda group: (-group[0].size * len(group), group[0]))
+        return result
+
+    def duplicate_files(self):
+        """Return lists of files with the same normalized contents."""
+        return sorted(sorted(paths) for paths in self.file_digests.values()
+                      if len(paths) > 1)
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Find duplicated PHP code")
+    ap.add_argument('-j', '--jobs', dest='jobs', type=int, default=None)
+    ap.add_argument('-s', '--min-size', dest='min_size', type=int, default=30,
+                    help='minimum number of AST nodes in a fragment')
+    ap.add_argument('-l', '--abstract-literals', dest='abstract_literals',
+                    action='store_true', help='ignore differing literals')
+    ap.add_argument('paths', metavar='PATH', nargs='+')
+    args = ap.parse_args()
+
+    detector = CloneDetector(args.min_size, args.abstract_literals)
+    detector.update(args.paths, args.jobs)
+    for path, error in sorted(detector.errors.items()):
+        sys.stderr.write('%s: %s\n' % (path, error))
+    for paths in detector.duplicate_files():
+        print('identical files: %s' % ' '.join(paths))
+    for group in detector.groups():
+        print('%d nodes, %d copies:' % (group[0].size, len(group)))
+        for fragment in group:
+            print('  %s:%s-%s %s' % (fragment.path, fragment.start,
+                                     fragment.end, fragment.kind))
@@ -0,0 +1,680 @@
+# ----------------------------------------------------------------------
+# constfold.py
+#
+# Constant folding and static expression evaluation for PHP ASTs.
+# ----------------------------------------------------------------------
+
+import math
+import re
+import sys
+from collections import OrderedDict
+
+from . import phpast as ast
+
+if sys.version_info[0] == 3:
+    string_type = str
+    integer_types = (int,)
+else:
+    string_type = basestring
+    integer_types = (int, long)
+
+PHP_INT_MAX = 2 ** 63 - 1
+PHP_INT_MIN = -2 ** 63
+
+# Predefined constants that are the same on every PHP build we care about.
+builtin_constants = {
+    'PHP_INT_MAX': PHP_INT_MAX,
+    'PHP_INT_MIN': PHP_INT_MIN,
+    'PHP_INT_SIZE': 8,
+    'PHP_EOL': '\n',
+    'DIRECTORY_SEPARATOR': '/',
+    'PATH_SEPARATOR': ':',
+    'M_PI': math.pi,
+    'E_ALL': 32767,
+    'E_ERROR': 1,
+    'E_WARNING': 2,
+    'E_NOTICE': 8,
+    'E_STRICT': 2048,
+}
+
+special_constants = {
+    'true': True,
+    'false': False,
+    'null': None,
+}
+
+numeric_prefix = re.compile(r'[ \t\n\r\v\f]*[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?')
+
+
+class NotConstant(Exception):
+    """Raised when an expression cannot be evaluated at compile time."""
+    pass
+
+
+# PHP type juggling
+
+def is_int(value):
+    return isinstance(value, integer_types) and not isinstance(value, bool)
+
+def int_or_float(value):
+    # integer arithmetic that leaves the 64-bit range continues as a float
+    if PHP_INT_MIN <= value <= PHP_INT_MAX:
+        return value
+    return float(value)
+
+def to_number(value):
+    if value is None or value is False:
+        return 0
+    if value is True:
+        return 1
+    if is_int(value) or isinstance(value, float):
+        return value
+    if isinstance(value, string_type):
+        match = numeric_prefix.match(value)
+        if not match:
+            return 0
+        text = match.group(0).strip()
+        if match.group(2) or match.group(3) or text.lstrip('+-').startswith('.'):
+            return float(text)
+        return int_or_float(int(text))
+    raise NotConstant('cannot convert %s to a number' % type(value).__name__)
+
+def to_int(value):
+    if isinstance(value, OrderedDict):
+        return int(bool(value))
+    value = to_number(value)
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            raise NotConstant('cannot convert %r to an integer' % value)
+        value = int(value)
+        if not PHP_INT_MIN <= value <= PHP_INT_MAX:
+            raise NotConstant('integer conversion out of range')
+    return value
+
+def to_float(value):
+    return float(to_number(value))
+
+def to_bool(value):
+    if isinstance(value, string_type):
+        return value not in ('', '0')
+    if isinstance(value, OrderedDict):
+        return len(value) > 0
+    return bool(value)
+
+def float_to_string(value):
+    if math.isnan(value):
+        return 'NAN'
+    if math.isinf(value):
+        return 'INF' if value > 0 else '-INF'
+    text = '%.14G' % value
+    if 'E' in text:
+        mantissa, exponent = text.split('E')
+        if '.' not in mantissa:
+            mantissa += '.0'
+        sign = exponent[0]
+        exponent = exponent[1:].lstrip('0') or '0'
+        text = '%sE%s%s' % (mantissa, sign, exponent)
+    return text
+
+def to_string(value):
+    if isinstance(value, string_type):
+        return value
+    if value is None or value is False:
+        return ''
+    if value is True:
+        return '1'
+    if is_int(value):
+        return '%d' % value
+    if isinstance(value, float):
+        return float_to_string(value)
+    raise NotConstant('cannot convert %s to a string' % type(value).__name__)
+
+def is_numeric_string(value):
+    match = numeric_prefix.match(value)
+    return match is not None and match.end() == len(value)
+
+def normalize_key(key):
+    if key is None:
+        return ''
+    if isinstance(key, bool):
+        return int(key)
+    if isinstance(key, float):
+        return to_int(key)
+    if isinstance(key, string_type) and re.match(r'^(0|-?[1-9][0-9]*)$', key):
+        number = int(key)
+        if PHP_INT_MIN <= number <= PHP_INT_MAX:
+            return number
+    if is_int(key) or isinstance(key, string_type):
+        return key
+    raise NotConstant('illegal offset type')
+
+def php_type(value):
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'bool'
+    if is_int(value):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, string_type):
+        return 'string'
+    return 'array'
+
+def identical(left, right):
+    if php_type(left) != php_type(right):
+        return False
+    if isinstance(left, OrderedDict):
+        if list(left.keys()) != list(right.keys()):
+            return False
+        return all(identical(left[key], right[key]) for key in left)
+    return left == right
+
+def compare(left, right):
+    """Loose comparison following PHP 5/7 rules; returns -1, 0 or 1."""
+    if isinstance(left, OrderedDict) or isinstance(right, OrderedDict):
+        if not (isinstance(left, OrderedDict) and isinstance(right, OrderedDict)):
+            raise NotConstant('array comparison with a scalar')
+        if len(left) != len(right):
+            return -1 if len(left) < len(right) else 1
+        for key in left:
+            if key not in right:
+                raise NotConstant('uncomparable arrays')
+            result = compare(left[key], right[key])
+            if result:
+                return result
+        return 0
+    if isinstance(left, bool) or isinstance(right, bool) or \
+       left is None or right is None:
+        if isinstance(left, string_type) and right is None:
+            left, right = left, ''
+        elif isinstance(right, string_type) and left is None:
+            left, right = '', right
+        else:
+            left, right = to_bool(left), to_bool(right)
+    if isinstance(left, string_type) and isinstance(right, string_type):
+        if is_numeric_string(left) and is_numeric_string(right):
+            left, right = to_number(left), to_number(right)
+    elif isinstance(left, string_type) or isinstance(right, string_type):
+        left, right = to_number(left), to_number(right)
+    return (left > right) - (left < right)
+
+
+# Operators
+
+def _arith(op, left, right):
+    left, right = to_number(left), to_number(right)
+    if op == '+':
+        result = left + right
+    elif op == '-':
+        result = left - right
+    elif op == '*':
+        result = left * right
+    else:
+        if right == 0:
+            raise NotConstant('division by zero')
+        if is_int(left) and is_int(right) and left % right == 0:
+            return int_or_float(left // right)
+        return float(left) / right
+    if is_int(result):
+        return int_or_float(result)
+    return result
+
+def _modulo(left, right):
+    left, right = to_int(left), to_int(right)
+    if right == 0:
+        raise NotConstant('modulo by zero')
+    result = abs(left) % abs(right)
+    return -result if left < 0 else result
+
+def _wrap(value):
+    value &= 0xFFFFFFFFFFFFFFFF
+    if value > PHP_INT_MAX:
+        value -= 1 << 64
+    return value
+
+def _shift(op, left, right):
+    left, right = to_int(left), to_int(right)
+    if right < 0:
+        raise NotConstant('bit shift by negative number')
+    if op == '<<':
+        return _wrap(left << right) if right < 64 else 0
+    if right >= 64:
+        return -1 if left < 0 else 0
+    return left >> right
+
+def _bitwise(op, left, right):
+    if isinstance(left, string_type) and isinstance(right, string_type):
+        if op == '|':
+            length = max(len(left), len(right))
+            left, right = left.ljust(length, '\0'), right.ljust(length, '\0')
+        pairs = zip(left, right)
+        if op == '&':
+            return ''.join(chr(ord(a) & ord(b)) for a, b in pairs)
+        if op == '|':
+            return ''.join(chr(ord(a) | ord(b)) for a, b in pairs)
+        return ''.join(chr(ord(a) ^ ord(b)) for a, b in pairs)
+    left, right = to_int(left), to_int(right)
+    if op == '&':
+        return left & right
+    if op == '|':
+        return left | right
+    return left ^ right
+
+def binary_op(op, left, right):
+    if op == '.':
+        return to_string(left) + to_string(right)
+    if op in ('+', '-', '*', '/'):
+        if op == '+' and isinstance(left, OrderedDict) and \
+           isinstance(right, OrderedDict):
+            result = OrderedDict(left)
+            for key, value in right.items():
+                result.setdefault(key, value)
+            return result
+        return _arith(op, left, right)
+    if op == '%':
+        return _modulo(left, right)
+    if op in ('<<', '>>'):
+        return _shift(op, left, right)
+    if op in ('&', '|', '^'):
+        return _bitwise(op, left, right)
+    if op in ('&&', 'and'):
+        return to_bool(left) and to_bool(right)
+    if op in ('||', 'or'):
+        return to_bool(left) or to_bool(right)
+    if op == 'xor':
+        return to_bool(left) != to_bool(right)
+    if op == '===':
+        return identical(left, right)
+    if op == '!==':
+        return not identical(left, right)
+    if op == '==':
+        return compare(left, right) == 0
+    if op in ('!=', '<>'):
+        return compare(left, right) != 0
+    if op == '<':
+        return compare(left, right) < 0
+    if op == '<=':
+        return compare(left, right) <= 0
+    if op == '>':
+        return compare(left, right) > 0
+    if op == '>=':
+        return compare(left, right) >= 0
+    raise NotConstant('unsupported operator %r' % op)
+
+def unary_op(op, value):
+    if op == '!':
+        return not to_bool(value)
+    if op == '~':
+        if isinstance(value, string_type):
+            return ''.join(chr(~ord(c) & 0xFF) for c in value)
+        if isinstance(value, float):
+            value = to_int(value)
+        if not is_int(value):
+            raise NotConstant('unsupported operand for ~')
+        return ~value
+    if op == '-':
+        return _arith('*', value, -1)
+    if op == '+':
+        return to_number(value)
+    raise NotConstant('unsupported operator %r' % op)
+
+def cast(type_, value):
+    if type_ == 'int':
+        return to_int(value)
+    if type_ == 'double':
+        return to_float(value)
+    if type_ in ('string', 'binary'):
+        return to_string(value)
+    if type_ == 'bool':
+        return to_bool(value)
+    if type_ == 'unset':
+        return None
+    if type_ == 'array':
+        if isinstance(value, OrderedDict):
+            return value
+        if value is None:
+            return OrderedDict()
+        return OrderedDict([(0, value)])
+    raise NotConstant('cannot cast to %s at compile time' % type_)
+
+
+# Conversion between values and nodes
+
+def value_to_node(value, lineno=None):
+    """Build the literal AST node that evaluates to `value`."""
+    if isinstance(value, bool) or value is None:
+        return ast.Constant(to_string_constant(value), lineno=lineno)
+    if is_int(value) or isinstance(value, string_type):
+        return value
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            raise NotConstant('no literal for %r' % value)
+        return value
+    if isinstance(value, OrderedDict):
+        elements = []
+        next_index = 0
+        for key, item in value.items():
+            # keep implicit keys implicit so list-like arrays look the same
+            # as they were written
+            if key == next_index and is_int(key):
+                key_node = None
+            else:
+                key_node = value_to_node(key, lineno)
+            if is_int(key) and key >= next_index:
+                next_index = key + 1
+            elements.append(ast.ArrayElement(key_node,
+                                             value_to_node(item, lineno),
+                                             False, lineno=lineno))
+        return ast.Array(elements, lineno=lineno)
+    raise NotConstant('no literal for %r' % (value,))
+
+def to_string_constant(value):
+    if value is None:
+        return 'null'
+    return 'true' if value else 'false'
+
+def is_literal(node):
+    if isinstance(node, ast.Constant):
+        return node.name.lower() in special_constants
+    if isinstance(node, ast.Array):
+        return all(is_literal(e.key) and is_literal(e.value)
+                   and not e.is_ref for e in node.nodes)
+    return node is None or not isinstance(node, ast.Node)
+
+
+# Evaluation
+
+class Scope(object):
+    def __init__(self, namespace=None, class_=None):
+        self.namespace = namespace
+        self.class_ = class_
+
+    def qualify(self, name):
+        if name.startswith('\\'):
+            return name[1:]
+        if name.lower().startswith('namespace\\'):
+            name = name[len('namespace\\'):]
+        if self.namespace:
+            return '%s\\%s' % (self.namespace, name)
+        return name
+
+
+class ConstantFolder(object):
+    """Evaluates static expressions and folds them into literals.
+
+    Declarations found by collect() are evaluated lazily, on first use, and
+    the result is cached per declaration so that constants referencing other
+    constants are only computed once."""
+
+    def __init__(self, constants=None):
+        self.constants = dict(builtin_constants)
+        if constants:
+            self.constants.update(constants)
+        self.declarations = {}
+        self.class_declarations = {}
+        self.parents = {}
+        self.cache = {}
+        self.pending = set()
+
+    # Declarations
+
+    def collect(self, nodes):
+        stack = list(reversed(top_level_scopes(nodes)))
+        while stack:
+            node, scope = stack.pop()
+            if isinstance(node, ast.Namespace):
+                scope = Scope(node.name)
+                stack.extend((n, scope) for n in reversed(node.nodes))
+            elif isinstance(node, ast.ConstantDeclarations):
+                for decl in node.nodes:
+                    key = scope.qualify(decl.name)
+                    self.declarations[key] = (decl, scope)
+            elif isinstance(node, ast.FunctionCall) and \
+                 isinstance(node.name, string_type) and \
+                 node.name.lower().lstrip('\\') == 'define' and \
+                 len(node.params) >= 2 and \
+                 isinstance(node.params[0].node, string_type):
+                # define() always declares in the global namespace
+                decl = ast.ConstantDeclaration(node.params[0].node,
+                                               node.params[1].node,
+                                               lineno=node.lineno)
+                self.declarations[decl.name.lstrip('\\')] = (decl, scope)
+            elif isinstance(node, (ast.Class, ast.Interface)):
+                name = scope.qualify(node.name).lower()
+                class_scope = Scope(scope.namespace, name)
+                if isinstance(node, ast.Class):
+                    parents = [node.extends] if node.extends else []
+                    parents += node.implements
+                else:
+                    parents = node.extends or []
+                self.parents[name] = [self._class_name(p, class_scope)
+                                      for p in parents]
+                for stmt in node.nodes:
+                    if isinstance(stmt, ast.ClassConstants):
+                        for decl in stmt.nodes:
+                            self.class_declarations[(name, decl.name)] = \
+                                (decl, class_scope)
+            elif isinstance(node, ast.Block):
+                stack.extend((n, scope) for n in reversed(node.nodes))
+
+    def _class_name(self, name, scope):
+        lowered = name.lower()
+        if lowered in ('self', 'static'):
+            if scope.class_ is None:
+                raise NotConstant('%s:: used outside of a class' % name)
+            return scope.class_
+        if lowered == 'parent':
+            parents = self.parents.get(scope.class_)
+            if not parents:
+                raise NotConstant('parent:: used without a parent class')
+            return parents[0]
+        return scope.qualify(name).lower()
+
+    # Lookups
+
+    def constant(self, name, scope=None):
+        """Return the value of the global constant `name`."""
+        scope = scope or Scope()
+        lowered = name.lstrip('\\').lower()
+        if lowered in special_constants:
+            return special_constants[lowered]
+        candidates = [scope.qualify(name)]
+        if not name.startswith('\\') and '\\' not in name:
+            # unqualified constants fall back to the global namespace
+            candidates.append(name)
+        for candidate in candidates:
+            key = ('', candidate)
+            if key in self.cache:
+                return self.cache[key]
+            if candidate in self.declarations:
+                decl, decl_scope = self.declarations[candidate]
+                return self._evaluate_declaration(key, decl, decl_scope)
+            if candidate in self.constants:
+                return self.constants[candidate]
+        raise NotConstant('unknown constant %s' % name)
+
+    def class_constant(self, class_name, name, scope=None):
+        """Return the value of `class_name::name`, following inheritance."""
+        scope = scope or Scope()
+        seen = set()
+        todo = [self._class_name(class_name, scope)]
+        while todo:
+            current = todo.pop(0)
+            if current in seen:
+                continue
+            seen.add(current)
+            key = (current, name)
+            if key in self.cache:
+                return self.cache[key]
+            if key in self.class_declarations:
+                decl, decl_scope = self.class_declarations[key]
+                return self._evaluate_declaration(key, decl, decl_scope)
+            todo.extend(self.parents.get(current, []))
+        raise NotConstant('unknown class constant %s::%s' % (class_name, name))
+
+    def _evaluate_declaration(self, key, decl, scope):
+        if key in self.pending:
+            raise NotConstant('cyclic constant declaration %s' % decl.name)
+        self.pending.add(key)
+        try:
+            value = self.evaluate(decl.initial, scope)
+        finally:
+            self.pending.discard(key)
+        self.cache[key] = value
+        return value
+
+    # Expressions
+
+    def evaluate(self, node, scope=None):
+        """Return the Python value of a constant expression.
+
+        Strings, integers, floats, booleans and None stand for themselves,
+        PHP arrays are returned as OrderedDicts. NotConstant is raised if the
+        value depends on anything not known at compile time."""
+        scope = scope or Scope()
+        if not isinstance(node, ast.Node):
+            if node is None or isinstance(node, (string_type, float)) or \
+               is_int(node):
+                return node
+            raise NotConstant('unexpected value %r' % (node,))
+        if isinstance(node, ast.BinaryOp):
+            left = self.evaluate(node.left, scope)
+            # && and || short-circuit just like at runtime
+            if node.op in ('&&', 'and') and not to_bool(left):
+                return False
+            if node.op in ('||', 'or') and to_bool(left):
+                return True
+            return binary_op(node.op, left, self.evaluate(node.right, scope))
+        if isinstance(node, ast.UnaryOp):
+            return unary_op(node.op, self.evaluate(node.expr, scope))
+        if isinstance(node, ast.TernaryOp):
+            condition = self.evaluate(node.expr, scope)
+            if to_bool(condition):
+                if node.iftrue is node.expr:
+                    return condition
+                return self.evaluate(node.iftrue, scope)
+            return self.evaluate(node.iffalse, scope)
+        if isinstance(node, ast.Cast):
+            return cast(node.type, self.evaluate(node.expr, scope))
+        if isinstance(node, ast.Constant):
+            return self.constant(node.name, scope)
+        if isinstance(node, ast.StaticProperty):
+            if not isinstance(node.node, string_type) or \
+               not isinstance(node.name, string_type):
+                raise NotConstant('dynamic class constant')
+            return self.class_constant(node.node, node.name, scope)
+        if isinstance(node, ast.MagicConstant):
+            if node.value is None:
+                raise NotConstant('unresolved %s' % node.name)
+            return node.value
+        if isinstance(node, ast.Array):
+            result = OrderedDict()
+            next_index = 0
+            for element in node.nodes:
+                if element.is_ref:
+                    raise NotConstant('reference in constant array')
+                value = self.evaluate(element.value, scope)
+                if element.key is None:
+                    key = next_index
+                else:
+                    key = normalize_key(self.evaluate(element.key, scope))
+                if is_int(key) and key >= next_index:
+                    next_index = key + 1
+                result[key] = value
+            return result
+        raise NotConstant('%s is not a constant expression'
+                          % node.__class__.__name__)
+
+    def fold(self, node, scope=None):
+        """Return `node` with every constant sub-expression replaced by its
+        literal value. Nodes are modified in place."""
+        scope = scope or Scope()
+        folded = self._fold_expr(node, scope)
+        if folded is not _unchanged:
+            return folded
+        if not isinstance(node, ast.Node):
+            return node
+        stack = [(node, scope)]
+        while stack:
+            current, scope = stack.pop()
+            if isinstance(current, ast.Namespace):
+                scope = Scope(current.name)
+            elif isinstance(current, (ast.Class, ast.Interface, ast.Trait)):
+                scope = Scope(scope.namespace, scope.qualify(current.name).lower())
+            elif isinstance(current, ast.TraitUse):
+                # trait modifiers reference methods, not constants
+                continue
+            elif isinstance(current, (ast.ClassConstant,
+                                      ast.ConstantDeclaration)):
+                self._fold_declaration(current, scope)
+            for field in current.fields:
+                value = getattr(current, field)
+                if isinstance(value, list):
+                    for i, item in enumerate(value):
+                        folded = self._fold_expr(item, scope)
+                        if folded is not _unchanged:
+                            value[i] = folded
+                        elif isinstance(item, ast.Node):
+                            stack.append((item, scope))
+                else:
+                    folded = self._fold_expr(value, scope)
+                    if folded is not _unchanged:
+                        setattr(current, field, folded)
+                    elif isinstance(value, ast.Node):
+                        stack.append((value, scope))
+        return node
+
+    def _fold_declaration(self, decl, scope):
+        # go through the per-declaration cache rather than evaluating the
+        # initializer again
+        if is_literal(decl.initial):
+            return
+        try:
+            if isinstance(decl, ast.ClassConstant):
+                if scope.class_ is None:
+                    return
+                value = self.class_constant(scope.class_, decl.name)
+            else:
+                value = self.constant('\\' + scope.qualify(decl.name))
+            decl.initial = value_to_node(value, getattr(decl.initial, 'lineno',
+                                                        decl.lineno))
+        except (NotConstant, RuntimeError):
+            pass
+
+    def _fold_expr(self, node, scope):
+        if not isinstance(node, foldable) or is_literal(node):
+            return _unchanged
+        try:
+            return value_to_node(self.evaluate(node, scope), node.lineno)
+        except (NotConstant, RuntimeError):
+            # RuntimeError covers exceeding the recursion limit on very deep
+            # expressions, which are simply left unfolded
+            return _unchanged
+
+_unchanged = object()
+
+foldable = (ast.BinaryOp, ast.UnaryOp, ast.TernaryOp, ast.Cast, ast.Constant,
+            ast.StaticProperty, ast.MagicConstant, ast.Array)
+
+def top_level_scopes(nodes):
+    """Pair top-level nodes with the scope they are declared in, taking
+    statement-style `namespace Foo;` declarations into account."""
+    result = []
+    scope = Scope()
+    for node in nodes:
+        if isinstance(node, ast.Namespace) and not node.nodes:
+            scope = Scope(node.name)
+        result.append((node, scope))
+    return result
+
+def fold_constants(nodes, constants=None):
+    """Fold constant expressions in a list of top-level nodes in place.
+
+    Returns the folder, whose cache holds the value of every class constant
+    and constant declaration that was needed during folding."""
+    folder = ConstantFolder(constants)
+    folder.collect(nodes)
+    for i, (node, scope) in enumerate(top_level_scopes(nodes)):
+        nodes[i] = folder.fold(node, scope)
+    return folder
@@ -0,0 +1,591 @@
+# ----------------------------------------------------------------------
+# dataflow.py
+#
+# Worklist dataflow analyses over control-flow graphs: reaching
+# definitions, live variables and taint.
+# ----------------------------------------------------------------------
+
+import collections
+import heapq
+import sys
+
+from . import phpast as ast
+from .cfg import ENTRY, EXIT
+
+if sys.version_info[0] == 3:
+    string_type = str
+else:
+    string_type = basestring
+
+superglobals = ('$_GET', '$_POST', '$_REQUEST', '$_COOKIE', '$_FILES',
+                '$_SERVER', '$_ENV')
+source_functions = ('file_get_contents', 'fgets', 'fread', 'getenv',
+                    'filter_input', 'apache_request_headers')
+sanitizers = ('htmlspecialchars', 'htmlentities', 'strip_tags', 'intval',
+              'floatval', 'boolval', 'addslashes', 'escapeshellarg',
+              'escapeshellcmd', 'mysql_real_escape_string',
+              'mysqli_real_escape_string', 'urlencode', 'rawurlencode',
+              'json_encode', 'md5', 'sha1', 'crc32', 'count', 'strlen')
+sinks = ('echo', 'print', 'exit', 'eval', 'include', 'require', 'system',
+         'exec', 'passthru', 'shell_exec', 'popen', 'proc_open',
+         'mysql_query', 'mysqli_query', 'pg_query', 'sqlite_query',
+         'header', 'unserialize', 'assert', 'preg_replace')
+
+# operators whose result carries no data from their operands
+_clean_ops = ('==', '!=', '===', '!==', '<>', '<', '<=', '>', '>=', '<=>',
+              '&&', '||', 'and', 'or', 'xor', 'instanceof', '!',
+              '+', '-', '*', '/', '%', '**', '<<', '>>', '&', '|', '^', '~')
+_clean_casts = ('int', 'integer', 'double', 'float', 'real', 'bool',
+                'boolean', 'unset')
+
+
+class Variables(object):
+    """Numbers variable names so that sets of them fit in an integer."""
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def bit(self, name):
+        try:
+            return 1 << self.ids[name]
+        except KeyError:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+            return 1 << self.ids[name]
+
+    def decode(self, mask):
+        result = []
+        i = 0
+        while mask:
+            if mask & 1:
+                result.append(self.names[i])
+            mask >>= 1
+            i += 1
+        return result
+
+
+class TaintConfig(object):
+    """Where tainted data comes from, what cleans it and where it must not
+    end up. Function names are matched lowercased and without namespace;
+    sinks may also name the language constructs echo, print, exit, eval,
+    include and require."""
+
+    def __init__(self, sources=superglobals, functions=source_functions,
+                 sanitizers=sanitizers, sinks=sinks, tainted_params=False):
+        self.sources = frozenset(sources)
+        self.functions = frozenset(functions)
+        self.sanitizers = frozenset(sanitizers)
+        self.sinks = frozenset(sinks)
+        self.tainted_params = tainted_params
+
+default_config = TaintConfig()
+
+# Events recorded for a block, in evaluation order:
+#   (DEF, bit, flow, source, strong, node) - variable bit is assigned a value
+#       made of the variables in flow, plus tainted input if source is set;
+#       weak assignments (to an array element or property) add to the old
+#       value instead of replacing it
+#   (SINK, name, flow, source, node) - a value reaches a sink
+DEF = 0
+SINK = 1
+
+_empty = (0, 0, False)
+
+
+class _Summarizer(object):
+    # Walks the statements of a block without recursion. Every expression
+    # evaluates to (uses, flow, source): the variables it reads, the
+    # variables its value is derived from and whether it contains input.
+
+    def __init__(self, variables, config):
+        self.variables = variables
+        self.config = config
+        self.events = None
+
+    def statement(self, node, events):
+        self.events = events
+        tasks = [(self.visit, node)]
+        values = []
+        while tasks:
+            action, arg = tasks.pop()
+            action(arg, tasks, values)
+        return values.pop()[0]
+
+    def combine(self, count, tasks, values):
+        uses = flow = 0
+        source = False
+        for value in values[len(values) - count:]:
+            uses |= value[0]
+            flow |= value[1]
+            source = source or value[2]
+        del values[len(values) - count:]
+        values.append((uses, flow, source))
+
+    def children(self, node, tasks, values, after=None):
+        if isinstance(node, ast.Node):
+            parts = [getattr(node, field) for field in node.fields]
+        else:
+            parts = node
+        tasks.append(after or (self.combine, len(parts)))
+        for part in reversed(parts):
+            tasks.append((self.visit, part))
+
+    def target(self, node):
+        """Return (bit, strong, subexpressions) for an assignment target."""
+        strong = True
+        parts = []
+        while isinstance(node, (ast.ArrayOffset, ast.StringOffset,
+                                ast.ObjectProperty)):
+            strong = False
+            parts.append(getattr(node, 'expr', None) or
+                         getattr(node, 'name', None))
+            node = node.node
+        if isinstance(node, ast.Variable) and \
+           isinstance(node.name, string_type):
+            return self.variables.bit(node.name), strong, parts
+        parts.append(node)
+        return None, strong, parts
+
+    def assign(self, targets, reads, node, value):
+        # records a DEF of value for each target and returns the value of the
+        # assignment expression
+        uses, flow, source = value
+        for bit, strong in targets:
+            if bit is None:
+                continue
+            if reads or not strong:
+                uses |= bit
+            if reads:
+                flow |= bit
+        for bit, strong in targets:
+            if bit is not None:
+                self.events.append((DEF, bit, flow, source, strong, node))
+        return uses, flow, source
+
+    def visit(self, node, tasks, values):
+        if isinstance(node, list):
+            self.children(node, tasks, values)
+            return
+        if not isinstance(node, ast.Node):
+            values.append(_empty)
+            return
+        method = getattr(self, 'visit_' + node.__class__.__name__, None)
+        if method is None:
+            self.children(node, tasks, values)
+        else:
+            method(node, tasks, values)
+
+    def visit_Variable(self, node, tasks, values):
+        if isinstance(node.name, string_type):
+            bit = self.variables.bit(node.name)
+            values.append((bit, bit, node.name in self.config.sources))
+        else:
+            self.children(node, tasks, values)
+
+    def _assignment(self, node, target, exprs, reads, tasks):
+        bit, strong, parts = self.target(target)
+        parts = list(exprs) + parts
+        def after(count, tasks, values):
+            self.combine(count, tasks, values)
+            values.append(self.assign([(bit, strong)], reads, node,
+                                      values.pop()))
+        tasks.append((after, len(parts)))
+        for part in reversed(parts):
+            tasks.append((self.visit, part))
+
+    def visit_Assignment(self, node, tasks, values):
+        self._assignment(node, node.node, [node.expr], False, tasks)
+
+    def visit_AssignOp(self, node, tasks, values):
+        self._assignment(node, node.left, [node.right], True, tasks)
+
+    def visit_PreIncDecOp(self, node, tasks, values):
+        self._assignment(node, node.expr, [], True, tasks)
+
+    visit_PostIncDecOp = visit_PreIncDecOp
+
+    def _list_targets(self, nodes):
+        targets = []
+        parts = []
+        stack = list(reversed(nodes))
+        while stack:
+            item = stack.pop()
+            if isinstance(item, list):
+                stack.extend(reversed(item))
+            elif item is not None:
+                bit, strong, subexpressions = self.target(item)
+                targets.append((bit, strong))
+                parts.extend(subexpressions)
+        return targets, parts
+
+    def visit_ListAssignment(self, node, tasks, values):
+        targets, parts = self._list_targets(node.nodes)
+        parts = [node.expr] + parts
+        def after(count, tasks, values):
+            self.combine(count, tasks, values)
+            values.append(self.assign(targets, False, node, values.pop()))
+        tasks.append((after, len(parts)))
+        for part in reversed(parts):
+            tasks.append((self.visit, part))
+
+    def visit_Foreach(self, node, tasks, values):
+        # the array was evaluated before the loop; here its elements flow
+        # into the key and value variables
+        items = [node.keyvar, node.valvar]
+        items = [getattr(item, 'name', item) if isinstance(
+            item, ast.ForeachVariable) else item for item in items]
+        targets, parts = self._list_targets(items)
+        def after(count, tasks, values):
+            uses, flow, source = values.pop()
+            self.combine(count - 1, tasks, values)
+            extra = values.pop()
+            values.append(self.assign(targets, False, node,
+                                      (extra[0], flow | extra[1],
+                                       source or extra[2])))
+        tasks.append((after, len(parts) + 1))
+        tasks.append((self.visit, node.expr))
+        for part in reversed(parts):
+            tasks.append((self.visit, part))
+
+    def _define(self, nodes, node, source=False):
+        for item in nodes:
+            bit, strong, parts = self.target(item)
+            if bit is not None:
+                self.events.append((DEF, bit, 0, source, strong, node))
+
+    def visit_Unset(self, node, tasks, values):
+        self._define([n for n in node.nodes if isinstance(n, ast.Variable)],
+                     node)
+        self.children([n for n in node.nodes
+                       if not isinstance(n, ast.Variable)], tasks, values)
+
+    def visit_Global(self, node, tasks, values):
+        self._define(node.nodes, node)
+        values.append(_empty)
+
+    def visit_Catch(self, node, tasks, values):
+        self._define([node.var], node)
+        values.append(_empty)
+
+    def visit_StaticVariable(self, node, tasks, values):
+        self._assignment(node, ast.Variable(node.name), [node.initial], False,
+                         tasks)
+
+    def visit_Closure(self, node, tasks, values):
+        uses = 0
+        for var in node.vars:
+            bit = self.variables.bit(var.name)
+            uses |= bit
+            if var.is_ref:
+                # the closure may write to it at any time
+                self.events.append((DEF, bit, 0, False, False, node))
+        values.append((uses, uses, False))
+
+    def _skip(self, node, tasks, values):
+        values.append(_empty)
+
+    visit_Function = visit_Class = visit_Interface = visit_Trait = _skip
+
+    def _clean(self, node, tasks, values):
+        def after(count, tasks, values):
+            self.combine(count, tasks, values)
+            values.append((values.pop()[0], 0, False))
+        self.children(node, tasks, values, (after, len(node.fields)))
+
+    visit_IsSet = visit_Empty = _clean
+
+    def visit_Cast(self, node, tasks, values):
+        if node.type.lower() in _clean_casts:
+            self._clean(node, tasks, values)
+        else:
+            self.children(node, tasks, values)
+
+    def visit_BinaryOp(self, node, tasks, values):
+        if node.op.lower() in _clean_ops:
+            self._clean(node, tasks, values)
+        else:
+            self.children(node, tasks, values)
+
+    def visit_UnaryOp(self, node, tasks, values):
+        if node.op in _clean_ops:
+            self._clean(node, tasks, values)
+        else:
+            self.children(node, tasks, values)
+
+    def _call(self, node, name, tasks, values):
+        config = self.config
+        def after(count, tasks, values):
+            self.combine(count, tasks, values)
+            uses, flow, source = values.pop()
+            if name in config.sinks:
+                self.events.append((SINK, name, flow, source, node))
+            if name in config.sanitizers:
+                flow, source = 0, False
+            elif name in config.functions:
+                source = True
+            values.append((uses, flow, source))
+        self.children(node, tasks, values, (after, len(node.fields)))
+
+    def visit_FunctionCall(self, node, tasks, values):
+        name = None
+        if isinstance(node.name, string_type):
+            name = node.name.rsplit('\\', 1)[-1].lower()
+        self._call(node, name, tasks, values)
+
+    def _construct(self, node, tasks, values):
+        self._call(node, node.__class__.__name__.lower(), tasks, values)
+
+    visit_Echo = visit_Print = visit_Exit = visit_Eval = _construct
+    visit_Include = visit_Require = _construct
+
+
+class FunctionFacts(object):
+    """Per-block summaries of a CFG that the analyses below share.
+
+    uses[b] holds the variables read in block b before being assigned there,
+    kills[b] the variables unconditionally assigned in it, and events[b] the
+    assignments and sink hits in evaluation order. Parameters and closure
+    variables are assigned in the entry block."""
+
+    def __init__(self, cfg, config=None):
+        self.cfg = cfg
+        self.config = config or default_config
+        self.variables = Variables()
+        summarizer = _Summarizer(self.variables, self.config)
+        count = len(cfg.blocks)
+        self.events = [[] for _ in range(count)]
+        self.uses = [0] * count
+        self.kills = [0] * count
+
+        function = cfg.function
+        entry = self.events[ENTRY]
+        for param in getattr(function, 'params', ()):
+            entry.append((DEF, self.variables.bit(param.name), 0,
+                          self.config.tainted_params, True, param))
+        for var in getattr(function, 'vars', ()):
+            entry.append((DEF, self.variables.bit(var.name), 0, False, True,
+                          var))
+        self.kills[ENTRY] = self._kills(entry)
+
+        for b in range(count):
+            if b == ENTRY:
+                continue
+            events = self.events[b]
+            uses = kills = 0
+            for node in cfg.blocks[b]:
+                start = len(events)
+                uses |= summarizer.statement(node, events) & ~kills
+                kills |= self._kills(events[start:])
+            self.uses[b] = uses
+            self.kills[b] = kills
+
+    def _kills(self, events):
+        mask = 0
+        for event in events:
+            if event[0] == DEF and event[4]:
+                mask |= event[1]
+        return mask
+
+
+class Problem(object):
+    """A dataflow problem for solve(): values are typically integer bitsets,
+    combined with meet() where paths join and pushed through blocks with
+    transfer(). As it is, every value is 0 and blocks change nothing;
+    subclasses override the methods they need."""
+
+    forward = True
+
+    def boundary(self):
+        # the value at the entry (or exit, for backward problems)
+        return 0
+
+    def initial(self):
+        return 0
+
+    def meet(self, a, b):
+        return a | b
+
+    def transfer(self, block, value):
+        return value
+
+
+class GenKillProblem(Problem):
+
+    def __init__(self, gen, kill, forward=True):
+        self.gen = gen
+        self.kill = kill
+        self.forward = forward
+
+    def transfer(self, block, value):
+        return self.gen[block] | (value & ~self.kill[block])
+
+
+def solve(cfg, problem):
+    """Iterate problem to a fixpoint over the blocks reachable from the entry.
+
+    Blocks are taken from a worklist in reverse postorder (postorder for
+    backward problems), which settles most problems in two or three passes.
+    Returns (inputs, outputs), the values before and after every block in
+    the direction of the analysis."""
+    order = list(cfg.reverse_postorder())
+    if problem.forward:
+        start, before, after = ENTRY, cfg.predecessors, cfg.successors
+    else:
+        order.reverse()
+        start, before, after = EXIT, cfg.successors, cfg.predecessors
+    count = len(cfg.blocks)
+    position = [-1] * count
+    for i, block in enumerate(order):
+        position[block] = i
+    initial = problem.initial()
+    inputs = [initial] * count
+    outputs = [initial] * count
+    meet = problem.meet
+
+    worklist = list(range(len(order)))
+    queued = bytearray(count)
+    for block in order:
+        queued[block] = 1
+    while worklist:
+        block = order[heapq.heappop(worklist)]
+        queued[block] = 0
+        if block == start:
+            value = problem.boundary()
+        else:
+            value = None
+            for other in before(block):
+                if position[other] >= 0:
+                    value = outputs[other] if value is None else \
+                        meet(value, outputs[other])
+            if value is None:
+                value = initial
+        inputs[block] = value
+        value = problem.transfer(block, value)
+        if value != outputs[block]:
+            outputs[block] = value
+            for other in after(block):
+                if position[other] >= 0 and not queued[other]:
+                    queued[other] = 1
+                    heapq.heappush(worklist, position[other])
+    return inputs, outputs
+
+
+Definition = collections.namedtuple('Definition',
+                                    ['block', 'variable', 'node'])
+
+
+class ReachingDefinitions(object):
+    """Which assignments may reach the start of each block.
+
+    definitions lists every assignment as a Definition, and reaching(block)
+    returns those that reach block."""
+
+    def __init__(self, cfg, facts=None):
+        self.facts = facts or FunctionFacts(cfg)
+        names = self.facts.variables.names
+        self.definitions = []
+        by_variable = collections.defaultdict(int)
+        count = len(cfg.blocks)
+        gen = [0] * count
+        strong = [0] * count
+        for block, events in enumerate(self.facts.events):
+            for event in events:
+                if event[0] != DEF:
+                    continue
+                bit = 1 << len(self.definitions)
+                variable = event[1].bit_length() - 1
+                self.definitions.append(
+                    Definition(block, names[variable], event[5]))
+                if event[4]:
+                    # a later assignment in the same block hides this one
+                    gen[block] &= ~by_variable[variable]
+                    strong[block] |= 1 << variable
+                gen[block] |= bit
+                by_variable[variable] |= bit
+        kill = [0] * count
+        for block in range(count):
+            mask = strong[block]
+            variable = 0
+            while mask:
+                if mask & 1:
+                    kill[block] |= by_variable[variable]
+                mask >>= 1
+                variable += 1
+            kill[block] &= ~gen[block]
+        self.inputs, self.outputs = solve(cfg, GenKillProblem(gen, kill))
+
+    def reaching(self, block, variable=None):
+        mask = self.inputs[block]
+        result = []
+        i = 0
+        while mask:
+            if mask & 1:
+                definition = self.definitions[i]
+                if variable is None or definition.variable == variable:
+                    result.append(definition)
+            mask >>= 1
+            i += 1
+        return result
+
+
+class LiveVariables(object):
+    """Which variables may be read later, at the start and end of each
+    block."""
+
+    def __init__(self, cfg, facts=None):
+        self.facts = facts or FunctionFacts(cfg)
+        problem = GenKillProblem(self.facts.uses, self.facts.kills,
+                                 forward=False)
+        self.live_out, self.live_in = solve(cfg, problem)
+
+    def live_at_entry(self, block):
+        return self.facts.variables.decode(self.live_in[block])
+
+    def live_at_exit(self, block):
+        return self.facts.variables.decode(self.live_out[block])
+
+
+Finding = collections.namedtuple('Finding', ['sink', 'node', 'lineno',
+                                             'variables'])
+
+class TaintProblem(Problem):
+    # values are bitsets of the variables that may hold tainted data
+
+    def __init__(self, facts):
+        self.facts = facts
+        self.findings = None
+
+    def transfer(self, block, value):
+        findings = self.findings
+        for event in self.facts.events[block]:
+            if event[0] == DEF:
+                kind, bit, flow, source, strong, node = event
+                if source or value & flow:
+                    value |= bit
+                elif strong:
+                    value &= ~bit
+            elif findings is not None and (event[3] or value & event[2]):
+                findings.append((event, value))
+        return value
+
+
+def taint(cfg, config=None, facts=None):
+    """Find the places where input from a source reaches a sink without
+    passing a sanitizer. Returns a list of Findings, where variables names
+    the tainted variables flowing into the sink."""
+    facts = facts or FunctionFacts(cfg, config)
+    problem = TaintProblem(facts)
+    inputs, outputs = solve(cfg, problem)
+    problem.findings = found = []
+    for block in cfg.reverse_postorder():
+        problem.transfer(block, inputs[block])
+    result = []
+    for event, value in found:
+        kind, name, flow, source, node = event
+        variables = facts.variables.decode(value & flow)
+        result.append(Finding(name, node, node.lineno, variables))
+    return result
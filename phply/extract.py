@@ -0,0 +1,130 @@
+# ----------------------------------------------------------------------
+# extract.py
+#
+# Fast extraction of strings, comments and identifiers with the lexer
+# alone, for jobs that don't need a syntax tree.
+# ----------------------------------------------------------------------
+
+import collections
+import functools
+import re
+import sys
+
+from . import phplex
+from . import project
+
+if sys.version_info[0] == 3:
+    unichr = chr
+
+default_types = ('CONSTANT_ENCAPSED_STRING', 'ENCAPSED_AND_WHITESPACE',
+                 'COMMENT', 'DOC_COMMENT', 'STRING')
+
+# value is the decoded text for string literals and the token text as
+# written otherwise; raw is always the text as written
+Extracted = collections.namedtuple('Extracted', ['type', 'value', 'raw',
+                                                 'lineno', 'lexpos'])
+
+_simple_escapes = {
+    'n': '\n', 't': '\t', 'r': '\r', 'v': '\v', 'e': '\x1b', 'f': '\f',
+    '\\': '\\', '$': '$',
+}
+_double_re = re.compile(r'''\\(?:
+    (?P<octal>[0-7]{1,3})
+  | x(?P<hex>[0-9A-Fa-f]{1,2})
+  | u\{(?P<unicode>[0-9A-Fa-f]+)\}
+  | (?P<char>.)
+  )''', re.VERBOSE | re.DOTALL)
+_single_re = re.compile(r"\\([\\'])")
+
+
+def decode_single_quoted(text):
+    """Decode the body of a single-quoted string, where only \\\\ and \\'
+    are escapes."""
+    return _single_re.sub(r'\1', text)
+
+def decode_double_quoted(text, quote='"'):
+    """Decode escape sequences the way PHP does in double-quoted strings
+    and, with quote=None, in heredocs. Unknown escapes are kept as written.
+    Octal and hexadecimal escapes give the character with that code, like
+    the parser does."""
+    def replace(m):
+        if m.group('octal') is not None:
+            return unichr(int(m.group('octal'), 8) & 0xFF)
+        if m.group('hex') is not None:
+            return unichr(int(m.group('hex'), 16))
+        if m.group('unicode') is not None:
+            return unichr(int(m.group('unicode'), 16))
+        char = m.group('char')
+        if char in _simple_escapes:
+            return _simple_escapes[char]
+        if char == quote:
+            return char
+        return m.group(0)
+    if '\\' not in text:
+        return text
+    return _double_re.sub(replace, text)
+
+def _decode(token, state):
+    if token.type == 'CONSTANT_ENCAPSED_STRING':
+        return decode_single_quoted(token.value[1:-1])
+    if token.type == 'ENCAPSED_AND_WHITESPACE':
+        if state == 'nowdoc':
+            return token.value
+        if state in ('heredoc', 'heredocvar'):
+            return decode_double_quoted(token.value, None)
+        if state in ('backticked', 'backtickedvar'):
+            return decode_double_quoted(token.value, '`')
+        return decode_double_quoted(token.value)
+    return token.value
+
+def extract(source, types=default_types, decode=True):
+    """Yield an Extracted tuple for every token of the given types in
+    source, as the lexer produces them. Raises SyntaxError when the lexer
+    does, after yielding the tokens before the error."""
+    types = frozenset(types)
+    lexer = phplex.new_lexer()
+    lexer.input(source)
+    token = lexer.token
+    current_state = lexer.current_state
+    while True:
+        t = token()
+        if t is None:
+            return
+        if t.type in types:
+            # the lexer is still in (or has just left) the state of the
+            # string the token belongs to, which decides how to decode it
+            value = _decode(t, current_state()) if decode else t.value
+            yield Extracted(t.type, value, t.value, t.lineno, t.lexpos)
+
+
+class Extractor(object):
+    """Runs the lexer once per source and hands the tokens of each
+    subscribed type to the callbacks registered for it."""
+
+    def __init__(self, decode=True):
+        self.decode = decode
+        self.callbacks = collections.defaultdict(list)
+
+    def subscribe(self, token_type, callback):
+        """Call callback(extracted, filename) for every token_type token."""
+        self.callbacks[token_type].append(callback)
+
+    def feed(self, source, filename=None):
+        callbacks = self.callbacks
+        for item in extract(source, list(callbacks), self.decode):
+            for callback in callbacks[item.type]:
+                callback(item, filename)
+
+def _extract_file(path, types, decode):
+    try:
+        return path, list(extract(project.read_source(path), types, decode)), \
+            None
+    except SyntaxError as e:
+        return path, None, '%s: %s' % (e.__class__.__name__, e)
+
+def extract_files(paths, types=default_types, decode=True, processes=None):
+    """Extract tokens from every PHP file under paths, yielding
+    (path, list of Extracted, error) as each file is done."""
+    return project.map_files(functools.partial(_extract_file, types=types,
+                                               decode=decode),
+                             project.find_php_files(paths), processes)
@@ -0,0 +1,262 @@
+# ----------------------------------------------------------------------
+# hierarchy.py
+#
+# Class hierarchy index with precomputed transitive closures.
+# ----------------------------------------------------------------------
+
+import sys
+
+from . import phpast as ast
+from .nameresolve import import_sections
+
+if sys.version_info[0] == 3:
+    string_type = str
+else:
+    string_type = basestring
+
+
+def type_key(name):
+    return name.lstrip('\\').lower()
+
+
+class TypeInfo(object):
+    """What the hierarchy knows about one class, interface or trait."""
+
+    __slots__ = ('kind', 'name', 'parent', 'interfaces', 'traits', 'methods',
+                 'trait_rules', 'path', 'lineno')
+
+    def __init__(self, kind, name, path=None, lineno=None):
+        self.kind = kind
+        self.name = name
+        self.parent = None
+        self.interfaces = []
+        self.traits = []
+        # lowercased method name -> (method name, modifiers)
+        self.methods = {}
+        # (trait key or None, method, alias or None, visibility or None)
+        self.trait_rules = []
+        self.path = path
+        self.lineno = lineno
+
+
+class Hierarchy(object):
+    """Index of the classes, interfaces and traits of a project.
+
+    Every type gets an integer id, and the ancestors of each type (parent
+    classes and implemented interfaces, transitively) are stored as a set
+    of ids and the descendants as a sorted list of them, so subtype checks
+    are a set lookup and listing the descendants of a type is linear in the
+    number of results. Memory grows with the number of subtype relations,
+    not with the square of the number of types as bitsets indexed by id
+    would. Types that are referenced but not declared, like builtin
+    interfaces, get ids too.
+
+    Method tables take `use` of traits and `as` aliases/visibility changes
+    into account and are memoized per type."""
+
+    def __init__(self):
+        self.types = {}
+        self.files = {}
+        self._built = False
+
+    # Building
+
+    def add_file(self, nodes, path=None):
+        if path is not None:
+            self.remove_file(path)
+        declared = []
+        for imports, section in import_sections(nodes):
+            stack = list(reversed(section))
+            while stack:
+                node = stack.pop()
+                if not isinstance(node, ast.Node):
+                    continue
+                if isinstance(node, (ast.Class, ast.Interface, ast.Trait)):
+                    declared.append(self._add_type(node, imports, path))
+                for field in reversed(node.fields):
+                    value = getattr(node, field)
+                    if isinstance(value, list):
+                        stack.extend(reversed(value))
+                    elif isinstance(value, ast.Node):
+                        stack.append(value)
+        if path is not None:
+            self.files[path] = declared
+        self._built = False
+
+    def remove_file(self, path):
+        for key in self.files.pop(path, ()):
+            self.types.pop(key, None)
+        self._built = False
+
+    def _add_type(self, node, imports, path):
+        resolve = lambda name: type_key(imports.resolve_class(name))
+        kind = node.__class__.__name__.lower()
+        name = imports.qualify(node.name)
+        info = TypeInfo(kind, name, path, node.lineno)
+        if isinstance(node, ast.Class):
+            info.parent = resolve(node.extends) if node.extends else None
+            info.interfaces = [resolve(n) for n in node.implements]
+        elif isinstance(node, ast.Interface):
+            info.interfaces = [resolve(n) for n in node.extends or ()]
+        for stmt in getattr(node, 'traits', ()):
+            info.traits.append(resolve(stmt.name))
+            for rule in stmt.renames:
+                source = getattr(rule, 'from')
+                if isinstance(source, ast.StaticProperty):
+                    trait, method = resolve(source.node), source.name
+                else:
+                    trait, method = None, source
+                info.trait_rules.append((trait, method.lower(), rule.to,
+                                         rule.visibility))
+        for stmt in node.nodes:
+            if isinstance(stmt, ast.Method):
+                info.methods[stmt.name.lower()] = (stmt.name, stmt.modifiers)
+        key = type_key(name)
+        self.types[key] = info
+        return key
+
+    def _build(self):
+        if self._built:
+            return
+        self.names = sorted(self.types)
+        self.ids = dict((name, i) for i, name in enumerate(self.names))
+        for info in list(self.types.values()):
+            for name in [info.parent] + info.interfaces + info.traits:
+                if name is not None and name not in self.ids:
+                    self.ids[name] = len(self.names)
+                    self.names.append(name)
+
+        count = len(self.names)
+        ancestors = [None] * count
+        for start in range(count):
+            if ancestors[start] is not None:
+                continue
+            # iterative post-order walk so that deep hierarchies don't hit
+            # the recursion limit; a cycle simply stops at the repeated type
+            stack = [(start, False)]
+            active = set()
+            while stack:
+                i, done = stack.pop()
+                if ancestors[i] is not None:
+                    continue
+                supers = self._supertypes(self.names[i])
+                if done:
+                    found = set(supers)
+                    for s in supers:
+                        found.update(ancestors[s] or ())
+                    ancestors[i] = frozenset(found)
+                    active.discard(i)
+                    continue
+                active.add(i)
+                stack.append((i, True))
+                for s in supers:
+                    if ancestors[s] is None and s not in active:
+                        stack.append((s, False))
+
+        # filled in id order, so already sorted
+        descendants = [[] for i in range(count)]
+        for i, found in enumerate(ancestors):
+            for j in found:
+                descendants[j].append(i)
+        self.ancestor_sets = ancestors
+        self.descendant_lists = descendants
+        self._method_tables = {}
+        self._built = True
+
+    def _supertypes(self, key):
+        info = self.types.get(key)
+        if info is None:
+            return []
+        supers = info.interfaces
+        if info.parent is not None:
+            supers = [info.parent] + supers
+        return [self.ids[s] for s in supers]
+
+    # Queries
+
+    def id(self, name):
+        self._build()
+        return self.ids[type_key(name)]
+
+    def is_subtype(self, name, other):
+        """Whether an instance of name is an instance of other, i.e. name is
+        other, extends it or implements it."""
+        self._build()
+        a, b = self.ids.get(type_key(name)), self.ids.get(type_key(other))
+        if a is None or b is None:
+            return False
+        return a == b or b in self.ancestor_sets[a]
+
+    def ancestors(self, name):
+        i = self.id(name)
+        return [self.names[j] for j in sorted(self.ancestor_sets[i])]
+
+    def descendants(self, name):
+        i = self.id(name)
+        return [self.names[j] for j in self.descendant_lists[i]]
+
+    def subclasses(self, name):
+        """All concrete and abstract classes extending or implementing name."""
+        return [key for key in self.descendants(name)
+                if self.types[key].kind == 'class']
+
+    def method_table(self, name):
+        """Return a dict mapping lowercased method names to
+        (declaring type key, method name, modifiers) for every method
+        callable on the type, inherited ones included."""
+        self._build()
+        return self._method_table(type_key(name), set())
+
+    def _method_table(self, key, active):
+        try:
+            return self._method_tables[key]
+        except KeyError:
+            pass
+        info = self.types.get(key)
+        if info is None or key in active:
+            return {}
+        active.add(key)
+        table = {}
+        if info.parent is not None:
+            table.update(self._method_table(info.parent, active))
+        # trait methods override inherited ones, own methods override both
+        for trait in info.traits:
+            for lname, entry in self._method_table(trait, active).items():
+                table[lname] = entry
+        for trait, method, alias, visibility in info.trait_rules:
+            source = self._method_table(trait, active).get(method) \
+                if trait is not None else self._trait_method(info, method, active)
+            if source is None:
+                continue
+            declaring, name, modifiers = source
+            if visibility is not None:
+                modifiers = [visibility] + [m for m in modifiers if m not in
+                                            ('public', 'protected', 'private')]
+            if alias is not None:
+                table[alias.lower()] = (declaring, name, modifiers)
+            else:
+                table[method] = (declaring, name, modifiers)
+        for lname, (name, modifiers) in info.methods.items():
+            table[lname] = (key, name, modifiers)
+        # interface methods only show up where nothing implements them
+        for interface in info.interfaces:
+            for lname, entry in self._method_table(interface, active).items():
+                table.setdefault(lname, entry)
+        active.discard(key)
+        self._method_tables[key] = table
+        return table
+
+    def _trait_method(self, info, method, active):
+        for trait in info.traits:
+            entry = self._method_table(trait, active).get(method)
+            if entry is not None:
+                return entry
+        return None
+
+    def resolve_method(self, name, method):
+        """Return (declaring type key, method name) of the method that a
+        call to name::method ends up in, or None."""
+        entry = self.method_table(name).get(method.lower())
+        if entry is None:
+            return None
+        return entry[0], entry[1]
@@ -0,0 +1,289 @@
+# ----------------------------------------------------------------------
+# includegraph.py
+#
+# Project-wide include/require dependency graph.
+# ----------------------------------------------------------------------
+
+import collections
+import functools
+import json
+import os
+import sys
+
+from . import phpast as ast
+from . import project
+from .constfold import ConstantFolder, NotConstant, to_int, to_string
+
+if sys.version_info[0] == 3:
+    string_type = str
+else:
+    string_type = basestring
+
+Include = collections.namedtuple('Include', ['lineno', 'kind', 'once',
+                                             'path', 'target'])
+
+cache_version = 1
+
+
+class IncludePathFolder(ConstantFolder):
+    """Constant folder that also understands the path functions commonly
+    used to build include paths, such as dirname(__FILE__)."""
+
+    def evaluate(self, node, scope=None):
+        if isinstance(node, ast.FunctionCall) and \
+           isinstance(node.name, string_type):
+            name = node.name.lstrip('\\').lower()
+            args = [self.evaluate(param.node, scope) for param in node.params]
+            if name == 'dirname' and args:
+                path = to_string(args[0])
+                for _ in range(to_int(args[1]) if len(args) > 1 else 1):
+                    path = os.path.dirname(path)
+                return path
+            if name == 'basename' and len(args) == 1:
+                return os.path.basename(to_string(args[0]))
+            if name == 'realpath' and len(args) == 1:
+                return os.path.normpath(to_string(args[0]))
+            raise NotConstant('call to %s()' % node.name)
+        return ConstantFolder.evaluate(self, node, scope)
+
+def find_includes(nodes, constants=None):
+    """Return an Include for every include/require in the tree.
+
+    `path` is the evaluated path expression, or None when it depends on
+    runtime values. __FILE__ and __DIR__ are only known if the lexer was
+    given a filename when parsing."""
+    ast.resolve_magic_constants(nodes)
+    folder = IncludePathFolder(constants)
+    folder.collect(nodes)
+    result = []
+    stack = list(reversed(nodes))
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, ast.Node):
+            continue
+        if isinstance(node, (ast.Include, ast.Require)):
+            try:
+                path = to_string(folder.evaluate(node.expr))
+            except (NotConstant, RuntimeError):
+                path = None
+            result.append(Include(node.lineno, node.__class__.__name__.lower(),
+                                  node.once, path, None))
+        for field in reversed(node.fields):
+            value = getattr(node, field)
+            if isinstance(value, list):
+                stack.extend(reversed(value))
+            else:
+                stack.append(value)
+    return result
+
+def resolve_include(path, including_file, include_path):
+    """Resolve an include path the way PHP does, returning None if no
+    such file exists."""
+    if os.path.isabs(path):
+        candidates = [path]
+    elif path.startswith(('./', '../')):
+        # explicitly relative paths are relative to the working directory,
+        # which for a project is its root, i.e. the first include_path entry
+        candidates = [os.path.join(include_path[0], path)] if include_path else []
+    else:
+        candidates = [os.path.join(entry, path) for entry in include_path]
+        candidates.append(os.path.join(os.path.dirname(including_file), path))
+    for candidate in candidates:
+        candidate = os.path.normpath(candidate)
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+def _scan_file(path, constants):
+    try:
+        nodes = project.parse_file(path)
+        includes = find_includes(nodes, constants)
+    except (SyntaxError, RuntimeError) as e:
+        return path, None, '%s: %s' % (e.__class__.__name__, e)
+    return path, [tuple(include) for include in includes], None
+
+
+class IncludeGraph(object):
+    """Dependency graph between PHP files.
+
+    Files are numbered and edges are stored as sorted lists of file numbers
+    per file, with the reverse adjacency computed on demand. Per-file scan
+    results can be cached on disk so that rebuilding only parses the files
+    that changed."""
+
+    def __init__(self, include_path=None, constants=None):
+        self.include_path = [os.path.abspath(p) for p in include_path or []]
+        self.constants = constants
+        self.paths = []
+        self.ids = {}
+        self.edges = []
+        self._reverse = None
+        # per-file scan results: path -> (mtime, size, includes, error)
+        self.files = {}
+
+    def _id(self, path):
+        try:
+            return self.ids[path]
+        except KeyError:
+            self.ids[path] = len(self.paths)
+            self.paths.append(path)
+            self.edges.append([])
+            return self.ids[path]
+
+    # Building
+
+    def build(self, paths, processes=None, cache=None):
+        """Scan every PHP file under paths and rebuild the graph.
+
+        If cache names a file, results for unchanged files are loaded from
+        it and the updated results are written back. Returns the number of
+        files that had to be parsed."""
+        if isinstance(paths, string_type):
+            paths = [paths]
+        if not self.include_path:
+            self.include_path = [os.path.abspath(paths[0])]
+        if cache is not None:
+            self.load_cache(cache)
+
+        current, changed = project.changed_files(paths, self.files)
+        stale = []
+        for path, mtime, size in changed:
+            current[path] = (mtime, size, [], None)
+            stale.append(path)
+
+        scan = functools.partial(_scan_file, constants=self.constants)
+        for path, includes, error in project.map_files(scan, stale, processes):
+            mtime, size = current[path][:2]
+            current[path] = (mtime, size, [Include(*i) for i in includes or ()],
+                             error)
+        self.files = current
+        self._link()
+        if cache is not None:
+            self.save_cache(cache)
+        return len(stale)
+
+    def _link(self):
+        self.paths = []
+        self.ids = {}
+        self.edges = []
+        self._reverse = None
+        for path in sorted(self.files):
+            self._id(path)
+        for path in sorted(self.files):
+            mtime, size, includes, error = self.files[path]
+            # targets are resolved on every build rather than cached, so
+            # that creating a missing file fixes the files including it
+            includes = [i._replace(target=resolve_include(i.path, path,
+                                                          self.include_path)
+                                   if i.path is not None else None)
+                        for i in includes]
+            self.files[path] = (mtime, size, includes, error)
+            source = self.ids[path]
+            targets = set(self._id(i.target) for i in includes
+                          if i.target is not None)
+            self.edges[source] = sorted(targets)
+
+    # Caching
+
+    def load_cache(self, cache):
+        try:
+            with open(cache) as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return
+        if data.get('version') != cache_version:
+            return
+        self.files = dict((path, (mtime, size, [Include(*i) for i in includes],
+                                  error))
+                          for path, mtime, size, includes, error
+                          in data['files'])
+
+    def save_cache(self, cache):
+        data = {
+            'version': cache_version,
+            'files': [(path, mtime, size, [tuple(i) for i in includes], error)
+                      for path, (mtime, size, includes, error)
+                      in sorted(self.files.items())],
+        }
+        tmp = cache + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp, cache)
+
+    # Queries
+
+    def includes(self, path):
+        """Return the Include records of a file, resolved or not."""
+        return self.files[os.path.abspath(path)][2]
+
+    def unresolved(self):
+        """Yield (path, Include) for includes that could not be resolved."""
+        for path in sorted(self.files):
+            for include in self.files[path][2]:
+                if include.target is None:
+                    yield path, include
+
+    def reverse_edges(self):
+        if self._reverse is None:
+            reverse = [[] for _ in self.paths]
+            for source, targets in enumerate(self.edges):
+                for target in targets:
+                    reverse[target].append(source)
+            self._reverse = reverse
+        return self._reverse
+
+    def dependencies(self, path):
+        """Files directly included by path."""
+        return [self.paths[i] for i in self.edges[self.ids[os.path.abspath(path)]]]
+
+    def dependents(self, path):
+        """Files that directly include path."""
+        return [self.paths[i] for i in
+                self.reverse_edges()[self.ids[os.path.abspath(path)]]]
+
+    def _closure(self, path, edges):
+        start = self.ids[os.path.abspath(path)]
+        seen = set([start])
+        todo = [start]
+        while todo:
+            for target in edges[todo.pop()]:
+                if target not in seen:
+                    seen.add(target)
+                    todo.append(target)
+        seen.discard(start)
+        return sorted(self.paths[i] for i in seen)
+
+    def transitive_dependencies(self, path):
+        return self._closure(path, self.edges)
+
+    def transitive_dependents(self, path):
+        return self._closure(path, self.reverse_edges())
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="PHP include dependency graph")
+    ap.add_argument('-c', '--cache', dest='cache', default=None)
+    ap.add_argument('-I', '--include-path', dest='include_path',
+                    action='append', default=[])
+    ap.add_argument('-j', '--jobs', dest='jobs', type=int, default=None)
+    ap.add_argument('-r', '--reverse', dest='reverse', action='store_true',
+                    help='show files depending on FILE instead')
+    ap.add_argument('root', metavar='ROOT')
+    ap.add_argument('file', metavar='FILE', nargs='?')
+    args = ap.parse_args()
+
+    graph = IncludeGraph(args.include_path)
+    graph.build([args.root], args.jobs, args.cache)
+    if args.file is None:
+        for path in graph.paths:
+            for target in graph.dependencies(path):
+                print('%s -> %s' % (path, target))
+        for path, include in graph.unresolved():
+            print('%s:%s: unresolved %s' % (path, include.lineno, include.kind))
+    elif args.reverse:
+        for path in graph.transitive_dependents(args.file):
+            print(path)
+    else:
+        for path in graph.transitive_dependencies(args.file):
+            print(path)
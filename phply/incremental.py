@@ -0,0 +1,363 @@
+# ----------------------------------------------------------------------
+# incremental.py
+#
+# Incremental reparsing for editors and file watchers. After an edit only
+# the top-level statements (or class members) touching it are parsed
+# again; the rest of the tree is reused with its offsets moved.
+# ----------------------------------------------------------------------
+
+import array
+import bisect
+
+from ply import lex
+
+from . import phpast as ast
+from . import phplex
+from .phpparse import make_parser
+
+_parser = None
+
+def _get_parser():
+    # a parser of our own: it records spans and top-level statements
+    global _parser
+    if _parser is None:
+        _parser = make_parser(spans=True)
+        for production in _parser.productions:
+            if production.name == 'top_statement':
+                production.callable = _record(production.callable)
+    return _parser
+
+def _record(action):
+    def record(p):
+        action(p)
+        sym = p.slice[0]
+        if sym.first is not None:
+            p.lexer.statements.append([p[0], sym.first.lexpos,
+                                       sym.last.lexpos + len(sym.last.value)])
+    return record
+
+
+class _Lexer(phplex.FilteredLexer):
+    # Notes the position, type and surrounding lexer states of every token
+    # the parser sees, so that lexing can later restart between any two
+    # statements, and the last token lexed at all, comments included.
+
+    def __init__(self, lexer):
+        phplex.FilteredLexer.__init__(self, lexer)
+        self.statements = []
+        self.positions = array.array('i')
+        self.types = []
+        self.states_before = []
+        self.states_after = []
+        self.state = None
+        self.last = self.last_state = self.last_end = None
+
+    def next_lexer_token(self):
+        self.state = self.lexer.current_state()
+        t = self.lexer.token()
+        if t is not None:
+            self.last, self.last_state = t, self.state
+            self.last_end = self.lexer.lexpos
+        return t
+
+    def token(self):
+        t = phplex.FilteredLexer.token(self)
+        if t is not None:
+            self.positions.append(t.lexpos)
+            self.types.append(t.type)
+            self.states_before.append(self.state)
+            self.states_after.append(self.lexer.current_state())
+        return t
+
+def _token(type, lexpos, lineno):
+    t = lex.LexToken()
+    t.type = type
+    t.value = ''
+    t.lexpos = lexpos
+    t.lineno = lineno
+    return t
+
+def _shift(nodes, offset, lines):
+    # move the nodes of a reused subtree after an edit
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, ast.Node):
+            if node.start_offset is not None:
+                node.start_offset += offset
+                node.end_offset += offset
+            if node.lineno:
+                node.lineno += lines
+            stack.extend(getattr(node, field) for field in node.fields)
+
+
+class IncrementalParser(object):
+    """The parse of one file, kept up to date as it is edited.
+
+    nodes is the list of top-level statements, with start_offset and
+    end_offset set on every node. edit() replaces part of the source and
+    reparses as little as it can: lexing restarts at the statement
+    boundary before the edit, in the lexer state recorded there, and stops
+    at the first boundary after it, where the lexer must be back in the
+    state it had before. If it is not, the region grows to take in the
+    neighbouring statements, up to the whole file. Unchanged statements
+    are reused, so the tree is updated in place. reparsed is the number of
+    characters the last edit parsed again."""
+
+    def __init__(self, source, filename=None):
+        self.filename = filename
+        self.parser = _get_parser()
+        self.source = None
+        self.statements = None
+        self._full_parse(source)
+
+    @property
+    def nodes(self):
+        return [statement[0] for statement in self.statements]
+
+    def _full_parse(self, source):
+        self.source = source
+        self.statements = None
+        lexer = self._parse(source, 0, len(source), 'INITIAL', None, [])
+        self.statements = lexer.statements
+        self.positions = lexer.positions
+        self.types = lexer.types
+        self.states_before = lexer.states_before
+        self.states_after = lexer.states_after
+        self.reparsed = len(source)
+
+    def _parse(self, source, start, end, state, last_type, prefix):
+        # Parse source[start:end] with the lexer in the given state, after
+        # a token of type last_type. prefix is a list of tokens to hand the
+        # parser first, and a closing brace is added after them.
+        lexer = _Lexer(phplex.new_lexer())
+        lexer.filename = self.filename
+        lexer.input(source[:end])
+        lexer.lexpos = start
+        lexer.lineno = source.count('\n', 0, start) + 1
+        lexer.lexer.begin(state)
+        if last_type is not None:
+            lexer.last_token = _token(last_type, start, lexer.lineno)
+        tokenfunc = None
+        if prefix:
+            pending = list(prefix)
+            closing = [_token('RBRACE', end, None)]
+            def tokenfunc():
+                if pending:
+                    return pending.pop(0)
+                t = lexer.token()
+                if t is None and closing:
+                    t = closing.pop()
+                    t.lineno = lexer.lineno
+                return t
+        lexer.result = self.parser.parse(None, lexer=lexer, tokenfunc=tokenfunc)
+        # statements inside braced namespaces are recorded before theirs
+        statements = []
+        for statement in lexer.statements:
+            while statements and statements[-1][1] >= statement[1]:
+                statements.pop()
+            statements.append(statement)
+        lexer.statements = statements
+        return lexer
+
+    def _context(self, offset):
+        # the type of the last token before offset and the lexer state
+        # after it, i.e. where lexing can restart at offset
+        i = bisect.bisect_left(self.positions, offset) - 1
+        if i < 0:
+            return None, 'INITIAL'
+        return self.types[i], self.states_after[i]
+
+    def _in_html(self, offset):
+        # whether the token at offset was lexed outside of PHP code
+        i = bisect.bisect_left(self.positions, offset)
+        return i < len(self.positions) and self.states_before[i] == 'INITIAL'
+
+    def _resumes(self, lexer, source, offset, last_type):
+        # whether lexing after the reparsed region picks up as before
+        if offset >= len(self.source):
+            return True
+        i = bisect.bisect_left(self.positions, offset)
+        if lexer.lexer.lexstatestack or i == len(self.positions) or \
+           lexer.lexer.current_state() != self.states_before[i]:
+            return False
+        if lexer.types:
+            last_type = lexer.types[-1]
+        return i > 0 and self.types[i - 1] == last_type and \
+            self._ends(lexer, source)
+
+    def _ends(self, lexer, source):
+        # whether the last token of the region ends where the region does
+        # in the whole source too; a comment or a name lexed up to the end
+        # of the region might run on past it
+        t = lexer.last
+        if t is None or lexer.last_state != lexer.lexer.current_state():
+            # tokens that change the state have a fixed extent
+            return True
+        relexer = phplex.new_lexer()
+        relexer.input(source)
+        relexer.begin(lexer.last_state)
+        relexer.lexpos = t.lexpos
+        try:
+            u = relexer.token()
+        except SyntaxError:
+            return False
+        return u is not None and u.type == t.type and \
+            relexer.lexpos == lexer.last_end
+
+    def _splice(self, lexer, start, end, offset):
+        # replace the recorded tokens between start and end
+        i = bisect.bisect_left(self.positions, start)
+        j = bisect.bisect_left(self.positions, end)
+        positions = self.positions[:i]
+        positions.extend(lexer.positions)
+        positions.extend(p + offset for p in self.positions[j:])
+        self.positions = positions
+        self.types[i:j] = lexer.types
+        self.states_before[i:j] = lexer.states_before
+        self.states_after[i:j] = lexer.states_after
+
+    def edit(self, start, end, text):
+        """Replace source[start:end] with text and return the new list of
+        top-level nodes. Raises SyntaxError if the new source doesn't
+        parse; the next edit then parses the whole file."""
+        old = self.source
+        source = old[:start] + text + old[end:]
+        if self.statements is None:
+            self._full_parse(source)
+            return self.nodes
+        offset = len(text) - (end - start)
+        lines = text.count('\n') - old.count('\n', start, end)
+        try:
+            if not self._edit_members(source, start, end, offset, lines):
+                self._edit_statements(source, start, end, offset, lines)
+        except SyntaxError:
+            self.source = source
+            self.statements = None
+            raise
+        self.source = source
+        return self.nodes
+
+    def _edit_statements(self, source, start, end, offset, lines):
+        statements = self.statements
+        # statements that end before the edit or start after it are kept
+        i = 0
+        while i < len(statements) and statements[i][2] < start:
+            i += 1
+        j = i
+        while j < len(statements) and statements[j][1] <= end:
+            j += 1
+        attempts = 0
+        while True:
+            region_start = statements[i - 1][2] if i > 0 else 0
+            region_end = statements[j][1] if j < len(statements) \
+                else len(self.source)
+            if i == 0 and j == len(statements):
+                self._full_parse(source)
+                return
+            last_type, state = self._context(region_start)
+            # inline HTML runs on to the next open tag, so the tokens on
+            # either side of a boundary in HTML depend on each other
+            if state == 'INITIAL' and i > 0:
+                i -= 1
+                continue
+            if j < len(statements) and self._in_html(region_end):
+                j += 1
+                continue
+            try:
+                lexer = self._parse(source, region_start, region_end + offset,
+                                    state, last_type, [])
+                if self._resumes(lexer, source, region_end, last_type):
+                    break
+            except SyntaxError:
+                pass
+            attempts += 1
+            if attempts < 3:
+                i = max(i - 1, 0)
+                j = min(j + 1, len(statements))
+            else:
+                # an unclosed comment or string; stop growing the region
+                # a statement at a time
+                i, j = 0, len(statements)
+
+        after = statements[j:]
+        _shift([statement[0] for statement in after], offset, lines)
+        for statement in after:
+            statement[1] += offset
+            statement[2] += offset
+        self.statements = statements[:i] + lexer.statements + after
+        self._splice(lexer, region_start, region_end, offset)
+        self.reparsed = region_end + offset - region_start
+
+    def _edit_members(self, source, start, end, offset, lines):
+        # Reparse only some members when the edit lies inside the braces
+        # of a top-level class, interface or trait. Returns False when
+        # that is not possible.
+        for k, (node, node_start, node_end) in enumerate(self.statements):
+            if node_start < start and end < node_end:
+                break
+        else:
+            return False
+        if not isinstance(node, (ast.Class, ast.Interface, ast.Trait)):
+            return False
+        i = bisect.bisect_left(self.positions, node_start)
+        while self.types[i] != 'LBRACE':
+            i += 1
+        body_start = self.positions[i] + 1
+        body_end = node_end - 1
+        if not body_start <= start or not end <= body_end:
+            return False
+
+        members = list(getattr(node, 'traits', []) or []) + list(node.nodes)
+        members.sort(key=lambda member: member.start_offset)
+        i = 0
+        while i < len(members) and members[i].end_offset < start:
+            i += 1
+        j = i
+        while j < len(members) and members[j].start_offset <= end:
+            j += 1
+        region_start = members[i - 1].end_offset if i > 0 else body_start
+        region_end = members[j].start_offset if j < len(members) \
+            else body_end
+        last_type, state = self._context(region_start)
+        lineno = source.count('\n', 0, region_start) + 1
+        prefix = [_token('CLASS', region_start, lineno),
+                  _token('STRING', region_start, lineno),
+                  _token('LBRACE', region_start, lineno)]
+        prefix[1].value = 'incremental'
+        try:
+            lexer = self._parse(source, region_start, region_end + offset,
+                                state, last_type, prefix)
+        except SyntaxError:
+            return False
+        if not self._resumes(lexer, source, region_end, last_type):
+            return False
+
+        if len(lexer.result) != 1:
+            # the edit closed the class early
+            return False
+        parsed = lexer.result[0]
+        if parsed.traits and isinstance(node, ast.Interface):
+            return False
+        after = members[j:]
+        _shift(after, offset, lines)
+        kept = members[:i] + after
+        traits = [m for m in kept if isinstance(m, ast.TraitUse)] + \
+            parsed.traits
+        body = [m for m in kept if not isinstance(m, ast.TraitUse)] + \
+            parsed.nodes
+        node.nodes = sorted(body, key=lambda member: member.start_offset)
+        if not isinstance(node, ast.Interface):
+            node.traits = sorted(traits, key=lambda member: member.start_offset)
+        node.end_offset += offset
+        self.statements[k][2] += offset
+        rest = self.statements[k + 1:]
+        _shift([statement[0] for statement in rest], offset, lines)
+        for statement in rest:
+            statement[1] += offset
+            statement[2] += offset
+        self._splice(lexer, region_start, region_end, offset)
+        self.reparsed = region_end + offset - region_start
+        return True
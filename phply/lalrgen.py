@@ -0,0 +1,335 @@
+# ----------------------------------------------------------------------
+# lalrgen.py
+#
+# Generates a parse driver specialized to the PHP grammar from PLY's
+# tables. The driver runs the same grammar actions as PLY and builds the
+# same trees, but with the tables laid out as lists indexed by state and
+# production, the values kept on a stack of their own so that actions get
+# a plain list as p, and reductions whose action only passes p[1] up done
+# without calling the action at all.
+# ----------------------------------------------------------------------
+
+import ast
+import hashlib
+import inspect
+import os
+import sys
+import tempfile
+import types
+
+from . import phpparse
+
+driver_module = 'parsedriver'
+
+_template = '''\
+# %(module)s.py
+# This file is automatically generated by phply.lalrgen. Do not edit.
+# pylint: disable=W,C,R
+
+from ply.yacc import YaccSymbol
+
+from phply import phplex
+from phply import phpparse as _rules
+
+signature = %(signature)r
+
+# action table: state -> {token type: action}, where an action > 0 shifts
+# to that state, < 0 reduces by that production and 0 accepts
+_actions = %(actions)s
+
+# the reduction to do in a state without looking at the next token
+_defaulted = %(defaulted)r
+
+# production -> (name, length, action or None if it passes p[1] up,
+# {state: state after the reduction})
+_productions = (
+%(productions)s)
+
+
+class Production(list):
+    """p as the grammar actions get it: the values of the symbols, with
+    p[0] for the result. Nonterminals are None in slice unless their
+    action used it, which PLY actions only do to set attributes on
+    slice[0]."""
+
+    __slots__ = ('syms', 'name')
+    lexer = None
+    parser = None
+
+    @property
+    def slice(self):
+        syms = self.syms
+        if syms[0] is None:
+            sym = syms[0] = YaccSymbol()
+            sym.type = self.name
+            sym.value = None
+        return syms
+
+    def lineno(self, n):
+        return getattr(self.syms[n], 'lineno', 0)
+
+    def set_lineno(self, n, lineno):
+        self.slice[n].lineno = lineno
+
+    def lexpos(self, n):
+        return getattr(self.syms[n], 'lexpos', 0)
+
+
+def parse(input=None, lexer=None, debug=False, tracking=False,
+          tokenfunc=None):
+    """Parse like phpparse's parser.parse(). debug and tracking are
+    accepted for compatibility and ignored."""
+    if lexer is None:
+        lexer = phplex.lexer.clone()
+    if input is not None:
+        lexer.input(input)
+    get_token = tokenfunc or lexer.token
+    # one p for the whole parse, refilled for every reduction
+    p = type('Production', (Production,), {'__slots__': (), 'lexer': lexer,
+                                            'parser': None})()
+    actions = _actions
+    defaulted = _defaulted
+    productions = _productions
+    statestack = [0]
+    syms = [None]
+    values = [None]
+    state = 0
+    lookahead = None
+    while True:
+        t = defaulted[state]
+        if t is None:
+            if lookahead is None:
+                lookahead = get_token()
+                if lookahead is None:
+                    lookahead = YaccSymbol()
+                    lookahead.type = '$end'
+            t = actions[state].get(lookahead.type)
+            if t is None:
+                _error(lookahead, lexer)
+            if t > 0:
+                statestack.append(t)
+                state = t
+                syms.append(lookahead)
+                values.append(lookahead.value)
+                lookahead = None
+                continue
+            if t == 0:
+                return values[-1]
+        name, plen, action, gotos = productions[-t]
+        if action is None:
+            syms[-1] = None
+            statestack[-1] = state = gotos[statestack[-2]]
+            continue
+        if plen:
+            p[:] = values[-plen - 1:]
+            p[0] = None
+            p.syms = top = syms[-plen - 1:]
+            top[0] = None
+            p.name = name
+            action(p)
+            del values[-plen:]
+            del syms[-plen:]
+            del statestack[-plen:]
+        else:
+            p[:] = (None,)
+            p.syms = top = [None]
+            p.name = name
+            action(p)
+        value = p[0]
+        sym = top[0]
+        if sym is not None:
+            sym.value = value
+        values.append(value)
+        syms.append(sym)
+        state = gotos[statestack[-1]]
+        statestack.append(state)
+
+def _error(lookahead, lexer):
+    if lookahead.type == '$end':
+        lookahead = None
+    elif not hasattr(lookahead, 'lexer'):
+        lookahead.lexer = lexer
+    _rules.p_error(lookahead)
+    raise SyntaxError('invalid syntax')
+'''
+
+
+def grammar_signature():
+    """A hash of the grammar, its actions and the driver template; drivers
+    generated from other versions are out of date. Without the source of
+    phpparse, as in an install of .pyc files only, the rules and the
+    bytecode of their actions are hashed instead."""
+    digest = hashlib.sha1(_template.encode('utf-8'))
+    try:
+        path = inspect.getsourcefile(phpparse)
+    except TypeError:
+        path = None
+    if path is not None and os.path.exists(path):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+        return digest.hexdigest()
+    for name, func in sorted(vars(phpparse).items()):
+        if name.startswith('p_') and isinstance(func, types.FunctionType):
+            digest.update(name.encode('utf-8'))
+            digest.update((func.__doc__ or '').encode('utf-8'))
+            digest.update(func.__code__.co_code)
+    return digest.hexdigest()
+
+def _passes_up(func, length):
+    # Whether func does nothing but p[0] = p[1] for a production of the
+    # given length, once its `if len(p) == N` tests are decided.
+    try:
+        source = inspect.getsource(func)
+    except (IOError, TypeError):
+        return False
+    body = ast.parse(_dedent(source)).body[0].body
+    if body and isinstance(body[0], ast.Expr) and \
+       isinstance(body[0].value, getattr(ast, 'Constant', ast.Str)):
+        body = body[1:]
+    while len(body) == 1 and isinstance(body[0], ast.If):
+        decided = _length_test(body[0].test, length + 1)
+        if decided is None:
+            return False
+        body = body[0].body if decided else body[0].orelse
+    if len(body) != 1 or not isinstance(body[0], ast.Assign):
+        return False
+    stmt = body[0]
+    return len(stmt.targets) == 1 and _is_item(stmt.targets[0], 0) and \
+        _is_item(stmt.value, 1)
+
+def _dedent(source):
+    lines = source.splitlines()
+    indent = len(lines[0]) - len(lines[0].lstrip())
+    return '\n'.join(line[indent:] for line in lines)
+
+def _constant(node):
+    if isinstance(node, getattr(ast, 'Constant', ())):
+        return node.value
+    if isinstance(node, getattr(ast, 'Num', ())):
+        return node.n
+    return None
+
+def _length_test(test, length):
+    # True or False for `len(p) == N`, None for any other test
+    if not isinstance(test, ast.Compare) or len(test.ops) != 1 or \
+       not isinstance(test.ops[0], ast.Eq):
+        return None
+    call = test.left
+    if not isinstance(call, ast.Call) or \
+       not isinstance(call.func, ast.Name) or call.func.id != 'len' or \
+       len(call.args) != 1 or not isinstance(call.args[0], ast.Name) or \
+       call.args[0].id != 'p':
+        return None
+    value = _constant(test.comparators[0])
+    if not isinstance(value, int):
+        return None
+    return value == length
+
+def _is_item(node, index):
+    # whether node is p[index]
+    if not isinstance(node, ast.Subscript) or \
+       not isinstance(node.value, ast.Name) or node.value.id != 'p':
+        return False
+    key = node.slice
+    if isinstance(key, getattr(ast, 'Index', ())):
+        key = key.value
+    return _constant(key) == index
+
+def generate(parser=None):
+    """Return the source of a driver for the tables of parser, a parser
+    from phpparse.make_parser() (one is made if not given). The driver
+    calls phpparse's own actions, so parsers made with spans, factory or
+    interpolated_strings, whose actions are replaced, raise ValueError."""
+    if parser is None:
+        parser = phpparse.make_parser()
+    states = max(parser.action) + 1
+    actions = '[\n%s]' % ''.join('    %r,\n' % (parser.action.get(state, {}),)
+                                 for state in range(states))
+    defaulted = [parser.defaulted_states.get(state) for state in range(states)]
+    productions = []
+    for production in parser.productions:
+        gotos = dict((state, table[production.name])
+                     for state, table in parser.goto.items()
+                     if production.name in table)
+        func = production.callable
+        if func is None:
+            action = 'None'
+        elif production.len == 1 and _passes_up(func, 1):
+            action = 'None'
+        else:
+            if not func.__name__.startswith('p_') or \
+               getattr(phpparse, func.__name__, None) is not func:
+                raise ValueError('%s is not an action from phpparse'
+                                 % func.__name__)
+            action = '_rules.' + func.__name__
+        productions.append('    (%r, %d, %s, %r),\n'
+                           % (production.name, production.len, action, gotos))
+    return _template % {
+        'module': driver_module,
+        'signature': grammar_signature(),
+        'actions': actions,
+        'defaulted': defaulted,
+        'productions': ''.join(productions),
+    }
+
+def _write(path, source):
+    # written to a temporary file and renamed into place, so that another
+    # process importing the driver meanwhile never sees half of it
+    fd, temp = tempfile.mkstemp('.tmp', driver_module,
+                                os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(source)
+        os.chmod(temp, 0o644)
+        getattr(os, 'replace', os.rename)(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+def _default_path():
+    return os.path.join(os.path.dirname(os.path.abspath(phpparse.__file__)),
+                        driver_module + '.py')
+
+def write_driver(outputdir=None):
+    """Generate the driver and write it next to phpparse (or to
+    outputdir). Returns the path written."""
+    if outputdir is None:
+        path = _default_path()
+    else:
+        path = os.path.join(outputdir, driver_module + '.py')
+    _write(path, generate())
+    return path
+
+def load_driver():
+    """Return the driver module, generating it first if it is missing or
+    out of date. A new driver is written next to phpparse for later runs
+    when possible.
+
+    The module's parse() takes the same arguments as the parse() method
+    of PLY parsers, so it can stand in for one, e.g. as
+    project.parse_source(source, parser=load_driver()). It builds the
+    trees of make_parser() with its default options: no spans, the
+    phpast node classes and interpolated strings as chains."""
+    name = 'phply.' + driver_module
+    module = sys.modules.get(name)
+    if module is None:
+        try:
+            module = __import__(name, fromlist=['signature'])
+        except (ImportError, AttributeError, SyntaxError):
+            # missing, referring to actions that are gone, or cut short
+            # by a writer that didn't rename it into place
+            module = None
+    signature = grammar_signature()
+    if module is not None and getattr(module, 'signature', None) == signature:
+        return module
+    source = generate()
+    path = _default_path()
+    try:
+        _write(path, source)
+    except (IOError, OSError):
+        pass
+    module = types.ModuleType(name)
+    module.__file__ = path
+    exec(compile(source, path, 'exec'), module.__dict__)
+    sys.modules[name] = module
+    return module
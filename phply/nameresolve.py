@@ -0,0 +1,254 @@
+# ----------------------------------------------------------------------
+# nameresolve.py
+#
+# Namespace and `use` resolution of class, function and constant names.
+# ----------------------------------------------------------------------
+
+import sys
+
+from . import phpast as ast
+from .symbolindex import extract_symbols
+
+if sys.version_info[0] == 3:
+    string_type = str
+else:
+    string_type = basestring
+
+special_class_names = ('self', 'parent', 'static')
+special_constant_names = ('true', 'false', 'null')
+# type hints that are not class names
+builtin_types = ('array', 'callable', 'bool', 'float', 'int', 'string',
+                 'iterable', 'object', 'mixed', 'void')
+
+
+class SymbolTable(object):
+    """Functions and constants defined across a project.
+
+    Used to decide whether an unqualified function or constant name inside a
+    namespace refers to the namespaced symbol or falls back to the global
+    one, as PHP decides at runtime."""
+
+    def __init__(self):
+        self.classes = set()
+        self.functions = set()
+        self.constants = set()
+
+    def add(self, kind, name):
+        if kind in ('class', 'interface', 'trait'):
+            self.classes.add(name.lower())
+        elif kind == 'function':
+            self.functions.add(name.lower())
+        elif kind == 'constant':
+            self.constants.add(name)
+
+    def add_nodes(self, nodes):
+        for kind, name, lineno, container in extract_symbols(nodes):
+            self.add(kind, name)
+
+    def add_index(self, index):
+        """Load every definition from a symbolindex.SymbolIndex."""
+        for kind, name in index.db.execute(
+                "SELECT kind, name FROM symbols WHERE kind IN "
+                "('class', 'interface', 'trait', 'function', 'constant')"):
+            self.add(kind, name)
+
+    def has_function(self, name):
+        return name.lower() in self.functions
+
+    def has_constant(self, name):
+        return name in self.constants
+
+
+class ImportMap(object):
+    """The namespace and `use` aliases in effect for part of a file."""
+
+    def __init__(self, namespace=None):
+        self.namespace = namespace
+        self.aliases = {}
+        self.resolved = {}
+
+    def add(self, use):
+        name = use.name.lstrip('\\')
+        alias = use.alias or name.rsplit('\\', 1)[-1]
+        self.aliases[alias.lower()] = name
+        self.resolved.clear()
+
+    def qualify(self, name):
+        if self.namespace:
+            return '%s\\%s' % (self.namespace, name)
+        return name
+
+    def expand(self, name):
+        # returns the fully qualified name for qualified names, or None if an
+        # unqualified name is not imported
+        if name.startswith('\\'):
+            return name[1:]
+        if name.lower().startswith('namespace\\'):
+            return self.qualify(name[len('namespace\\'):])
+        head, sep, tail = name.partition('\\')
+        imported = self.aliases.get(head.lower())
+        if imported is not None:
+            return imported + sep + tail
+        if sep:
+            return self.qualify(name)
+        return None
+
+    # The same few names tend to be referenced over and over in a file, so
+    # results are memoized per kind and name.
+
+    def resolve_class(self, name):
+        key = ('class', name)
+        try:
+            return self.resolved[key]
+        except KeyError:
+            pass
+        if name.lower() in special_class_names:
+            result = name
+        else:
+            expanded = self.expand(name)
+            if expanded is None:
+                expanded = self.qualify(name)
+            result = '\\' + expanded
+        self.resolved[key] = result
+        return result
+
+    def resolve_function(self, name, symbols=None):
+        key = ('function', name)
+        try:
+            return self.resolved[key]
+        except KeyError:
+            result = self._resolve_fallback(name, symbols, 'has_function')
+            self.resolved[key] = result
+            return result
+
+    def resolve_constant(self, name, symbols=None):
+        if name.lower() in special_constant_names:
+            return name
+        key = ('constant', name)
+        try:
+            return self.resolved[key]
+        except KeyError:
+            result = self._resolve_fallback(name, symbols, 'has_constant')
+            self.resolved[key] = result
+            return result
+
+    def _resolve_fallback(self, name, symbols, has):
+        # `use` only imports classes and namespaces, so unqualified function
+        # and constant names are never aliased
+        expanded = self.expand(name) if '\\' in name else None
+        if expanded is not None:
+            return '\\' + expanded
+        if self.namespace and symbols is not None and \
+           getattr(symbols, has)(self.qualify(name)):
+            return '\\' + self.qualify(name)
+        return '\\' + name
+
+
+def import_sections(nodes):
+    """Split top-level nodes into (import map, nodes) sections, one for each
+    namespace in the file."""
+    sections = []
+    current = ImportMap()
+    current_nodes = []
+    for node in nodes:
+        if isinstance(node, ast.Namespace):
+            if node.nodes:
+                braced = ImportMap(node.name)
+                for stmt in node.nodes:
+                    if isinstance(stmt, ast.UseDeclarations):
+                        for use in stmt.nodes:
+                            braced.add(use)
+                sections.append((braced, node.nodes))
+                continue
+            sections.append((current, current_nodes))
+            current = ImportMap(node.name)
+            current_nodes = []
+        elif isinstance(node, ast.UseDeclarations):
+            for use in node.nodes:
+                current.add(use)
+        current_nodes.append(node)
+    sections.append((current, current_nodes))
+    return [(imports, section) for imports, section in sections if section]
+
+
+class NameResolver(object):
+    """Rewrites class, function and constant references to their fully
+    qualified form, e.g. `new Foo` inside `namespace App; use Lib\\Foo;`
+    becomes New('\\Lib\\Foo', ...).
+
+    Declaration names (Class.name, Function.name, ...) are left as written.
+    The import maps of every file resolved with a filename are kept in
+    import_maps, so later passes can resolve names found in strings or
+    docblocks without walking the file again."""
+
+    def __init__(self, symbols=None):
+        self.symbols = symbols
+        self.import_maps = {}
+
+    def resolve(self, nodes, filename=None):
+        sections = import_sections(nodes)
+        if filename is not None:
+            self.import_maps[filename] = [imports for imports, _ in sections]
+        for imports, section in sections:
+            stack = list(reversed(section))
+            while stack:
+                node = stack.pop()
+                if not isinstance(node, ast.Node):
+                    continue
+                self.resolve_node(node, imports)
+                for field in reversed(node.fields):
+                    value = getattr(node, field)
+                    if isinstance(value, list):
+                        stack.extend(reversed(value))
+                    elif isinstance(value, ast.Node):
+                        stack.append(value)
+        return nodes
+
+    def resolve_node(self, node, imports):
+        resolve_class = imports.resolve_class
+        if isinstance(node, ast.New):
+            if isinstance(node.name, string_type):
+                node.name = resolve_class(node.name)
+        elif isinstance(node, ast.StaticMethodCall):
+            if isinstance(node.class_, string_type):
+                node.class_ = resolve_class(node.class_)
+        elif isinstance(node, ast.StaticProperty):
+            if isinstance(node.node, string_type):
+                node.node = resolve_class(node.node)
+        elif isinstance(node, ast.FunctionCall):
+            if isinstance(node.name, string_type):
+                node.name = imports.resolve_function(node.name, self.symbols)
+        elif isinstance(node, ast.Constant):
+            # self and parent as the right side of instanceof, which
+            # resolve_class has left alone
+            if node.name.lower() not in special_class_names:
+                node.name = imports.resolve_constant(node.name, self.symbols)
+        elif isinstance(node, ast.BinaryOp):
+            if node.op == 'instanceof' and isinstance(node.right, ast.Constant):
+                # fully qualified names are left alone by the constant rule
+                # when the right side is visited afterwards
+                node.right.name = resolve_class(node.right.name)
+        elif isinstance(node, ast.Class):
+            if node.extends:
+                node.extends = resolve_class(node.extends)
+            node.implements = [resolve_class(n) for n in node.implements]
+        elif isinstance(node, ast.Interface):
+            if node.extends:
+                node.extends = [resolve_class(n) for n in node.extends]
+        elif isinstance(node, ast.TraitUse):
+            node.name = resolve_class(node.name)
+        elif isinstance(node, ast.Catch):
+            node.class_ = resolve_class(node.class_)
+        elif isinstance(node, ast.FormalParameter):
+            if isinstance(node.type, string_type) and \
+               node.type.lower() not in builtin_types:
+                node.type = resolve_class(node.type)
+
+def resolve_names(nodes, symbols=None):
+    """Resolve all names in a parsed file in place and return it. Without
+    symbols, the functions and constants defined in the file itself are
+    the ones an unqualified name can refer to in its namespace."""
+    if symbols is None:
+        symbols = SymbolTable()
+        symbols.add_nodes(nodes)
+    return NameResolver(symbols).resolve(nodes)
@@ -0,0 +1,253 @@
+# ----------------------------------------------------------------------
+# neardup.py
+#
+# Near-duplicate file detection with MinHash signatures of token n-grams
+# and locality sensitive hashing. Only the lexer is used, so files that
+# don't parse still take part.
+# ----------------------------------------------------------------------
+
+import array
+import collections
+import functools
+import os
+import shutil
+import sys
+import tempfile
+import zlib
+
+from . import phplex
+from . import project
+
+if sys.version_info[0] == 3:
+    _tobytes = array.array.tobytes
+    _frombytes = array.array.frombytes
+else:
+    _tobytes = array.array.tostring
+    _frombytes = array.array.fromstring
+
+_skipped = frozenset(['WHITESPACE', 'COMMENT', 'DOC_COMMENT', 'OPEN_TAG',
+                      'OPEN_TAG_WITH_ECHO', 'CLOSE_TAG'])
+# tokens reduced to a placeholder, so that renamed variables and changed
+# literals only make a small difference
+_abstracted = {
+    'VARIABLE': '$',
+    'LNUMBER': '0',
+    'DNUMBER': '0',
+    'CONSTANT_ENCAPSED_STRING': "''",
+    'ENCAPSED_AND_WHITESPACE': "''",
+    'INLINE_HTML': '<>',
+}
+
+_prime = (1 << 61) - 1
+_mask = (1 << 32) - 1
+
+
+def tokens(source):
+    """Return the normalized tokens of some PHP source. Identifiers are kept
+    (lowercased), variables and literals are replaced by placeholders and
+    everything else is represented by its token type."""
+    lexer = phplex.new_lexer()
+    lexer.input(source)
+    result = []
+    for token in lexer:
+        kind = token.type
+        if kind in _skipped:
+            continue
+        if kind == 'STRING':
+            result.append(token.value.lower())
+        else:
+            result.append(_abstracted.get(kind, kind))
+    return result
+
+def shingles(tokens, n=5):
+    """Hash every run of n tokens to a 32-bit integer."""
+    if len(tokens) < n:
+        n = len(tokens)
+    return set(zlib.crc32(' '.join(tokens[i:i + n]).encode('utf-8',
+                                                           'surrogateescape'))
+               & _mask
+               for i in range(len(tokens) - n + 1)) if tokens else set()
+
+def signature(shingles, size=128, seed=1):
+    """Return the MinHash signature of a set of shingles as an array of
+    `size` 32-bit integers, or None for an empty set.
+
+    Rather than hashing every shingle `size` times, each shingle is hashed
+    once and assigned to one of `size` bins, keeping the minimum per bin
+    (one permutation hashing). Empty bins borrow from the next non-empty
+    one, so the probability that two signatures agree at any position is
+    still the Jaccard similarity of the sets."""
+    if not shingles:
+        return None
+    a = 0x9E3779B97F4A7C15 % _prime + seed
+    b = 0x632BE59BD9B4E019 % _prime + seed
+    bins = [None] * size
+    for shingle in shingles:
+        value = (a * shingle + b) % _prime
+        index = value % size
+        value = (value // size) & _mask
+        current = bins[index]
+        if current is None or value < current:
+            bins[index] = value
+    result = array.array('I', [0] * size)
+    for i in range(size):
+        value = bins[i]
+        distance = 0
+        while value is None:
+            distance += 1
+            value = bins[(i + distance) % size]
+        # an offset keeps borrowed values from agreeing by accident
+        result[i] = (value + distance * 0x9E3779B1) & _mask
+    return result
+
+def similarity(a, b):
+    """Estimate the Jaccard similarity of two signatures."""
+    return sum(1 for x, y in zip(a, b) if x == y) / float(len(a))
+
+def _file_signature(path, ngram, size):
+    try:
+        found = signature(shingles(tokens(project.read_source(path)), ngram),
+                          size)
+    except SyntaxError as e:
+        return path, None, '%s: %s' % (e.__class__.__name__, e)
+    return path, _tobytes(found) if found is not None else None, None
+
+
+class NearDuplicates(object):
+    """Groups files whose token n-grams overlap by at least threshold.
+
+    Signatures are written to a scratch file as they arrive from the worker
+    processes instead of being kept in memory. Candidates are then found
+    one LSH band at a time: files whose signatures agree on every row of a
+    band land in the same bucket, and each file is compared with the files
+    before it in its bucket that are not in its group yet. Only the last
+    max_bucket files of a bucket are kept for comparison, so that a band
+    most files agree on (boilerplate, say) costs time linear in the number
+    of files; near-duplicates agree on other bands too. Memory use is a
+    few integers per file and bucket entry, independent of file sizes and
+    the signature length."""
+
+    def __init__(self, bands=32, rows=4, ngram=5, threshold=0.8, workdir=None,
+                 max_bucket=64):
+        self.bands = bands
+        self.rows = rows
+        self.size = bands * rows
+        self.ngram = ngram
+        self.threshold = threshold
+        self.max_bucket = max_bucket
+        self.paths = []
+        self.errors = {}
+        self._dir = tempfile.mkdtemp(dir=workdir)
+        self._file = open(os.path.join(self._dir, 'signatures'), 'w+b')
+        self._record = self.size * 4
+        # ids of files without any tokens, which get no signature
+        self._blank = set()
+
+    def close(self):
+        self._file.close()
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_files(self, paths, processes=None):
+        """Compute signatures for every PHP file under paths."""
+        compute = functools.partial(_file_signature, ngram=self.ngram,
+                                    size=self.size)
+        self._file.seek(0, os.SEEK_END)
+        blank = b'\0' * self._record
+        for path, data, error in project.map_files(
+                compute, project.find_php_files(paths), processes, 64):
+            if error is not None:
+                self.errors[path] = error
+                continue
+            if data is None:
+                self._blank.add(len(self.paths))
+                data = blank
+            self.paths.append(path)
+            self._file.write(data)
+
+    def _signature(self, f, i):
+        f.seek(i * self._record)
+        result = array.array('I')
+        _frombytes(result, f.read(self._record))
+        return result
+
+    def _band_keys(self, band):
+        # stream through the scratch file, yielding (file id, band key)
+        self._file.flush()
+        self._file.seek(0)
+        start, end = band * self.rows * 4, (band + 1) * self.rows * 4
+        chunk = 4096
+        i = 0
+        while True:
+            data = self._file.read(self._record * chunk)
+            if not data:
+                break
+            for offset in range(0, len(data), self._record):
+                if i not in self._blank:
+                    yield i, data[offset + start:offset + end]
+                i += 1
+
+    def groups(self):
+        """Return lists of near-duplicate paths, biggest groups first."""
+        count = len(self.paths)
+        parent = array.array('i', range(count))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        # a second handle for random access while the bands are streamed
+        with open(self._file.name, 'rb') as f:
+            for band in range(self.bands):
+                buckets = {}
+                for i, key in self._band_keys(band):
+                    bucket = buckets.get(key)
+                    if bucket is None:
+                        bucket = buckets[key] = collections.deque(
+                            maxlen=self.max_bucket)
+                    current = None
+                    # not just the first file of the bucket: two files can
+                    # be close to each other and not to that one
+                    for other in bucket:
+                        a, b = find(other), find(i)
+                        if a == b:
+                            continue
+                        if current is None:
+                            current = self._signature(f, i)
+                        if similarity(self._signature(f, other),
+                                      current) >= self.threshold:
+                            parent[max(a, b)] = min(a, b)
+                    bucket.append(i)
+                del buckets
+
+        members = {}
+        for i in range(count):
+            members.setdefault(find(i), []).append(self.paths[i])
+        result = [sorted(paths) for paths in members.values()
+                  if len(paths) > 1]
+        result.sort(key=lambda paths: (-len(paths), paths))
+        return result
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Find near-duplicate PHP files")
+    ap.add_argument('-j', '--jobs', dest='jobs', type=int, default=None)
+    ap.add_argument('-t', '--threshold', dest='threshold', type=float,
+                    default=0.8)
+    ap.add_argument('paths', metavar='PATH', nargs='+')
+    args = ap.parse_args()
+
+    with NearDuplicates(threshold=args.threshold) as finder:
+        finder.add_files(args.paths, args.jobs)
+        for path, error in sorted(finder.errors.items()):
+            sys.stderr.write('%s: %s\n' % (path, error))
+        for paths in finder.groups():
+            print(' '.join(paths))
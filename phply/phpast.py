@@ -4,8 +4,19 @@
 # PHP abstract syntax node definitions.
 # ----------------------------------------------------------------------
 
+import sys
+
+if sys.version_info[0] == 3:
+    string_type = str
+else:
+    string_type = basestring
+
 class Node(object):
     fields = []
+    # offsets of the first character and just past the last one, set by
+    # parsers made with make_parser(spans=True)
+    start_offset = None
+    end_offset = None
 
     def __init__(self, *args, **kwargs):
         assert len(self.fields) == len(args), \
@@ -43,22 +54,7 @@ class Node(object):
                         item.accept(visitor)
 
     def generic(self, with_lineno=False):
-        values = {}
-        if with_lineno:
-            values['lineno'] = self.lineno
-        for field in self.fields:
-            value = getattr(self, field)
-            if hasattr(value, 'generic'):
-                value = value.generic(with_lineno)
-            elif isinstance(value, list):
-                items = value
-                value = []
-                for item in items:
-                    if hasattr(item, 'generic'):
-                        item = item.generic(with_lineno)
-                    value.append(item)
-            values[field] = value
-        return (self.__class__.__name__, values)
+        return to_generic(self, with_lineno)
 
 def node(name, fields):
     attrs = {'fields': fields}
@@ -143,6 +139,148 @@ ConstantDeclarations = node('ConstantDeclarations', ['nodes'])
 ConstantDeclaration = node('ConstantDeclaration', ['name', 'initial'])
 TraitUse = node('TraitUse', ['name', 'renames'])
 TraitModifier = node('TraitModifier', ['from', 'to', 'visibility'])
+InterpolatedString = node('InterpolatedString', ['parts'])
+
+# Declarations that can carry the doc comment written before them. The
+# parser fills it in when the lexer was created with doc_comments=True.
+declarations = (Function, Method, Class, Interface, Trait, ClassConstants,
+                ClassVariables)
+for _cls in declarations:
+    _cls.doc_comment = None
+del _cls
+
+def to_generic(value, with_lineno=False):
+    """Turn a node, or a list of them, into plain Python structures: every
+    node becomes a (class name, {field: value}) tuple, with 'lineno' in the
+    dict too if with_lineno. Any depth of tree works: below a certain
+    depth the recursion gives way to a loop with a stack of its own."""
+    if isinstance(value, Node):
+        return _generic(value, with_lineno, 0)
+    return _generic_deep(value, with_lineno)
+
+# field values that are exported as they are
+if sys.version_info[0] == 3:
+    _leaves = frozenset([str, int, float, bool, type(None)])
+else:
+    _leaves = frozenset([str, unicode, int, long, float, bool, type(None)])
+_max_depth = 200
+
+def _generic(node, with_lineno, depth):
+    attrs = node.__dict__
+    values = {'lineno': attrs['lineno']} if with_lineno else {}
+    depth += 1
+    for field in node.fields:
+        item = attrs[field]
+        cls = item.__class__
+        if cls in _leaves:
+            values[field] = item
+        elif cls is list:
+            values[field] = [
+                x if x.__class__ in _leaves else
+                _generic(x, with_lineno, depth)
+                if isinstance(x, Node) and depth < _max_depth else
+                _generic_deep(x, with_lineno)
+                for x in item]
+        elif isinstance(item, Node) and depth < _max_depth:
+            values[field] = _generic(item, with_lineno, depth)
+        else:
+            values[field] = _generic_deep(item, with_lineno)
+    return (node.__class__.__name__, values)
+
+def _generic_deep(value, with_lineno):
+    root = [value]
+    stack = [(root, 0)]
+    while stack:
+        target, key = stack.pop()
+        value = target[key]
+        if value.__class__ is list:
+            items = target[key] = list(value)
+            for i, item in enumerate(items):
+                if item.__class__ not in _leaves:
+                    stack.append((items, i))
+        elif isinstance(value, Node):
+            attrs = value.__dict__
+            values = {'lineno': attrs['lineno']} if with_lineno else {}
+            for field in value.fields:
+                item = values[field] = attrs[field]
+                if item.__class__ not in _leaves:
+                    stack.append((values, field))
+            target[key] = (value.__class__.__name__, values)
+    return root[0]
+
+def _node_types():
+    global _types
+    if _types is None:
+        _types = dict((name, cls) for name, cls in globals().items()
+                      if isinstance(cls, type) and issubclass(cls, Node))
+    return _types
+_types = None
+
+def _generic_node(value, types):
+    # the class of a node exported by to_generic, which becomes a list of
+    # two items after a trip through JSON
+    if value.__class__ in (tuple, list) and len(value) == 2 and \
+       isinstance(value[0], string_type) and isinstance(value[1], dict):
+        return types.get(value[0])
+    return None
+
+def from_generic(value):
+    """Turn the output of to_generic() (or of generic()) back into nodes.
+    Nodes may also be lists instead of tuples, as after a trip through
+    JSON."""
+    types = _node_types()
+    root = [value]
+    stack = [(root, 0)]
+    while stack:
+        target, key = stack.pop()
+        value = target[key]
+        cls = _generic_node(value, types)
+        if cls is not None:
+            values = value[1]
+            node = cls.__new__(cls)
+            attrs = node.__dict__
+            attrs['lineno'] = values.get('lineno')
+            for field in cls.fields:
+                item = values[field]
+                attrs[field] = item
+                if item.__class__ in (tuple, list):
+                    stack.append((attrs, field))
+            target[key] = node
+        elif value.__class__ is list:
+            items = target[key] = list(value)
+            for i, item in enumerate(items):
+                if item.__class__ in (tuple, list):
+                    stack.append((items, i))
+    return root[0]
+
+def expand_interpolated_strings(nodes):
+    """Replace every InterpolatedString in a tree (from a parser made with
+    interpolated_strings=True) by the BinaryOp('.') chain the parser
+    builds otherwise; the new nodes get the string's lineno. Changes the
+    tree in place and returns it, or the replacement if nodes is an
+    InterpolatedString itself."""
+    root = [nodes]
+    stack = [(root, 0)]
+    while stack:
+        target, key = stack.pop()
+        value = target[key]
+        if isinstance(value, InterpolatedString):
+            lineno = value.lineno
+            parts = value.parts
+            value = parts[0]
+            for part in parts[1:]:
+                value = BinaryOp('.', value, part, lineno=lineno)
+            target[key] = value
+        if isinstance(value, Node):
+            attrs = value.__dict__
+            for field in value.fields:
+                if isinstance(attrs[field], (Node, list)):
+                    stack.append((attrs, field))
+        elif isinstance(value, list):
+            for i, item in enumerate(value):
+                if isinstance(item, (Node, list)):
+                    stack.append((value, i))
+    return root[0]
 
 def resolve_magic_constants(nodes):
     current = {}
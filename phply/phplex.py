@@ -167,6 +167,14 @@ t_php_SEMI                 = r';'
 t_php_AT                   = r'@'
 t_php_NS_SEPARATOR         = r'\\'
 
+def pop_closing(t):
+    # A ] or } with nothing open would leave the lexer no state to return
+    # to; the parser rejects it anyway, so report it the same way.
+    if not t.lexer.lexstatestack:
+        raise SyntaxError('unmatched %s' % t.value,
+                          (None, t.lineno, None, t.value))
+    t.lexer.pop_state()
+
 def t_php_LBRACKET(t):
     r'\['
     t.lexer.push_state('php')
@@ -174,7 +182,7 @@ def t_php_LBRACKET(t):
 
 def t_php_RBRACKET(t):
     r'\]'
-    t.lexer.pop_state()
+    pop_closing(t)
     return t
 
 def t_php_LBRACE(t):
@@ -184,7 +192,7 @@ def t_php_LBRACE(t):
 
 def t_php_RBRACE(t):
     r'\}'
-    t.lexer.pop_state()
+    pop_closing(t)
     return t
 
 # Casts
@@ -485,10 +493,24 @@ def peek(lexer):
     except IndexError:
         return ''
 
+# With doc_comments, a doc comment is kept across these tokens and attached
+# to the first token after them, so that it reaches the keyword or property
+# name of a declaration in any order of modifiers.
+doc_comment_modifiers = frozenset(['ABSTRACT', 'FINAL', 'PUBLIC', 'PROTECTED',
+                                   'PRIVATE', 'STATIC', 'VAR'])
+
 class FilteredLexer(object):
-    def __init__(self, lexer):
+    """Hands the parser only the tokens the grammar knows about.
+
+    With doc_comments set, a doc comment immediately before a token (or
+    before a run of member modifiers and then a token) is stored on that
+    token as doc_comment, which the parser copies to declarations."""
+
+    def __init__(self, lexer, doc_comments=False):
         self.lexer = lexer
         self.last_token = None
+        self.doc_comments = doc_comments
+        self.doc_comment = None
 
     @property
     def lineno(self):
@@ -507,13 +529,14 @@ class FilteredLexer(object):
         self.lexer.lexpos = value
 
     def clone(self):
-        return FilteredLexer(self.lexer.clone())
+        return FilteredLexer(self.lexer.clone(), self.doc_comments)
 
     def current_state(self):
         return self.lexer.current_state()
 
     def input(self, input):
         self.lexer.input(input)
+        self.doc_comment = None
 
     def next_lexer_token(self):
         """Return next lexer token.
@@ -544,6 +567,11 @@ class FilteredLexer(object):
                 t.type = 'ECHO'
                 break
 
+            if t.type == 'DOC_COMMENT' and self.doc_comments:
+                self.doc_comment = t.value
+                t = self.next_lexer_token()
+                continue
+
             # Insert semicolons in place of close tags where necessary.
             if t.type == 'CLOSE_TAG':
                 if self.last_token and \
@@ -558,6 +586,11 @@ class FilteredLexer(object):
 
             t = self.next_lexer_token()
 
+        if self.doc_comment is not None and t is not None and \
+           t.type not in doc_comment_modifiers:
+            t.doc_comment = self.doc_comment
+            self.doc_comment = None
+
         self.last_token = t
         return t
 
@@ -576,6 +609,15 @@ class FilteredLexer(object):
 full_lexer = lex.lex()
 lexer = FilteredLexer(full_lexer)
 
+def new_lexer():
+    """Return a copy of full_lexer ready for a new source. PLY clones share
+    their state stack with the lexer they are cloned from, so the copy gets
+    one of its own."""
+    lexer = full_lexer.clone()
+    lexer.lexstatestack = []
+    lexer.begin('INITIAL')
+    return lexer
+
 full_tokens = tokens
 tokens = [token for token in tokens if token not in unparsed]
 
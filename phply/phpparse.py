@@ -6,6 +6,7 @@
 
 import os
 import sys
+import types
 from . import phplex
 from . import phpast as ast
 import ply.yacc as yacc
@@ -91,6 +92,16 @@ def process_php_string_escapes(s):
             res += c
     return res
 
+def _doc_comment(p, n):
+    # the doc comment the lexer attached to the n-th symbol, if any; for
+    # nonterminals it is copied over by the rule that produced them
+    return getattr(p.slice[n], 'doc_comment', None)
+
+def _attach_doc_comment(p, n):
+    doc_comment = _doc_comment(p, n)
+    if doc_comment is not None:
+        p[0].doc_comment = doc_comment
+
 def p_start(p):
     'start : top_statement_list'
     p[0] = p[1]
@@ -500,6 +511,7 @@ def p_unset_variable(p):
 def p_function_declaration_statement(p):
     'function_declaration_statement : FUNCTION is_reference STRING LPAREN parameter_list RPAREN LBRACE inner_statement_list RBRACE'
     p[0] = ast.Function(p[3], p[5], p[8], p[2], lineno=p.lineno(1))
+    _attach_doc_comment(p, 1)
 
 def p_class_declaration_statement(p):
     '''class_declaration_statement : class_entry_type STRING extends_from implements_list LBRACE class_statement_list RBRACE
@@ -525,6 +537,7 @@ def p_class_declaration_statement(p):
             else:
                 stmts.append(s)
         p[0] = ast.Trait(p[2], traits, stmts, lineno=p.lineno(1))
+    _attach_doc_comment(p, 1)
 
 def p_class_entry_type(p):
     '''class_entry_type : CLASS
@@ -532,6 +545,7 @@ def p_class_entry_type(p):
                         | FINAL CLASS'''
     if len(p) == 3:
         p[0] = p[1].lower()
+    p.slice[0].doc_comment = _doc_comment(p, len(p) - 1)
 
 def p_extends_from(p):
     '''extends_from : empty
@@ -602,6 +616,7 @@ def p_trait_statement(p):
                        | USE fully_qualified_class_name SEMI'''
     if len(p) == 9:
         p[0] = ast.Method(p[4], p[1], p[6], p[8], p[3], lineno=p.lineno(2))
+        _attach_doc_comment(p, 2)
     elif len(p) == 6:
         p[0] = ast.TraitUse(p[2], p[4], lineno=p.lineno(1))
     else:
@@ -609,6 +624,7 @@ def p_trait_statement(p):
             p[0] = ast.TraitUse(p[2], [], lineno=p.lineno(1))
         else:
             p[0] = ast.ClassVariables(p[1], p[2], lineno=p.lineno(3))
+            _attach_doc_comment(p, 2)
 
 def p_class_statement_list(p):
     '''class_statement_list : class_statement_list class_statement
@@ -627,6 +643,7 @@ def p_class_statement(p):
                        | USE fully_qualified_class_name SEMI'''
     if len(p) == 9:
         p[0] = ast.Method(p[4], p[1], p[6], p[8], p[3], lineno=p.lineno(2))
+        _attach_doc_comment(p, 2)
     elif len(p) == 6:
         p[0] = ast.TraitUse(p[2], p[4], lineno=p.lineno(1))
     elif len(p) == 4:
@@ -634,8 +651,10 @@ def p_class_statement(p):
             p[0] = ast.TraitUse(p[2], [], lineno=p.lineno(1))
         else:
             p[0] = ast.ClassVariables(p[1], p[2], lineno=p.lineno(3))
+            _attach_doc_comment(p, 2)
     else:
         p[0] = ast.ClassConstants(p[1], lineno=p.lineno(2))
+        _attach_doc_comment(p, 1)
 
 def p_class_variable_declaration_initial(p):
     '''class_variable_declaration : class_variable_declaration COMMA VARIABLE EQUALS static_scalar
@@ -644,6 +663,7 @@ def p_class_variable_declaration_initial(p):
         p[0] = p[1] + [ast.ClassVariable(p[3], p[5], lineno=p.lineno(2))]
     else:
         p[0] = [ast.ClassVariable(p[1], p[3], lineno=p.lineno(1))]
+    p.slice[0].doc_comment = _doc_comment(p, 1)
 
 def p_class_variable_declaration_no_initial(p):
     '''class_variable_declaration : class_variable_declaration COMMA VARIABLE
@@ -652,6 +672,7 @@ def p_class_variable_declaration_no_initial(p):
         p[0] = p[1] + [ast.ClassVariable(p[3], None, lineno=p.lineno(2))]
     else:
         p[0] = [ast.ClassVariable(p[1], None, lineno=p.lineno(1))]
+    p.slice[0].doc_comment = _doc_comment(p, 1)
 
 def p_class_constant_declaration(p):
     '''class_constant_declaration : class_constant_declaration COMMA STRING EQUALS static_expr
@@ -660,6 +681,7 @@ def p_class_constant_declaration(p):
         p[0] = p[1] + [ast.ClassConstant(p[3], p[5], lineno=p.lineno(2))]
     else:
         p[0] = [ast.ClassConstant(p[2], p[4], lineno=p.lineno(1))]
+    p.slice[0].doc_comment = _doc_comment(p, 1)
 
 def p_interface_list(p):
     '''interface_list : interface_list COMMA fully_qualified_class_name
@@ -1325,9 +1347,9 @@ def p_scalar_heredoc(p):
         # due to how lexer works, the last operation is joining an unnecessary
         # newline character
         assert isinstance(p[2].right, string_type)
-        p[2].right = p[2].right[:-1]
-        if p[2].right:
-            p[0] = p[2]
+        right = p[2].right[:-1]
+        if right:
+            p[0] = ast.BinaryOp('.', p[2].left, right, lineno=p[2].lineno)
         else:
             p[0] = p[2].left
     else:
@@ -1626,6 +1648,86 @@ def p_empty(p):
     'empty : '
     pass
 
+# Interpolated strings as flat InterpolatedString nodes, for parsers made
+# with interpolated_strings=True. These replace the actions of the
+# productions in _interpolated_actions; encaps_list is then a list of the
+# parts in order, which is built in linear time.
+
+def _encaps_list_flat(p):
+    # encaps_list : encaps_list encaps_var
+    #             | empty
+    if len(p) == 3:
+        p[1].append(p[2])
+        p[0] = p[1]
+    else:
+        p[0] = []
+
+def _encaps_list_string_flat(p):
+    # encaps_list : encaps_list ENCAPSED_AND_WHITESPACE
+    p[1].append(process_php_string_escapes(p[2]))
+    p[0] = p[1]
+
+def _string_parts(parts):
+    # join runs of strings; a string on its own is returned as it is
+    result = []
+    run = []
+    for part in parts:
+        if isinstance(part, string_type):
+            run.append(part)
+        else:
+            if run:
+                result.append(''.join(run))
+                run = []
+            result.append(part)
+    if run and ''.join(run):
+        result.append(''.join(run))
+    if not result:
+        return ''
+    if len(result) == 1 and isinstance(result[0], string_type):
+        return result[0]
+    return result
+
+def _scalar_flat(p):
+    # scalar : QUOTE encaps_list QUOTE
+    #        | STRING QUOTE encaps_list QUOTE
+    if len(p) == 5 and p[1] != 'b':
+        return
+    value = _string_parts(p[len(p) - 2])
+    if isinstance(value, list):
+        value = ast.InterpolatedString(value, lineno=p.lineno(len(p) - 3))
+    p[0] = value
+
+def _scalar_heredoc_flat(p):
+    # scalar_heredoc : START_HEREDOC encaps_list END_HEREDOC
+    parts = p[2]
+    if parts and isinstance(parts[-1], string_type):
+        # the newline before the closing label
+        parts[-1] = parts[-1][:-1]
+    value = _string_parts(parts)
+    if isinstance(value, list):
+        value = ast.InterpolatedString(value, lineno=p.lineno(1))
+    p[0] = value
+
+def _backtick_flat(p):
+    # function_call : BACKTICK encaps_list BACKTICK
+    value = _string_parts(p[2])
+    if isinstance(value, list):
+        value = ast.InterpolatedString(value, lineno=p.lineno(1))
+    p[0] = ast.FunctionCall('shell_exec', [ast.Parameter(value, False)],
+                            lineno=p.lineno(1))
+
+_interpolated_actions = {
+    'encaps_list -> encaps_list encaps_var': _encaps_list_flat,
+    'encaps_list -> empty': _encaps_list_flat,
+    'encaps_list -> encaps_list ENCAPSED_AND_WHITESPACE':
+        _encaps_list_string_flat,
+    'scalar -> QUOTE encaps_list QUOTE': _scalar_flat,
+    'scalar -> STRING QUOTE encaps_list QUOTE': _scalar_flat,
+    'scalar_heredoc -> START_HEREDOC encaps_list END_HEREDOC':
+        _scalar_heredoc_flat,
+    'function_call -> BACKTICK encaps_list BACKTICK': _backtick_flat,
+}
+
 # Error rule for syntax errors
 def p_error(t):
     if t:
@@ -1634,8 +1736,47 @@ def p_error(t):
         raise SyntaxError('unexpected EOF while parsing', (None, None, None, None))
 
 # Build the grammar
-def make_parser(debug=False):
-    return yacc.yacc(debug=debug)
+def make_parser(debug=False, spans=False, factory=None,
+                interpolated_strings=False):
+    """Build a parser. With spans, every node gets start_offset and
+    end_offset; see phply.spans.
+
+    With interpolated_strings, strings with variables in them become an
+    InterpolatedString whose parts are the strings and expressions in
+    order, rather than a left-deep chain of BinaryOp('.') nodes.
+    phpast.expand_interpolated_strings() turns them back into chains.
+
+    factory replaces phpast as the source of node classes: it is anything
+    with an attribute for every node type (a module, a class, an object),
+    e.g. to build slotted or tuple-based nodes directly. The classes are
+    called like phpast's, with the fields in order and lineno as a keyword,
+    and the parser uses isinstance() with them and reads some fields back
+    (left, right and lineno of BinaryOp, name of ForeachVariable). Doc
+    comments are set as a doc_comment attribute, and spans only on
+    phpast.Node instances."""
+    parser = yacc.yacc(debug=debug)
+    if interpolated_strings:
+        for production in parser.productions:
+            action = _interpolated_actions.get(production.str)
+            if action is not None:
+                production.callable = action
+    if factory is not None and factory is not ast:
+        _use_factory(parser, factory)
+    if spans:
+        from .spans import track_spans
+        track_spans(parser)
+    return parser
+
+def _use_factory(parser, factory):
+    # give the actions copies of this module's globals with factory as ast
+    namespace = dict(globals())
+    namespace['ast'] = factory
+    for production in parser.productions:
+        func = production.callable
+        if func is not None:
+            production.callable = types.FunctionType(
+                func.__code__, namespace, func.__name__, func.__defaults__,
+                func.__closure__)
 
 def main():
     import argparse
@@ -1649,7 +1790,9 @@ def main():
     args = ap.parse_args()
 
     if args.generate:
+        from .lalrgen import write_driver
         make_parser(args.debug)
+        write_driver()
         return
 
     parser = make_parser(args.debug)
@@ -0,0 +1,100 @@
+# ----------------------------------------------------------------------
+# project.py
+#
+# Helpers for working on whole trees of PHP files.
+# ----------------------------------------------------------------------
+
+import hashlib
+import io
+import multiprocessing
+import os
+
+from . import phplex
+from .phpparse import make_parser
+
+php_extensions = ('.php',)
+
+_parser = None
+
+def get_parser():
+    """Return a parser shared by everything running in this process."""
+    global _parser
+    if _parser is None:
+        _parser = make_parser()
+    return _parser
+
+def find_php_files(paths, extensions=php_extensions):
+    """Yield the PHP files found under the given files and directories."""
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(extensions):
+                    yield os.path.join(root, name)
+
+def read_source(path):
+    # surrogateescape keeps files in legacy encodings round-trippable
+    with io.open(path, 'r', encoding='utf-8', errors='surrogateescape',
+                 newline='') as f:
+        return f.read()
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def parse_source(source, filename=None, parser=None, doc_comments=False):
+    """Parse PHP source. With doc_comments, declarations get the doc comment
+    written before them as their doc_comment attribute."""
+    lexer = phplex.FilteredLexer(phplex.new_lexer(), doc_comments)
+    lexer.filename = filename
+    return (parser or get_parser()).parse(source, lexer=lexer)
+
+def parse_file(path, parser=None, doc_comments=False):
+    return parse_source(read_source(path), os.path.abspath(path), parser,
+                        doc_comments)
+
+def changed_files(paths, known):
+    """Compare the PHP files under paths with previously recorded ones.
+
+    known maps absolute paths to tuples starting with (mtime, size). Returns
+    a dict of the entries that are still current and a list of
+    (path, mtime, size) for files that are new or have changed. Files that
+    disappeared are in neither."""
+    current = {}
+    changed = []
+    for path in find_php_files(paths):
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        previous = known.get(path)
+        if previous and previous[0] == st.st_mtime and \
+           previous[1] == st.st_size:
+            current[path] = previous
+        else:
+            changed.append((path, st.st_mtime, st.st_size))
+    return current, changed
+
+def map_files(func, paths, processes=None, chunksize=16):
+    """Apply func to every path, using a process pool unless processes is 1.
+
+    Results are yielded as they become available, so the order is not
+    guaranteed to match the order of paths."""
+    paths = list(paths)
+    if processes == 1 or len(paths) <= 1:
+        for path in paths:
+            yield func(path)
+        return
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(func, paths, chunksize):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
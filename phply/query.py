@@ -0,0 +1,387 @@
+# ----------------------------------------------------------------------
+# query.py
+#
+# Pattern queries over ASTs, e.g.
+#
+#   MethodCall[name="query"][params.0.node=BinaryOp[op="."]]
+#
+# A pattern starts with one or more node types separated by `|` (or `*`
+# for any node), followed by any number of conditions:
+#
+#   [path]           the field is set (not None, empty or false)
+#   [path=value]     the field equals value, or matches a nested pattern
+#   [path!=value]    the opposite
+#   [path~="regex"]  the field is a string matching the regular expression
+#   :has(pattern)    some node below this one matches pattern
+#   :not(pattern)    this node does not match pattern
+#
+# Paths are field names and list indexes separated by dots, and values are
+# quoted strings, numbers, true, false, null, patterns or bare words.
+# ----------------------------------------------------------------------
+
+import array
+import collections
+import functools
+import re
+import sys
+import threading
+
+from . import phpast as ast
+from . import project
+
+if sys.version_info[0] == 3:
+    string_type = str
+else:
+    string_type = basestring
+
+
+class PatternError(Exception):
+    pass
+
+_token_re = re.compile(r'''
+    \s*(?:
+      (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+    | (?P<number>-?\d+(?:\.\d+)?)
+    | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+    | (?P<op>!=|~=|:has\(|:not\(|[\[\]()|.=*])
+    )''', re.VERBOSE)
+
+_literals = {'true': True, 'false': False, 'null': None}
+
+_missing = object()
+
+def _is_node_type(name):
+    cls = getattr(ast, name, None)
+    return isinstance(cls, type) and issubclass(cls, ast.Node) and \
+        cls is not ast.Node
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = _token_re.match(text, pos)
+        if m is None or m.end() == pos:
+            raise PatternError('unexpected %r at position %d in pattern'
+                               % (text[pos:pos + 10].strip(), pos))
+        kind = m.lastgroup
+        value = m.group(kind)
+        if kind == 'string':
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+        elif kind == 'number':
+            value = float(value) if '.' in value else int(value)
+        tokens.append((kind, value))
+        pos = m.end()
+    tokens.append(('end', None))
+    return tokens
+
+
+class _Parser(object):
+    # recursive descent over the token list; patterns are short, so the
+    # recursion depth is bounded by how deeply the user nests them
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = _tokenize(text)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos]
+
+    def next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def expect(self, value):
+        kind, got = self.next()
+        if got != value or kind not in ('op', 'name'):
+            raise PatternError('expected %r in pattern %r' % (value, self.text))
+
+    def parse(self):
+        pattern = self.pattern()
+        if self.peek()[0] != 'end':
+            raise PatternError('trailing %r in pattern %r'
+                               % (self.peek()[1], self.text))
+        return pattern
+
+    def pattern(self):
+        types = self.types()
+        tests = []
+        while True:
+            kind, value = self.peek()
+            if value == '[' and kind == 'op':
+                self.next()
+                tests.append(self.condition(types))
+                self.expect(']')
+            elif value in (':has(', ':not(') and kind == 'op':
+                self.next()
+                inner = self.pattern()
+                self.expect(')')
+                tests.append(_has(inner) if value == ':has(' else _not(inner))
+            else:
+                break
+        return Pattern(self.text, types, tests)
+
+    def types(self):
+        kind, value = self.next()
+        if kind == 'op' and value == '*':
+            return None
+        types = []
+        while True:
+            if kind != 'name':
+                raise PatternError('expected a node type in pattern %r'
+                                   % self.text)
+            if not _is_node_type(value):
+                raise PatternError('unknown node type %r' % value)
+            types.append(getattr(ast, value))
+            if self.peek() != ('op', '|'):
+                return tuple(types)
+            self.next()
+            kind, value = self.next()
+
+    def path(self, types):
+        path = []
+        while True:
+            kind, value = self.next()
+            if kind == 'name' or (kind == 'number' and isinstance(value, int)):
+                path.append(value)
+            else:
+                raise PatternError('expected a field name in pattern %r'
+                                   % self.text)
+            if self.peek() != ('op', '.'):
+                break
+            self.next()
+        if types is not None and isinstance(path[0], string_type) and \
+           not any(path[0] in cls.fields for cls in types):
+            raise PatternError('%s has no field %r' % (
+                '|'.join(cls.__name__ for cls in types), path[0]))
+        return tuple(path)
+
+    def condition(self, types):
+        get = _getter(self.path(types))
+        kind, op = self.peek()
+        if kind != 'op' or op not in ('=', '!=', '~='):
+            return lambda node: bool(get(node) not in (_missing, None, False,
+                                                       '', []))
+        self.next()
+        if op == '~=':
+            kind, value = self.next()
+            if kind != 'string':
+                raise PatternError('~= needs a quoted regular expression')
+            try:
+                search = re.compile(value).search
+            except re.error as e:
+                raise PatternError('bad regular expression %r: %s'
+                                   % (value, e))
+            def test(node):
+                value = get(node)
+                return isinstance(value, string_type) and \
+                    search(value) is not None
+            return test
+        kind, value = self.peek()
+        if kind == 'name' and _is_node_type(value) or \
+           (kind, value) == ('op', '*'):
+            inner = self.pattern()
+            test = lambda node: inner.match(get(node))
+        else:
+            self.next()
+            if kind == 'name':
+                # bare words other than node types are plain strings
+                value = _literals.get(value, value)
+            elif kind not in ('string', 'number'):
+                raise PatternError('expected a value in pattern %r' % self.text)
+            test = _equals(get, value)
+        if op == '!=':
+            return lambda node: not test(node)
+        return test
+
+def _getter(path):
+    if len(path) == 1 and isinstance(path[0], string_type):
+        # the common case of a plain field
+        field = path[0]
+        return lambda node: getattr(node, field) \
+            if field in node.fields else _missing
+    def get(node):
+        for step in path:
+            if isinstance(step, int):
+                if not isinstance(node, list) or not -len(node) <= step < len(node):
+                    return _missing
+                node = node[step]
+            elif isinstance(node, ast.Node) and step in node.fields:
+                node = getattr(node, step)
+            else:
+                return _missing
+        return node
+    return get
+
+def _equals(get, expected):
+    if isinstance(expected, bool) or expected is None:
+        return lambda node: get(node) is expected
+    def test(node):
+        value = get(node)
+        return not isinstance(value, (bool, ast.Node)) and value == expected
+    return test
+
+def _has(pattern):
+    def test(node):
+        for child in _descendants(node):
+            if pattern.match(child):
+                return True
+        return False
+    return test
+
+def _not(pattern):
+    return lambda node: not pattern.match(node)
+
+def _descendants(node):
+    stack = [getattr(node, field) for field in reversed(node.fields)]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, list):
+            stack.extend(reversed(value))
+        elif isinstance(value, ast.Node):
+            yield value
+            stack.extend(getattr(value, field)
+                         for field in reversed(value.fields))
+
+
+class Pattern(object):
+    """A compiled pattern. types is a tuple of node classes, or None when
+    the pattern matches nodes of any type."""
+
+    def __init__(self, text, types, tests):
+        self.text = text
+        self.types = types
+        self.tests = tests
+        classes = frozenset(types or ())
+        if types is None:
+            if not tests:
+                self.match = lambda node: isinstance(node, ast.Node)
+            else:
+                self.match = lambda node: isinstance(node, ast.Node) and \
+                    all(test(node) for test in tests)
+        elif len(tests) == 1:
+            test = tests[0]
+            self.match = lambda node: node.__class__ in classes and test(node)
+        else:
+            self.match = lambda node: node.__class__ in classes and \
+                all(test(node) for test in tests)
+
+    def __repr__(self):
+        return 'Pattern(%r)' % self.text
+
+    def search(self, nodes):
+        """Return the matching nodes in document order. nodes is a list of
+        nodes or a NodeIndex of them."""
+        if not isinstance(nodes, NodeIndex):
+            nodes = NodeIndex(nodes)
+        match = self.match
+        return [node for node in nodes.candidates(self.types) if match(node)]
+
+class PatternCache(object):
+    """Compiled patterns by their text, keeping the size most recently
+    used ones."""
+
+    def __init__(self, compile, size=256):
+        self.compile = compile
+        self.size = size
+        self._patterns = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def get(self, text):
+        with self._lock:
+            pattern = self._patterns.pop(text, None)
+        if pattern is None:
+            pattern = self.compile(text)
+        with self._lock:
+            self._patterns[text] = pattern
+            while len(self._patterns) > self.size:
+                self._patterns.popitem(last=False)
+        return pattern
+
+_patterns = PatternCache(lambda text: _Parser(text).parse())
+
+def compile_pattern(text):
+    """Compile a pattern, reusing recent compilations of the same text."""
+    return _patterns.get(text)
+
+
+class NodeIndex(object):
+    """Every node of a tree in document order, and the positions of the
+    nodes of each type, so that a query for a rare node type only looks at
+    the few candidates it could match."""
+
+    def __init__(self, nodes):
+        self.roots = nodes
+        self.nodes = []
+        self.by_type = {}
+        stack = list(reversed(nodes))
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(reversed(node))
+                continue
+            if not isinstance(node, ast.Node):
+                continue
+            positions = self.by_type.get(node.__class__)
+            if positions is None:
+                positions = self.by_type[node.__class__] = array.array('i')
+            positions.append(len(self.nodes))
+            self.nodes.append(node)
+            stack.extend(getattr(node, field)
+                         for field in reversed(node.fields))
+
+    def count(self, cls):
+        return len(self.by_type.get(cls, ()))
+
+    def candidates(self, types):
+        if types is None:
+            return self.nodes
+        lists = [self.by_type[cls] for cls in types if cls in self.by_type]
+        if len(lists) == 1:
+            positions = lists[0]
+        else:
+            positions = sorted(p for positions in lists for p in positions)
+        return [self.nodes[p] for p in positions]
+
+def query(pattern, nodes):
+    """Return the nodes in a tree matching a pattern string."""
+    return compile_pattern(pattern).search(nodes)
+
+def _search_file(pattern, path):
+    try:
+        return path, query(pattern, project.parse_file(path)), None
+    except (SyntaxError, RuntimeError) as e:
+        return path, None, '%s: %s' % (e.__class__.__name__, e)
+
+def search_files(pattern, paths, processes=None):
+    """Run a query over the PHP files under paths, yielding
+    (path, matches, error) as each file is done."""
+    compile_pattern(pattern)
+    return project.map_files(functools.partial(_search_file, pattern),
+                             project.find_php_files(paths), processes)
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Search PHP files with AST patterns")
+    ap.add_argument('-j', '--jobs', dest='jobs', type=int, default=None)
+    ap.add_argument('pattern', metavar='PATTERN')
+    ap.add_argument('paths', metavar='PATH', nargs='+')
+    args = ap.parse_args()
+
+    try:
+        compile_pattern(args.pattern)
+    except PatternError as e:
+        ap.error(str(e))
+    for path, matches, error in search_files(args.pattern, args.paths,
+                                             args.jobs):
+        if error is not None:
+            sys.stderr.write('%s: %s\n' % (path, error))
+            continue
+        for node in matches:
+            print('%s:%s: %s' % (path, node.lineno, node.__class__.__name__))
@@ -0,0 +1,188 @@
+# ----------------------------------------------------------------------
+# relex.py
+#
+# Incremental relexing. The token stream of a file is kept together with
+# periodic checkpoints of the lexer's state, so that after an edit
+# lexing can restart shortly before it and stop as soon as it is back in
+# step with the old tokens.
+# ----------------------------------------------------------------------
+
+import bisect
+import collections
+
+from . import phplex
+
+# everything that decides how the rest of a file is lexed, apart from the
+# position and line number
+LexerState = collections.namedtuple('LexerState', ['state', 'stack',
+                                                   'heredoc_label',
+                                                   'nowdoc_label'])
+
+# the lexer before the token at index; position and lineno are the
+# token's
+Checkpoint = collections.namedtuple('Checkpoint', ['index', 'position',
+                                                   'lineno', 'state'])
+
+# the most characters past the end of its text that any token rule looks
+# at, e.g. the `(?![?%]>)` in comments
+_lookahead = 2
+
+
+def save_state(lexer):
+    return LexerState(lexer.lexstate, tuple(lexer.lexstatestack),
+                      getattr(lexer, 'heredoc_label', None),
+                      getattr(lexer, 'nowdoc_label', None))
+
+def restore_state(lexer, state, position, lineno):
+    lexer.begin(state.state)
+    lexer.lexstatestack = list(state.stack)
+    for name in ('heredoc_label', 'nowdoc_label'):
+        value = getattr(state, name)
+        if value is not None:
+            setattr(lexer, name, value)
+        elif hasattr(lexer, name):
+            delattr(lexer, name)
+    lexer.lexpos = position
+    lexer.lineno = lineno
+
+
+class TokenStream(object):
+    """The raw tokens of a source (whitespace and comments included),
+    kept up to date under edits.
+
+    Every `interval` tokens, the lexer state before the next token is
+    saved as a Checkpoint. edit() restarts the lexer at the last
+    checkpoint safely before the edit and lexes until it reaches an old
+    checkpoint past the edit at the same place in the text and in the
+    same state; from there on the old tokens are reused.
+
+    A `/*` that is never closed lexes as a division and a multiplication
+    (or `*=`), and would become a comment if a later edit closed it; a `/**/` is a
+    comment that would become a doc comment running on to a later `*/`.
+    Such places are remembered so that lexing restarts before them."""
+
+    def __init__(self, source, interval=32):
+        self.interval = interval
+        self.source = None
+        self.tokens = None
+        self._relex_all(source)
+
+    def _lex(self, source, checkpoint, stop):
+        # Lex from a checkpoint, taking new checkpoints along the way.
+        # stop(lexer) is called before each token and returns the index of
+        # an old checkpoint to resume at, or None to carry on.
+        lexer = phplex.new_lexer()
+        lexer.input(source)
+        restore_state(lexer, checkpoint.state, checkpoint.position,
+                      checkpoint.lineno)
+        tokens = []
+        checkpoints = []
+        while True:
+            if tokens:
+                resume = stop(lexer)
+                if resume is not None:
+                    return tokens, checkpoints, resume
+            if len(tokens) % self.interval == 0:
+                checkpoints.append(Checkpoint(
+                    checkpoint.index + len(tokens), lexer.lexpos,
+                    lexer.lineno, save_state(lexer)))
+            t = lexer.token()
+            if t is None:
+                return tokens, checkpoints, None
+            tokens.append(t)
+
+    def _relex_all(self, source):
+        start = Checkpoint(0, 0, 1, LexerState('INITIAL', (), None, None))
+        self.source = source
+        self.tokens = None
+        tokens, checkpoints, _ = self._lex(source, start, lambda lexer: None)
+        self.tokens = tokens
+        self.checkpoints = checkpoints
+        self.unclosed = _unclosed_comments(tokens)
+
+    def edit(self, start, end, text):
+        """Replace source[start:end] with text. Returns
+        (index, count, tokens): the old tokens[index:index + count] were
+        replaced by the new tokens. If the new source can not be lexed,
+        the lexer's error is raised and the next edit relexes the whole
+        source."""
+        old = self.source
+        source = old[:start] + text + old[end:]
+        if self.tokens is None:
+            self._relex_all(source)
+            return 0, 0, list(self.tokens)
+        offset = len(text) - (end - start)
+        lines = text.count('\n') - old.count('\n', start, end)
+
+        # restart safely before the edit and any unclosed comment that it
+        # could close
+        limit = start - _lookahead
+        if self.unclosed and self.unclosed[0] <= limit:
+            limit = self.unclosed[0] - _lookahead
+        positions = [checkpoint.position for checkpoint in self.checkpoints]
+        c = max(bisect.bisect_right(positions, limit) - 1, 0)
+        restart = self.checkpoints[c]
+
+        edited = start + len(text)
+        def stop(lexer):
+            position = lexer.lexpos - offset
+            if lexer.lexpos <= edited:
+                return None
+            k = bisect.bisect_left(positions, position)
+            if k == len(positions) or positions[k] != position:
+                return None
+            if save_state(lexer) != self.checkpoints[k].state:
+                return None
+            return k
+
+        try:
+            tokens, checkpoints, resume = self._lex(source, restart, stop)
+        except Exception:
+            self.source = source
+            self.tokens = None
+            raise
+
+        if resume is None:
+            last = len(self.tokens)
+            kept = []
+        else:
+            last = self.checkpoints[resume].index
+            kept = self.checkpoints[resume:]
+        first = restart.index
+        shift = len(tokens) - (last - first)
+        for t in self.tokens[last:]:
+            t.lexpos += offset
+            t.lineno += lines
+        self.checkpoints = self.checkpoints[:c] + checkpoints + [
+            Checkpoint(checkpoint.index + shift, checkpoint.position + offset,
+                       checkpoint.lineno + lines, checkpoint.state)
+            for checkpoint in kept]
+        old_tokens = self.tokens[first:last]
+        self.tokens[first:last] = tokens
+        self.source = source
+        self.unclosed = _unclosed_comments(self.tokens) if self.unclosed or \
+            _unclosed_comments(tokens) else []
+
+        # report only the tokens that really changed
+        i = 0
+        while i < len(tokens) and i < len(old_tokens) and \
+                _same(tokens[i], old_tokens[i], 0):
+            i += 1
+        j = 0
+        while j < len(tokens) - i and j < len(old_tokens) - i and \
+                _same(tokens[-1 - j], old_tokens[-1 - j], offset):
+            j += 1
+        return first + i, len(old_tokens) - i - j, \
+            tokens[i:len(tokens) - j]
+
+def _same(new, old, offset):
+    return new.type == old.type and new.value == old.value and \
+        new.lexpos == old.lexpos + offset
+
+def _unclosed_comments(tokens):
+    # positions of `/*` lexed as two tokens because nothing closes them,
+    # and of `/**/`, the start of a doc comment if anything closes it
+    return [t.lexpos for t, u in zip(tokens, tokens[1:] + [None])
+            if t.type == 'DIV' and u is not None and
+            u.type in ('MUL', 'MUL_EQUAL') and u.lexpos == t.lexpos + 1 or
+            t.type == 'COMMENT' and t.value == '/**/']
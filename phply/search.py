@@ -0,0 +1,320 @@
+# ----------------------------------------------------------------------
+# search.py
+#
+# Code search with PHP snippets as patterns, e.g.
+#
+#   $X->query($Y . $Z)
+#
+# Patterns are parsed with the PHP grammar and matched structurally.
+# Variables named in capitals ($X, $QUERY, $ARG_1) are metavariables: they
+# match any expression or name, and every occurrence of the same
+# metavariable must match the same thing. `...` stands for any number of
+# arguments, array elements or parameters; write `...;` for any number of
+# statements. Patterns of several statements match consecutive statements
+# of any block.
+#
+# Files are only parsed when their tokens contain every identifier of the
+# pattern. The identifiers of each file can be cached on disk.
+# ----------------------------------------------------------------------
+
+import functools
+import json
+import os
+import re
+import sys
+
+from . import phpast as ast
+from . import phplex
+from . import project
+from .query import NodeIndex, PatternCache, PatternError
+
+if sys.version_info[0] == 3:
+    string_type = str
+else:
+    string_type = basestring
+
+cache_version = 1
+
+_metavariable_re = re.compile(r'\$[A-Z][A-Z0-9_]*$')
+_ellipsis = '__phply_ellipsis__'
+# call-like nodes whose names PHP looks up case-insensitively
+_case_insensitive = (ast.FunctionCall, ast.MethodCall, ast.StaticMethodCall,
+                     ast.New)
+
+
+def is_metavariable(node):
+    return isinstance(node, ast.Variable) and \
+        isinstance(node.name, string_type) and \
+        _metavariable_re.match(node.name) is not None
+
+def _is_ellipsis(node):
+    if isinstance(node, ast.Parameter):
+        node = node.node
+    elif isinstance(node, ast.ArrayElement) and node.key is None:
+        node = node.value
+    return isinstance(node, ast.FunctionCall) and node.name == _ellipsis
+
+def identifiers(source):
+    """Return the lowercased identifiers and variable names in the tokens
+    of some PHP source, or None if it can not be tokenized."""
+    lexer = phplex.new_lexer()
+    lexer.input(source)
+    result = set()
+    try:
+        for token in lexer:
+            if token.type in ('STRING', 'VARIABLE'):
+                result.add(token.value.lower())
+    except SyntaxError:
+        return None
+    return result
+
+
+class Match(object):
+    """A match of a pattern. nodes are the matched statements for patterns
+    of several statements, or a single matched node."""
+
+    __slots__ = ('nodes', 'bindings')
+
+    def __init__(self, nodes, bindings):
+        self.nodes = nodes
+        self.bindings = bindings
+
+    @property
+    def lineno(self):
+        return self.nodes[0].lineno
+
+    def __repr__(self):
+        return 'Match(%r, %r)' % (self.nodes, self.bindings)
+
+
+class SearchPattern(object):
+
+    def __init__(self, text):
+        self.text = text
+        source = text.replace('...', _ellipsis + '()')
+        if not source.rstrip().endswith((';', '}')):
+            source += ';'
+        try:
+            self.nodes = project.parse_source('<?php ' + source)
+        except SyntaxError as e:
+            raise PatternError('invalid pattern %r: %s' % (text, e))
+        if not self.nodes:
+            raise PatternError('empty pattern')
+        lexer = phplex.new_lexer()
+        lexer.input('<?php ' + text)
+        self.identifiers = frozenset(
+            token.value.lower() for token in lexer
+            if token.type == 'STRING' or token.type == 'VARIABLE' and
+            not _metavariable_re.match(token.value))
+
+    def __repr__(self):
+        return 'SearchPattern(%r)' % self.text
+
+    def match(self, node):
+        """Return the bindings of metavariables if node matches this
+        single-node pattern, or None."""
+        bindings = {}
+        if _match(self.nodes[0], node, bindings):
+            return bindings
+        return None
+
+    def search(self, nodes):
+        """Return the Matches in a tree, in document order."""
+        if not isinstance(nodes, NodeIndex):
+            nodes = NodeIndex(nodes)
+        if len(self.nodes) > 1 or _is_ellipsis(self.nodes[0]):
+            return self._search_sequence(nodes)
+        root = self.nodes[0]
+        types = None if is_metavariable(root) else (root.__class__,)
+        result = []
+        for node in nodes.candidates(types):
+            bindings = {}
+            if _match(root, node, bindings):
+                result.append(Match([node], bindings))
+        return result
+
+    def _search_sequence(self, index):
+        result = []
+        # the top-level statements, then every list of statements in the tree
+        lists = [index.roots]
+        for node in index.nodes:
+            for field in node.fields:
+                value = getattr(node, field)
+                if isinstance(value, list) and value and \
+                   isinstance(value[0], ast.Node):
+                    lists.append(value)
+        for statements in lists:
+            for start in range(len(statements)):
+                bindings = {}
+                end = _match_list(self.nodes, 0, statements, start, bindings,
+                                  False)
+                if end is not None and end > start:
+                    result.append(Match(statements[start:end], bindings))
+        return result
+
+def _bind(name, value, bindings):
+    try:
+        bound = bindings[name]
+    except KeyError:
+        bindings[name] = value
+        return True
+    if isinstance(bound, string_type) and isinstance(value, string_type):
+        return bound.lower() == value.lower()
+    return bound == value
+
+def _match(pattern, value, bindings):
+    if is_metavariable(pattern):
+        return _bind(pattern.name, value, bindings)
+    if isinstance(pattern, string_type) and _metavariable_re.match(pattern):
+        # parameter and closure variable names are plain strings
+        return _bind(pattern, value, bindings)
+    if isinstance(pattern, ast.Node):
+        if pattern.__class__ is not value.__class__:
+            return False
+        for field in pattern.fields:
+            expected = getattr(pattern, field)
+            actual = getattr(value, field)
+            if field == 'name' and isinstance(pattern, _case_insensitive) and \
+               isinstance(expected, string_type) and \
+               isinstance(actual, string_type):
+                if expected.lower() != actual.lower():
+                    return False
+            elif not _match(expected, actual, bindings):
+                return False
+        return True
+    if isinstance(pattern, list):
+        return isinstance(value, list) and \
+            _match_list(pattern, 0, value, 0, bindings, True) is not None
+    return pattern == value and not isinstance(value, ast.Node)
+
+def _match_list(patterns, i, values, j, bindings, whole):
+    # Match patterns[i:] against values[j:], returning the index just past
+    # the last matched value or None. Unless whole is set, the values may
+    # continue after the match. Recursion is bounded by the pattern length.
+    if i == len(patterns):
+        return j if not whole or j == len(values) else None
+    if _is_ellipsis(patterns[i]):
+        for k in range(j, len(values) + 1):
+            trial = dict(bindings)
+            end = _match_list(patterns, i + 1, values, k, trial, whole)
+            if end is not None:
+                bindings.update(trial)
+                return end
+        return None
+    if j == len(values) or not _match(patterns[i], values[j], bindings):
+        return None
+    return _match_list(patterns, i + 1, values, j + 1, bindings, whole)
+
+_patterns = PatternCache(SearchPattern)
+
+def compile_search(text):
+    return _patterns.get(text)
+
+
+def _file_identifiers(path):
+    found = identifiers(project.read_source(path))
+    return path, sorted(found) if found is not None else None
+
+
+class IdentifierCache(object):
+    """The identifiers of each file under some roots, used to skip files
+    that can not match a pattern without parsing them.
+
+    files maps paths to (mtime, size, identifiers), where identifiers is a
+    frozenset, or None for files that could not be tokenized. With a path,
+    the sets are loaded from and saved to a JSON file."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.files = {}
+        if path is not None:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return
+        if data.get('version') != cache_version:
+            return
+        self.files = dict(
+            (path, (mtime, size, frozenset(words) if words is not None
+                    else None))
+            for path, mtime, size, words in data['files'])
+
+    def save(self):
+        data = {
+            'version': cache_version,
+            'files': [(path, mtime, size, sorted(words) if words is not None
+                       else None)
+                      for path, (mtime, size, words)
+                      in sorted(self.files.items())],
+        }
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp, self.path)
+
+    def update(self, paths, processes=None):
+        """Tokenize new and changed files under paths. Returns the number of
+        files that were tokenized."""
+        if isinstance(paths, string_type):
+            paths = [paths]
+        current, changed = project.changed_files(paths, self.files)
+        sizes = dict((path, (mtime, size)) for path, mtime, size in changed)
+        for path, words in project.map_files(_file_identifiers, sorted(sizes),
+                                             processes):
+            current[path] = sizes[path] + (
+                frozenset(words) if words is not None else None,)
+        self.files = current
+        if changed and self.path is not None:
+            self.save()
+        return len(changed)
+
+    def candidates(self, required):
+        """Paths of the files containing every identifier in required."""
+        return [path for path in sorted(self.files)
+                if self.files[path][2] is None or
+                required <= self.files[path][2]]
+
+def _search_file(text, path):
+    try:
+        nodes = project.parse_file(path)
+        return path, compile_search(text).search(nodes), None
+    except (SyntaxError, RuntimeError) as e:
+        return path, None, '%s: %s' % (e.__class__.__name__, e)
+
+def search_files(text, paths, cache=None, processes=None):
+    """Search the PHP files under paths for a pattern, yielding
+    (path, matches, error) for each file that may contain a match. cache
+    names a file to keep identifier sets in between runs."""
+    pattern = compile_search(text)
+    index = IdentifierCache(cache)
+    index.update(paths, processes)
+    return project.map_files(functools.partial(_search_file, text),
+                             index.candidates(pattern.identifiers), processes)
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Search PHP files with code patterns")
+    ap.add_argument('-c', '--cache', dest='cache', default=None)
+    ap.add_argument('-j', '--jobs', dest='jobs', type=int, default=None)
+    ap.add_argument('pattern', metavar='PATTERN')
+    ap.add_argument('paths', metavar='PATH', nargs='+')
+    args = ap.parse_args()
+
+    try:
+        compile_search(args.pattern)
+    except PatternError as e:
+        ap.error(str(e))
+    for path, matches, error in search_files(args.pattern, args.paths,
+                                             args.cache, args.jobs):
+        if error is not None:
+            sys.stderr.write('%s: %s\n' % (path, error))
+            continue
+        for match in matches:
+            bindings = ', '.join('%s=%r' % item
+                                 for item in sorted(match.bindings.items()))
+            print('%s:%s: %s' % (path, match.lineno, bindings))
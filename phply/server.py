@@ -0,0 +1,635 @@
+# ----------------------------------------------------------------------
+# server.py
+#
+# A long-running parse service on a Unix socket. Worker processes keep
+# a parser warm and do the parsing, so one source that crashes or bloats
+# a worker costs a restart of that worker, not the service.
+#
+# Messages are JSON objects, each sent as a 4-byte big-endian length and
+# that many bytes of UTF-8:
+#
+#   {"id": 1, "method": "parse", "params": {"source": "<?php ..."}}
+#   {"id": 1, "result": [...]}
+#   {"id": 1, "error": {"type": "SyntaxError", "message": "..."}}
+#
+# Methods are parse (the tree as phpast.to_generic exports it), lex
+# (tokens as [type, value, lineno, lexpos]), outline (definitions as
+# symbolindex.extract_symbols finds them) and stats. Their params are
+# either source or path, and optionally filename, a budget (the
+# arguments of budget.Budget other than cancel, each no higher than the
+# server's own limit), and for parse doc_comments and with_lineno (true
+# by default). Requests on one connection may be answered out of order.
+#
+# Anyone who can connect can make the server read any file it can read,
+# so the socket is only accessible to its owner by default, and path
+# requests can be kept to the files under a root directory.
+# ----------------------------------------------------------------------
+
+import json
+import multiprocessing
+import numbers
+import os
+import resource
+import signal
+import socket
+import struct
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from . import budget
+from . import phpast as ast
+from . import phplex
+from . import project
+from .phpparse import make_parser
+from .symbolindex import extract_symbols
+
+if sys.version_info[0] == 3:
+    string_type = str
+else:
+    string_type = basestring
+
+_header = struct.Struct('>I')
+
+max_message = 256 << 20
+
+methods = ('parse', 'lex', 'outline')
+
+_budget_args = ('max_size', 'max_tokens', 'max_nodes', 'max_depth', 'timeout',
+                'deadline', 'check_every')
+
+
+class ServerError(Exception):
+    """An error answered by the server. type is the name of the exception
+    raised in the worker (or WorkerCrashed, WorkerTimeout, ValueError for
+    bad requests), data the whole error object."""
+
+    def __init__(self, data):
+        Exception.__init__(self, '%s: %s' % (data.get('type'),
+                                             data.get('message')))
+        self.type = data.get('type')
+        self.data = data
+
+
+def write_message(sock, message):
+    data = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    sock.sendall(_header.pack(len(data)) + data)
+
+def _read_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+def read_message(sock):
+    """Return the next message, or None when the other end has closed the
+    connection."""
+    header = _read_exactly(sock, _header.size)
+    if header is None:
+        return None
+    size, = _header.unpack(header)
+    if size > max_message:
+        raise ValueError('message of %d bytes is too large' % size)
+    data = _read_exactly(sock, size)
+    if data is None:
+        return None
+    return json.loads(data.decode('utf-8'))
+
+# ----------------------------------------------------------------------
+# Worker processes
+# ----------------------------------------------------------------------
+
+def _memory():
+    # peak resident size of this process in bytes
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def _make_budget(params):
+    args = params.get('budget') or {}
+    for name in args:
+        if name not in _budget_args:
+            raise ValueError('unknown budget limit %r' % name)
+    return budget.Budget(**args)
+
+def _source(params):
+    if params.get('source') is not None:
+        return params['source'], params.get('filename')
+    path = params.get('path')
+    if path is None:
+        raise ValueError('either source or path is required')
+    return project.read_source(path), params.get('filename') or path
+
+def _lex(params):
+    source, filename = _source(params)
+    lexer = budget.LimitedLexer(phplex.new_lexer(), _make_budget(params))
+    lexer.input(source)
+    return [[t.type, t.value, t.lineno, t.lexpos]
+            for t in iter(lexer.next_lexer_token, None)]
+
+def _handle(parser, method, params):
+    try:
+        if method == 'lex':
+            return {'result': _lex(params)}
+        source, filename = _source(params)
+        nodes = budget.parse(source, _make_budget(params), filename,
+                             params.get('doc_comments', False), parser)
+        if method == 'outline':
+            return {'result': [list(symbol)
+                               for symbol in extract_symbols(nodes)]}
+        return {'result': ast.to_generic(nodes,
+                                         params.get('with_lineno', True))}
+    except budget.BudgetExceeded as e:
+        return {'error': {'type': 'BudgetExceeded', 'message': str(e),
+                          'limit': e.limit, 'stats': e.stats._asdict()}}
+    except Exception as e:
+        # anything the input can make the parser raise, including lexer
+        # errors and recursion limits, goes back to the client
+        return {'error': {'type': e.__class__.__name__, 'message': str(e)}}
+
+def _worker(conn, max_memory):
+    # the server sees to interrupts and stops its workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    parser = budget.limit_parser(make_parser())
+    # ready; the server's timeouts do not count the time to get here
+    conn.send(None)
+    while True:
+        try:
+            batch = conn.recv()
+        except EOFError:
+            break
+        if batch is None:
+            break
+        results = [_handle(parser, method, params) for method, params in batch]
+        # a worker that has grown too large answers and then retires
+        retire = max_memory is not None and _memory() > max_memory
+        conn.send((results, retire))
+        if retire:
+            break
+    conn.close()
+
+
+class _WorkerLost(Exception):
+    pass
+
+
+class Worker(object):
+    """One worker process and the pipe to it."""
+
+    def __init__(self, max_memory=None):
+        self.max_memory = max_memory
+        self.restarts = -1
+        self.start()
+
+    def start(self):
+        self.restarts += 1
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_worker, args=(child, self.max_memory))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+        try:
+            self.conn.recv()
+        except EOFError:
+            # died starting; the next run() starts it again
+            pass
+
+    def run(self, batch, timeout=None):
+        """Return the answers to a list of (method, params), raising
+        _WorkerLost if the worker dies or takes longer than timeout. The
+        worker is restarted when needed."""
+        if not self.process.is_alive():
+            # died while idle
+            self.restart()
+        try:
+            self.conn.send(batch)
+            if timeout is not None and not self.conn.poll(timeout):
+                self.restart()
+                raise _WorkerLost('WorkerTimeout')
+            results, retire = self.conn.recv()
+        except (EOFError, IOError, OSError):
+            self.restart()
+            raise _WorkerLost('WorkerCrashed')
+        if retire:
+            self.stop()
+            self.start()
+        return results
+
+    def restart(self):
+        self.conn.close()
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.start()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (IOError, OSError):
+            pass
+        self.conn.close()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+# ----------------------------------------------------------------------
+# The server
+# ----------------------------------------------------------------------
+
+class _Request(object):
+    __slots__ = ('client', 'id', 'method', 'params', 'weight')
+
+    def __init__(self, client, id, method, params, weight):
+        self.client = client
+        self.id = id
+        self.method = method
+        self.params = params
+        self.weight = weight
+
+
+class _Client(object):
+    # a connection, written to by whichever worker thread has an answer
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+
+    def answer(self, id, answer):
+        answer['id'] = id
+        with self.lock:
+            try:
+                write_message(self.sock, answer)
+            except (IOError, OSError):
+                # gone; its reader thread cleans up
+                pass
+
+
+class Server(object):
+    """Serves parse requests on the Unix socket at path.
+
+    workers is the number of worker processes (one per CPU by default).
+    A worker is restarted when it crashes, when its peak memory goes over
+    max_memory bytes, or when a batch takes longer than timeout seconds
+    per request; budgets in the requests are the gentler way to stop long
+    parses. limits is a dict of budget limits for every request; a
+    request's own budget may lower them, but not raise them.
+
+    Requests of less than small bytes of source are batched: a worker
+    takes up to batch_size of them, up to batch_bytes in all, at once. If
+    a batch crashes its worker, its requests are retried one by one, so
+    only the culprit fails.
+
+    The socket is created with permissions mode, 0600 by default. With
+    root, requests for paths outside that directory (after following
+    symbolic links) are refused; without it the server reads whatever
+    files its user can."""
+
+    def __init__(self, path, workers=None, max_memory=None, timeout=None,
+                 limits=None, batch_size=32, batch_bytes=256 << 10,
+                 small=16 << 10, mode=0o600, root=None):
+        self.path = path
+        self.mode = mode
+        self.root = os.path.realpath(root) if root is not None else None
+        self.workers = workers or multiprocessing.cpu_count()
+        self.max_memory = max_memory
+        self.timeout = timeout
+        self.limits = limits or {}
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.small = small
+        # bounded, so that a client sending faster than the workers parse
+        # blocks instead of filling memory
+        self.queue = queue.Queue(self.workers * batch_size * 2)
+        self.sock = None
+        self.pool = []
+        self.threads = []
+        self.clients = set()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.counts = {'requests': 0, 'batches': 0, 'errors': 0}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self):
+        """Start the workers and listen in background threads."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # set the permissions as the socket is made, so that there is no
+        # moment when others can connect
+        umask = os.umask(0o777 & ~self.mode)
+        try:
+            self.sock.bind(self.path)
+        finally:
+            os.umask(umask)
+        self.sock.listen(64)
+        self.sock.settimeout(0.2)
+        for i in range(self.workers):
+            worker = Worker(self.max_memory)
+            self.pool.append(worker)
+            self._thread(self._work, worker)
+        self._thread(self._accept)
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while not self.closed:
+                self.threads[-1].join(1)
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for i in self.pool:
+            self.queue.put(None)
+        with self.lock:
+            for client in self.clients:
+                try:
+                    client.sock.shutdown(socket.SHUT_RDWR)
+                except (IOError, OSError):
+                    pass
+        for thread in self.threads:
+            thread.join()
+        for worker in self.pool:
+            worker.stop()
+        self.sock.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+            stats['connections'] = len(self.clients)
+        stats['workers'] = len(self.pool)
+        stats['restarts'] = sum(worker.restarts for worker in self.pool)
+        stats['queued'] = self.queue.qsize()
+        return stats
+
+    def _thread(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+    def _count(self, name, n=1):
+        with self.lock:
+            self.counts[name] += n
+
+    def _accept(self):
+        while not self.closed:
+            try:
+                sock, address = self.sock.accept()
+            except socket.timeout:
+                continue
+            except (IOError, OSError):
+                break
+            sock.settimeout(None)
+            client = _Client(sock)
+            with self.lock:
+                self.clients.add(client)
+            self._thread(self._read, client)
+
+    def _read(self, client):
+        try:
+            while not self.closed:
+                try:
+                    message = read_message(client.sock)
+                except (IOError, OSError, ValueError):
+                    break
+                if message is None:
+                    break
+                self._request(client, message)
+        finally:
+            with self.lock:
+                self.clients.discard(client)
+            client.sock.close()
+
+    def _request(self, client, message):
+        if not isinstance(message, dict):
+            message = {}
+        id = message.get('id')
+        method = message.get('method')
+        params = message.get('params') or {}
+        if method == 'stats':
+            client.answer(id, {'result': self.stats()})
+            return
+        try:
+            if method not in methods or not isinstance(params, dict):
+                raise ValueError('bad request')
+            for name in ('source', 'path', 'filename'):
+                if not isinstance(params.get(name), (string_type, type(None))):
+                    raise ValueError('%s must be a string' % name)
+            if params.get('source') is None and self.root is not None:
+                if not self._allowed(params.get('path')):
+                    raise ValueError('path outside root')
+            params['budget'] = self._budget(params.get('budget'))
+        except ValueError as e:
+            self._count('errors')
+            client.answer(id, {'error': {'type': 'ValueError',
+                                         'message': str(e)}})
+            return
+        if params.get('source') is not None:
+            weight = len(params['source'])
+        else:
+            try:
+                weight = os.path.getsize(params.get('path'))
+            except (TypeError, IOError, OSError):
+                weight = 0
+        self._count('requests')
+        self.queue.put(_Request(client, id, method, params, weight))
+
+    def _budget(self, budget):
+        # the request's budget with the server's limits as caps
+        if budget is None:
+            budget = {}
+        if not isinstance(budget, dict):
+            raise ValueError('budget must be an object')
+        limits = dict(self.limits)
+        for name, value in budget.items():
+            if name not in _budget_args:
+                raise ValueError('unknown budget limit %r' % name)
+            if value is None:
+                continue
+            if isinstance(value, bool) or \
+                    not isinstance(value, numbers.Real):
+                raise ValueError('budget limit %s must be a number' % name)
+            if limits.get(name) is not None:
+                value = min(value, limits[name])
+            limits[name] = value
+        return limits
+
+    def _allowed(self, path):
+        # whether path is a file under root; a missing path is left for
+        # the worker to answer
+        if path is None:
+            return True
+        try:
+            path = os.path.realpath(path)
+        except (TypeError, ValueError, AttributeError):
+            return False
+        return path.startswith(os.path.join(self.root, ''))
+
+    def _batch(self):
+        # the next request, and more after it if it is small
+        request = self.queue.get()
+        if request is None:
+            return None
+        batch = [request]
+        size = request.weight
+        while size < self.small and len(batch) < self.batch_size:
+            try:
+                request = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                # keep the stop signal for this or another thread
+                self.queue.put(None)
+                break
+            batch.append(request)
+            size += request.weight
+            if size >= self.batch_bytes:
+                break
+        return batch
+
+    def _work(self, worker):
+        while True:
+            batch = self._batch()
+            if batch is None:
+                break
+            self._count('batches')
+            try:
+                answers = self._run(worker, batch)
+            except _WorkerLost as e:
+                if len(batch) == 1:
+                    answers = [{'error': {'type': e.args[0],
+                                          'message': 'worker lost'}}]
+                else:
+                    # find the culprit
+                    answers = []
+                    for request in batch:
+                        try:
+                            answers.extend(self._run(worker, [request]))
+                        except _WorkerLost as e:
+                            answers.append({'error': {'type': e.args[0],
+                                                      'message':
+                                                      'worker lost'}})
+            for request, answer in zip(batch, answers):
+                if 'error' in answer:
+                    self._count('errors')
+                request.client.answer(request.id, answer)
+
+    def _run(self, worker, batch):
+        timeout = self.timeout * len(batch) if self.timeout else None
+        return worker.run([(request.method, request.params)
+                           for request in batch], timeout)
+
+# ----------------------------------------------------------------------
+# Clients
+# ----------------------------------------------------------------------
+
+class Client(object):
+    """A connection to a Server. Calls wait for their answer; call_many
+    sends a list of requests at once and collects the answers."""
+
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.next_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.sock.close()
+
+    def call(self, method, **params):
+        """Return the result of one request, raising ServerError if it
+        failed."""
+        result = self.call_many(method, [params])[0]
+        if isinstance(result, ServerError):
+            raise result
+        return result
+
+    def call_many(self, method, params):
+        """Send one request for each dict in params and return the results
+        in the same order, with a ServerError in place of those that
+        failed."""
+        ids = []
+        for item in params:
+            self.next_id += 1
+            ids.append(self.next_id)
+            write_message(self.sock, {'id': self.next_id, 'method': method,
+                                      'params': item})
+        answers = {}
+        while len(answers) < len(ids):
+            answer = read_message(self.sock)
+            if answer is None:
+                raise IOError('connection closed by the server')
+            answers[answer.get('id')] = answer
+        return [answers[id]['result'] if 'result' in answers[id]
+                else ServerError(answers[id]['error']) for id in ids]
+
+    def parse(self, source=None, path=None, **options):
+        return self.call('parse', source=source, path=path, **options)
+
+    def lex(self, source=None, path=None, **options):
+        return self.call('lex', source=source, path=path, **options)
+
+    def outline(self, source=None, path=None, **options):
+        return self.call('outline', source=source, path=path, **options)
+
+    def stats(self):
+        return self.call('stats')
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="PHP parse server")
+    ap.add_argument('-w', '--workers', dest='workers', type=int, default=None,
+                    help='number of worker processes')
+    ap.add_argument('-m', '--max-memory', dest='max_memory', type=int,
+                    default=None, help='restart workers above this many MB')
+    ap.add_argument('-t', '--timeout', dest='timeout', type=float,
+                    default=None, help='kill workers stuck on a request for '
+                    'this many seconds')
+    ap.add_argument('--max-size', dest='max_size', type=int, default=None,
+                    help='default limit on the size of sources')
+    ap.add_argument('--max-nodes', dest='max_nodes', type=int, default=None,
+                    help='default limit on the nodes built per request')
+    ap.add_argument('--root', dest='root', default=None,
+                    help='only read files under this directory')
+    ap.add_argument('socket', metavar='SOCKET')
+    args = ap.parse_args()
+
+    limits = dict((name, getattr(args, name))
+                  for name in ('max_size', 'max_nodes')
+                  if getattr(args, name) is not None)
+    max_memory = args.max_memory << 20 if args.max_memory else None
+    server = Server(args.socket, args.workers, max_memory, args.timeout,
+                    limits, root=args.root)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+# ----------------------------------------------------------------------
+# spans.py
+#
+# Source spans for AST nodes: start and end offsets recorded from token
+# positions while parsing, and lines and columns computed on demand.
+#
+# Offsets index the source as it was given to the parser: characters of
+# a unicode source, bytes of a Python 2 str. LineIndex.byte_offset()
+# turns character offsets into offsets in the encoded file.
+#
+# Nodes the grammar builds inside other nodes in a single action (a Block
+# in an If, the inner calls of a method chain, the variable of a catch)
+# get the extent of their children, or of the enclosing node when they
+# have none.
+# ----------------------------------------------------------------------
+
+import bisect
+
+from . import phpast as ast
+from ply.lex import LexToken
+
+
+class LineIndex(object):
+    """The offsets at which the lines of a source start, for turning
+    offsets into lines and columns. Lines count from 1, columns from 0,
+    both in the units of the source's offsets."""
+
+    def __init__(self, source):
+        self.source = source
+        self.encoding = self.byte_starts = None
+        self.starts = [0]
+        find = source.find
+        pos = find('\n')
+        while pos >= 0:
+            self.starts.append(pos + 1)
+            pos = find('\n', pos + 1)
+
+    def line(self, offset):
+        return bisect.bisect_right(self.starts, offset)
+
+    def position(self, offset):
+        """Return (line, column) for an offset."""
+        line = bisect.bisect_right(self.starts, offset)
+        return line, offset - self.starts[line - 1]
+
+    def offset(self, line, column):
+        return self.starts[line - 1] + column
+
+    def byte_offset(self, offset, encoding='utf-8'):
+        """Return the offset in the source encoded with encoding that a
+        character offset corresponds to. Offsets into a source that is
+        bytes already are returned as they are."""
+        source = self.source
+        if isinstance(source, bytes):
+            return offset
+        if encoding != self.encoding:
+            # the encoded offsets of the line starts, worked out once
+            self.byte_starts = starts = [0]
+            for i in range(1, len(self.starts)):
+                line = source[self.starts[i - 1]:self.starts[i]]
+                starts.append(starts[-1] + len(line.encode(encoding)))
+            self.encoding = encoding
+        line = self.line(offset) - 1
+        start = self.starts[line]
+        return self.byte_starts[line] + \
+            len(source[start:offset].encode(encoding))
+
+    def span(self, node):
+        """Return ((line, column), (line, column)) for the start and end of
+        a node, or None if it has no span."""
+        if node.start_offset is None:
+            return None
+        return self.position(node.start_offset), \
+            self.position(node.end_offset)
+
+# While parsing, every symbol carries the first and last token it was
+# reduced from (None for empty productions). Offsets are only worked out
+# for the nodes built along the way.
+
+def _bounds(symbols, i):
+    # the first and last tokens among symbols[i:]
+    first = last = None
+    for sym in symbols[i:]:
+        first = sym if sym.__class__ is LexToken else sym.first
+        if first is not None:
+            break
+    for sym in reversed(symbols[i:]):
+        last = sym if sym.__class__ is LexToken else sym.last
+        if last is not None:
+            break
+    return first, last
+
+def _stamp(value, symbols, first, last):
+    if value.__class__ is list:
+        if not value:
+            return
+        item = value[-1]
+        if not isinstance(item, ast.Node) or item.start_offset is not None:
+            return
+        # a list element built in this production; in `list COMMA item`
+        # productions it starts after the comma
+        if len(value) > 1 and len(symbols) > 2:
+            sym = symbols[2]
+            i = 3 if sym.__class__ is LexToken and sym.type == 'COMMA' else 2
+            first = _bounds(symbols, i)[0] or first
+        value = item
+    elif not isinstance(value, ast.Node) or value.start_offset is not None:
+        # nodes passed up unchanged (e.g. from parentheses) keep the span
+        # of the production that created them
+        return
+    value.start_offset = first.lexpos
+    value.end_offset = last.lexpos + len(last.value)
+
+def _track_empty(func):
+    def action(p):
+        func(p)
+        result = p.slice[0]
+        result.first = result.last = None
+    return action
+
+def _track_unit(func):
+    # most reductions are of a single symbol, and most of those pass its
+    # value up as it is
+    def action(p):
+        func(p)
+        result, sym = p.slice
+        if sym.__class__ is LexToken:
+            result.first = result.last = sym
+            _stamp(result.value, p.slice, sym, sym)
+        else:
+            first = result.first = sym.first
+            result.last = sym.last
+            value = result.value
+            if first is not None and value is not sym.value:
+                _stamp(value, p.slice, first, sym.last)
+    return action
+
+def _track(func):
+    def action(p):
+        func(p)
+        symbols = p.slice
+        result = symbols[0]
+        sym = symbols[1]
+        first = sym if sym.__class__ is LexToken else sym.first
+        sym = symbols[-1]
+        last = sym if sym.__class__ is LexToken else sym.last
+        if first is None or last is None:
+            first, last = _bounds(symbols, 1)
+            if first is None:
+                result.first = result.last = None
+                return
+        result.first = first
+        result.last = last
+        _stamp(result.value, symbols, first, last)
+    return action
+
+def _fill(nodes):
+    # offsets for the nodes built inside others, see the top of the file
+    missing = []
+    stack = [(node, None) for node in nodes if isinstance(node, ast.Node)]
+    while stack:
+        node, parent = stack.pop()
+        if node.start_offset is None:
+            missing.append((node, parent))
+        for field in node.fields:
+            value = getattr(node, field)
+            if isinstance(value, ast.Node):
+                stack.append((value, node))
+            elif value.__class__ is list:
+                for item in value:
+                    if isinstance(item, ast.Node):
+                        stack.append((item, node))
+                    elif item.__class__ is list:
+                        # nested list() assignments
+                        stack.extend((x, node) for x in item
+                                     if isinstance(x, ast.Node))
+    # parents come before their children in missing
+    for node, parent in reversed(missing):
+        children = [child for child in _children(node)
+                    if child.start_offset is not None]
+        if children:
+            node.start_offset = min(child.start_offset for child in children)
+            node.end_offset = max(child.end_offset for child in children)
+    for node, parent in missing:
+        if node.start_offset is None and parent is not None:
+            node.start_offset = parent.start_offset
+            node.end_offset = parent.end_offset
+
+def _children(node):
+    for field in node.fields:
+        value = getattr(node, field)
+        if isinstance(value, ast.Node):
+            yield value
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, ast.Node):
+                    yield item
+
+def track_spans(parser):
+    """Make a parser record start and end offsets on the nodes it builds.
+
+    Every production's action is wrapped to pass the first and last token
+    of its symbols up, and nodes get their offsets from those when they
+    are built, so no positions are kept on the symbols. Unlike PLY's
+    tracking=True, this gives end offsets. The parser's actions are
+    changed in place, so use a parser of its own."""
+    for production in parser.productions:
+        if production.callable is None:
+            continue
+        if production.len == 0:
+            production.callable = _track_empty(production.callable)
+        elif production.len == 1:
+            production.callable = _track_unit(production.callable)
+        else:
+            production.callable = _track(production.callable)
+    for production in parser.productions:
+        if production.name == 'start':
+            production.callable = _finish(production.callable)
+    return parser
+
+def _finish(action):
+    def finish(p):
+        action(p)
+        _fill(p[0])
+    return finish
@@ -0,0 +1,284 @@
+# ----------------------------------------------------------------------
+# symbolindex.py
+#
+# Persistent index of PHP symbol definitions backed by SQLite.
+# ----------------------------------------------------------------------
+
+import collections
+import os
+import sqlite3
+import sys
+
+from . import phpast as ast
+from . import project
+
+if sys.version_info[0] == 3:
+    string_type = str
+else:
+    string_type = basestring
+
+Symbol = collections.namedtuple('Symbol', ['kind', 'name', 'path', 'lineno',
+                                           'container'])
+
+schema = '''
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    lname TEXT NOT NULL,
+    short TEXT NOT NULL,
+    lineno INTEGER,
+    container TEXT
+);
+CREATE INDEX IF NOT EXISTS symbols_lname ON symbols (lname);
+CREATE INDEX IF NOT EXISTS symbols_short ON symbols (short);
+CREATE INDEX IF NOT EXISTS symbols_file ON symbols (file_id);
+'''
+
+def qualify(namespace, name):
+    if namespace:
+        return '%s\\%s' % (namespace, name)
+    return name
+
+def extract_symbols(nodes):
+    """Return (kind, name, lineno, container) tuples for every definition.
+
+    Names are fully qualified; methods and class constants are named
+    Class::member and have the class as their container."""
+    symbols = []
+    # statement-style namespaces apply to the top-level nodes that follow
+    # them, so resolve those before walking
+    scoped = []
+    namespace = None
+    for node in nodes:
+        if isinstance(node, ast.Namespace) and not node.nodes:
+            namespace = node.name
+        scoped.append((node, namespace, None))
+    stack = list(reversed(scoped))
+    while stack:
+        node, namespace, class_ = stack.pop()
+        if isinstance(node, ast.Namespace):
+            if node.name:
+                symbols.append(('namespace', node.name, node.lineno, None))
+            namespace = node.name
+        elif isinstance(node, (ast.Class, ast.Interface, ast.Trait)):
+            kind = node.__class__.__name__.lower()
+            class_ = qualify(namespace, node.name)
+            symbols.append((kind, class_, node.lineno, None))
+        elif isinstance(node, ast.Function):
+            symbols.append(('function', qualify(namespace, node.name),
+                            node.lineno, None))
+        elif isinstance(node, ast.Method) and class_:
+            symbols.append(('method', '%s::%s' % (class_, node.name),
+                            node.lineno, class_))
+        elif isinstance(node, ast.ClassConstant) and class_:
+            symbols.append(('class_constant', '%s::%s' % (class_, node.name),
+                            node.lineno, class_))
+        elif isinstance(node, ast.ConstantDeclaration):
+            symbols.append(('constant', qualify(namespace, node.name),
+                            node.lineno, None))
+        elif isinstance(node, ast.FunctionCall) and \
+             isinstance(node.name, string_type) and \
+             node.name.lstrip('\\').lower() == 'define' and node.params and \
+             isinstance(node.params[0].node, string_type):
+            symbols.append(('constant', node.params[0].node.lstrip('\\'),
+                            node.lineno, None))
+        for field in node.fields:
+            value = getattr(node, field)
+            if isinstance(value, ast.Node):
+                stack.append((value, namespace, class_))
+            elif isinstance(value, list):
+                for item in reversed(value):
+                    if isinstance(item, ast.Node):
+                        stack.append((item, namespace, class_))
+    return symbols
+
+def symbol_key(kind, name):
+    # constants are case-sensitive in PHP, everything else is not
+    if kind in ('constant', 'class_constant'):
+        if kind == 'class_constant':
+            class_, member = name.split('::', 1)
+            return '%s::%s' % (class_.lower(), member)
+        return name
+    return name.lower()
+
+def short_name(kind, name):
+    short = name.rsplit('::', 1)[-1].rsplit('\\', 1)[-1]
+    if kind in ('constant', 'class_constant'):
+        return short
+    return short.lower()
+
+def _index_file(path):
+    try:
+        nodes = project.parse_file(path)
+    except (SyntaxError, RuntimeError) as e:
+        return path, None, '%s: %s' % (e.__class__.__name__, e)
+    return path, extract_symbols(nodes), None
+
+
+class SymbolIndex(object):
+    """Where-is-it-defined lookups over a tree of PHP files.
+
+    update() only re-parses files whose size, mtime and content hash changed
+    since the last run, and writes the results in batched transactions."""
+
+    batch_size = 500
+
+    def __init__(self, path=':memory:'):
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA foreign_keys = ON')
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA synchronous = NORMAL')
+        self.db.executescript(schema)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _stale_files(self, paths):
+        known = dict((row[0], row[1:]) for row in
+                     self.db.execute('SELECT path, mtime, size, hash FROM files'))
+        stale = []
+        touched = []
+        seen = set()
+        for path in project.find_php_files(paths):
+            path = os.path.abspath(path)
+            seen.add(path)
+            st = os.stat(path)
+            previous = known.get(path)
+            if previous and previous[0] == st.st_mtime and \
+               previous[1] == st.st_size:
+                continue
+            digest = project.file_hash(path)
+            if previous and previous[2] == digest:
+                # touched but not modified, no need to parse again
+                touched.append((st.st_mtime, st.st_size, path))
+                continue
+            stale.append((path, st.st_mtime, st.st_size, digest))
+        roots = [os.path.abspath(p) for p in paths]
+        removed = [path for path in known if path not in seen and
+                   any(path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+                       for root in roots)]
+        return stale, touched, removed
+
+    def update(self, paths, processes=None):
+        """Bring the index up to date with the files under paths.
+
+        Returns the number of files that were (re)parsed."""
+        if isinstance(paths, string_type):
+            paths = [paths]
+        stale, touched, removed = self._stale_files(paths)
+        with self.db:
+            self.db.executemany('UPDATE files SET mtime = ?, size = ? '
+                                'WHERE path = ?', touched)
+            self.db.executemany('DELETE FROM files WHERE path = ?',
+                                [(path,) for path in removed])
+
+        stats = dict((path, (mtime, size, digest))
+                     for path, mtime, size, digest in stale)
+        batch = []
+        for result in project.map_files(_index_file, sorted(stats), processes):
+            batch.append(result)
+            if len(batch) >= self.batch_size:
+                self._store(batch, stats)
+                batch = []
+        if batch:
+            self._store(batch, stats)
+        return len(stale)
+
+    def _store(self, batch, stats):
+        with self.db:
+            for path, symbols, error in batch:
+                mtime, size, digest = stats[path]
+                self.db.execute('DELETE FROM files WHERE path = ?', (path,))
+                file_id = self.db.execute(
+                    'INSERT INTO files (path, mtime, size, hash, error) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (path, mtime, size, digest, error)).lastrowid
+                self.db.executemany(
+                    'INSERT INTO symbols (file_id, kind, name, lname, short, '
+                    'lineno, container) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    [(file_id, kind, name, symbol_key(kind, name),
+                      short_name(kind, name), lineno, container)
+                     for kind, name, lineno, container in symbols or ()])
+
+    def _query(self, where, args):
+        return [Symbol(*row) for row in self.db.execute(
+            'SELECT kind, name, path, lineno, container FROM symbols '
+            'JOIN files ON files.id = symbols.file_id WHERE ' + where +
+            ' ORDER BY path, lineno', args)]
+
+    def lookup(self, name, kind=None):
+        """Find definitions of a fully qualified name, e.g. Foo\\Bar,
+        Foo\\Bar::baz or Foo\\BAR_CONSTANT."""
+        name = name.lstrip('\\')
+        keys = set([name, name.lower()])
+        if '::' in name:
+            keys.add(symbol_key('class_constant', name))
+        where = 'lname IN (%s)' % ', '.join('?' * len(keys))
+        args = list(keys)
+        if kind is not None:
+            where += ' AND kind = ?'
+            args.append(kind)
+        return [s for s in self._query(where, args)
+                if symbol_key(s.kind, s.name) == symbol_key(s.kind, name)]
+
+    def search(self, name, kind=None):
+        """Find definitions by unqualified name in any namespace or class."""
+        where = 'short IN (?, ?)'
+        args = [name, name.lower()]
+        if kind is not None:
+            where += ' AND kind = ?'
+            args.append(kind)
+        return [s for s in self._query(where, args)
+                if short_name(s.kind, s.name) == short_name(s.kind, name)]
+
+    def errors(self):
+        return list(self.db.execute('SELECT path, error FROM files '
+                                    'WHERE error IS NOT NULL ORDER BY path'))
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="PHP symbol index")
+    ap.add_argument('-d', '--database', dest='database', default='.phply-index',
+                    help='index database file')
+    ap.add_argument('-j', '--jobs', dest='jobs', type=int, default=None,
+                    help='number of parser processes')
+    sub = ap.add_subparsers(dest='command')
+    update = sub.add_parser('update', help='index new and changed files')
+    update.add_argument('paths', metavar='PATH', nargs='+')
+    lookup = sub.add_parser('lookup', help='find a fully qualified name')
+    lookup.add_argument('name', metavar='NAME')
+    search = sub.add_parser('search', help='find an unqualified name')
+    search.add_argument('name', metavar='NAME')
+    for p in (lookup, search):
+        p.add_argument('-k', '--kind', dest='kind', default=None)
+    args = ap.parse_args()
+
+    with SymbolIndex(args.database) as index:
+        if args.command == 'update':
+            count = index.update(args.paths, args.jobs)
+            print('%d files parsed' % count)
+            for path, error in index.errors():
+                print(path, error)
+        elif args.command in ('lookup', 'search'):
+            find = index.lookup if args.command == 'lookup' else index.search
+            for symbol in find(args.name, args.kind):
+                print('%s:%s: %s %s' % (symbol.path, symbol.lineno,
+                                        symbol.kind, symbol.name))
+        else:
+            ap.print_help()
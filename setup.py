@@ -17,7 +17,9 @@ class GenerateParsetab(Command):
 
     def run(self):
         from phply.phpparse import make_parser
+        from phply.lalrgen import write_driver
         make_parser(debug=False)
+        write_driver()
 
 
 setup(name="phply",
@@ -50,6 +52,13 @@ setup(name="phply",
         'console_scripts': [
             'phpparse=phply.phpparse:main',
             'phplex=phply.phplex:run_on_argv1',
+            'phpindex=phply.symbolindex:main',
+            'phpincludes=phply.includegraph:main',
+            'phpquery=phply.query:main',
+            'phpsearch=phply.search:main',
+            'phpclones=phply.clones:main',
+            'phpneardup=phply.neardup:main',
+            'phpserve=phply.server:main',
             ],
         },
 
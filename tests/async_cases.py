@@ -0,0 +1,61 @@
+# Coroutines for test_asyncparse, kept apart because their syntax needs
+# Python 3.6 and the tests themselves must still load (and skip) on older
+# versions.
+
+import asyncio
+
+from phply.asyncparse import parse_async
+
+async def parse_twice(source):
+    return await asyncio.gather(parse_async(source), parse_async(source))
+
+async def collect(results):
+    return [result async for result in results]
+
+async def parse_checked(parser, source, big):
+    # returns what parser made of source and the exception raised by big
+    async with parser:
+        nodes = await parser.parse(source)
+        try:
+            await parser.parse(big)
+        except Exception as e:
+            return nodes, e
+        return nodes, None
+
+async def consume_slowly(results, pulled, concurrency):
+    count = 0
+    async for result in results:
+        # nothing runs ahead of a slow consumer
+        assert len(pulled) <= count + concurrency + 1
+        count += 1
+        await asyncio.sleep(0.001)
+    return count
+
+async def produce(paths, pulled):
+    for path in paths:
+        pulled.append(path)
+        yield path
+
+async def burst(parser, source, count):
+    await asyncio.gather(*[parser.parse(source) for i in range(count)])
+
+async def cancel_parse(parser, source):
+    task = asyncio.ensure_future(parser.parse(source))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+async def close_early(results):
+    # the tasks left unfinished once the generator is closed after one
+    # result; before Python 3.7 these functions were methods of Task
+    async for result in results:
+        break
+    await results.aclose()
+    all_tasks = getattr(asyncio, 'all_tasks', None) or asyncio.Task.all_tasks
+    current_task = getattr(asyncio, 'current_task', None) or \
+        asyncio.Task.current_task
+    return [task for task in all_tasks()
+            if not task.done() and task is not current_task()]
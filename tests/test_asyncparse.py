@@ -0,0 +1,152 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+from nose.plugins.skip import SkipTest
+
+if sys.version_info < (3, 6):
+    raise SkipTest('asyncparse needs Python 3.6 or later')
+
+import asyncio
+import concurrent.futures
+
+from phply.asyncparse import AsyncParser, parse_many
+from phply.budget import BudgetExceeded
+from phply.project import parse_source
+
+from . import async_cases
+
+import nose.tools
+
+source = '<?php function f($a) { return "x $a" . g(1, 2); }'
+
+big = '<?php ' + '$a = f(1 + 2);' * 20000
+medium = '<?php ' + '$a = f(1 + 2);' * 1500
+
+
+def run(coroutine):
+    # asyncio.run() is new in Python 3.7
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class Executor(concurrent.futures.ThreadPoolExecutor):
+    # counts the calls running at once and keeps their futures
+
+    def __init__(self, *args):
+        concurrent.futures.ThreadPoolExecutor.__init__(self, *args)
+        self.lock = threading.Lock()
+        self.running = self.most = 0
+        self.futures = []
+
+    def submit(self, fn, *args):
+        def counted():
+            with self.lock:
+                self.running += 1
+                self.most = max(self.most, self.running)
+            try:
+                return fn(*args)
+            finally:
+                with self.lock:
+                    self.running -= 1
+        future = concurrent.futures.ThreadPoolExecutor.submit(self, counted)
+        self.futures.append(future)
+        return future
+
+
+def write_files(count):
+    directory = tempfile.mkdtemp()
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, '%d.php' % i)
+        with open(path, 'w') as f:
+            f.write('<?php echo %d;' % i if i % 10 else '<?php echo ;')
+        paths.append(path)
+    return directory, paths
+
+def test_parse_async():
+    nose.tools.eq_(run(async_cases.parse_twice(source)),
+                   [parse_source(source)] * 2)
+
+def test_parse_many():
+    directory, paths = write_files(30)
+    try:
+        results = run(async_cases.collect(parse_many(paths)))
+        nose.tools.eq_(sorted(result.path for result in results),
+                       sorted(paths))
+        for result in results:
+            i = int(os.path.basename(result.path)[:-4])
+            if i % 10:
+                nose.tools.eq_(result.nodes[0].nodes, [i])
+                nose.tools.eq_(result.error, None)
+            else:
+                assert result.error.startswith('SyntaxError')
+    finally:
+        shutil.rmtree(directory)
+
+def test_partials():
+    # a partial closing a brace opened elsewhere is an error result
+    directory, paths = write_files(2)
+    try:
+        with open(paths[0], 'w') as f:
+            f.write('<?php } ?>')
+        results = run(async_cases.collect(parse_many(paths)))
+        errors = dict((result.path, result.error) for result in results)
+        assert errors[paths[0]].startswith('SyntaxError')
+        nose.tools.eq_(errors[paths[1]], None)
+    finally:
+        shutil.rmtree(directory)
+
+def test_processes():
+    parser = AsyncParser(processes=True, workers=2, limits={'max_nodes': 100})
+    nodes, e = run(async_cases.parse_checked(parser, source, big))
+    nose.tools.eq_(nodes, parse_source(source))
+    assert isinstance(e, BudgetExceeded)
+    nose.tools.eq_(e.limit, 'max_nodes')
+    nose.tools.eq_(e.stats.nodes, 101)
+
+def test_bounded():
+    directory, paths = write_files(40)
+    executor = Executor(8)
+    parser = AsyncParser(executor, concurrency=3)
+    pulled = []
+    try:
+        results = parser.parse_many(async_cases.produce(paths, pulled))
+        nose.tools.eq_(run(async_cases.consume_slowly(results, pulled, 3)),
+                       40)
+        assert executor.most <= 3
+        run(async_cases.burst(parser, medium, 10))
+        nose.tools.eq_(executor.most, 3)
+    finally:
+        executor.shutdown()
+        shutil.rmtree(directory)
+
+def test_cancel():
+    executor = Executor(1)
+    parser = AsyncParser(executor)
+    try:
+        run(async_cases.cancel_parse(parser, big))
+        try:
+            executor.futures[0].result(5)
+        except BudgetExceeded as e:
+            nose.tools.eq_(e.limit, 'cancelled')
+        else:
+            raise AssertionError('parse not stopped')
+    finally:
+        executor.shutdown()
+
+def test_close_early():
+    directory, paths = write_files(20)
+    executor = Executor(2)
+    parser = AsyncParser(executor, concurrency=4)
+    try:
+        nose.tools.eq_(run(async_cases.close_early(parser.parse_many(paths))),
+                       [])
+    finally:
+        executor.shutdown()
+        shutil.rmtree(directory)
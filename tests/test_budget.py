@@ -0,0 +1,69 @@
+import threading
+import time
+
+from phply import phplex
+from phply.budget import Budget, BudgetExceeded, parse
+from phply.phpparse import make_parser
+
+import nose.tools
+
+source = '''<?php
+function f($a) {
+    if ($a) { return array(1, 2, array(3)); }
+    return $a + 1;
+}
+echo f(2), "x $y";
+'''
+
+def exceeded(source, budget):
+    try:
+        parse(source, budget)
+    except BudgetExceeded as e:
+        return e
+    raise AssertionError('budget not exceeded')
+
+def test_within_budget():
+    budget = Budget(max_size=1000, max_tokens=1000, max_nodes=1000,
+                    max_depth=1000, timeout=60, cancel=threading.Event())
+    nose.tools.eq_(parse(source, budget),
+                   make_parser().parse(source, lexer=phplex.lexer.clone()))
+    nose.tools.eq_(parse(source, Budget()), parse(source, budget))
+
+def test_limits():
+    e = exceeded(source, Budget(max_size=10))
+    nose.tools.eq_(e.limit, 'max_size')
+    nose.tools.eq_(e.stats.tokens, 0)
+    e = exceeded(source, Budget(max_tokens=20))
+    nose.tools.eq_(e.limit, 'max_tokens')
+    nose.tools.eq_(e.stats.tokens, 21)
+    assert e.stats.lineno > 1
+    e = exceeded(source, Budget(max_nodes=5))
+    nose.tools.eq_(e.limit, 'max_nodes')
+    nose.tools.eq_(e.stats.nodes, 6)
+    e = exceeded('<?php $a = ' + '(' * 100 + '1' + ')' * 100 + ';',
+                 Budget(max_depth=50))
+    nose.tools.eq_(e.limit, 'max_depth')
+    assert e.stats.depth > 50
+    assert 'max_depth' in str(e)
+
+def test_deep_nesting():
+    # stopped as the nesting is read, not when it is finally reduced
+    for text in ('(', '!', '['):
+        e = exceeded('<?php $a = ' + text * 200000, Budget(max_depth=50))
+        nose.tools.eq_(e.limit, 'max_depth')
+        nose.tools.eq_(e.stats.depth, 51)
+        assert e.stats.tokens < 100
+
+def test_deadline():
+    e = exceeded(source, Budget(deadline=time.time() - 1))
+    nose.tools.eq_(e.limit, 'deadline')
+    e = exceeded(source * 4, Budget(timeout=0, check_every=16))
+    nose.tools.eq_(e.limit, 'deadline')
+    assert e.stats.elapsed >= 0
+
+def test_cancel():
+    cancel = threading.Event()
+    cancel.set()
+    e = exceeded(source, Budget(cancel=cancel))
+    nose.tools.eq_(e.limit, 'cancelled')
+    nose.tools.eq_(e.stats.tokens, 1)
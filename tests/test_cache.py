@@ -0,0 +1,93 @@
+import threading
+
+from phply import phpast as ast
+from phply.cache import ParseCache, copy_tree, tree_size
+from phply.project import parse_source
+
+import nose.tools
+
+source = '<?php function f($a) { return array($a, list($b, list($c)) = $d); }'
+
+def test_hits_and_copies():
+    cache = ParseCache()
+    first = cache.parse(source)
+    second = cache.parse(source)
+    nose.tools.eq_(first, parse_source(source))
+    nose.tools.eq_(first, second)
+    first[0].name = 'g'
+    first[0].nodes.append(ast.Break(None))
+    nose.tools.eq_(cache.parse(source), parse_source(source))
+    stats = cache.stats()
+    nose.tools.eq_((stats.hits, stats.misses, stats.entries), (2, 1, 1))
+    nose.tools.eq_(stats.hit_rate, 2 / 3.0)
+
+def test_no_copy():
+    cache = ParseCache(copy=False)
+    assert cache.parse(source) is cache.parse(source)
+
+def test_copy_tree():
+    nodes = parse_source(source)
+    copied = copy_tree(nodes)
+    nose.tools.eq_(copied, nodes)
+    originals = []
+    nodes[0].accept(originals.append)
+    copies = []
+    copied[0].accept(copies.append)
+    assert not set(map(id, originals)) & set(map(id, copies))
+
+def test_eviction():
+    cache = ParseCache(max_entries=2)
+    for i in range(3):
+        cache.parse('<?php $a = %d;' % i)
+    cache.parse('<?php $a = 2;')
+    cache.parse('<?php $a = 0;')
+    stats = cache.stats()
+    nose.tools.eq_((stats.hits, stats.misses, stats.evictions), (1, 4, 2))
+
+    size = tree_size(parse_source(source))
+    cache = ParseCache(max_bytes=size * 3 // 2)
+    cache.parse(source)
+    cache.parse(source + ' f();')
+    stats = cache.stats()
+    nose.tools.eq_((stats.entries, stats.evictions), (1, 1))
+    assert stats.size <= size * 3 // 2
+
+def test_filenames():
+    cache = ParseCache()
+    text = '<?php echo __FILE__;'
+    nose.tools.eq_(cache.parse(text, '/a/x.php'),
+                   parse_source(text, '/a/x.php'))
+    nose.tools.eq_(cache.parse(text, '/b/y.php'),
+                   parse_source(text, '/b/y.php'))
+    nose.tools.eq_(cache.parse(text, '/a/x.php'),
+                   parse_source(text, '/a/x.php'))
+    stats = cache.stats()
+    nose.tools.eq_((stats.hits, stats.misses), (1, 2))
+
+def test_errors_not_cached():
+    cache = ParseCache()
+    for i in range(2):
+        nose.tools.assert_raises(SyntaxError, cache.parse, '<?php $a = ;')
+    nose.tools.eq_(cache.stats().entries, 0)
+
+def test_threads():
+    cache = ParseCache(max_entries=4)
+    sources = ['<?php $a = %d + f(%d);' % (i, i) for i in range(8)]
+    expected = [parse_source(s) for s in sources]
+    errors = []
+    def work(k):
+        try:
+            for i in range(50):
+                j = (i * 3 + k) % len(sources)
+                assert cache.parse(sources[j]) == expected[j]
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=work, args=(k,)) for k in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    nose.tools.eq_(errors, [])
+    stats = cache.stats()
+    nose.tools.eq_(stats.hits + stats.misses, 200)
+    assert stats.entries <= 4
@@ -0,0 +1,88 @@
+from phply.callgraph import CallGraph
+from phply.project import parse_source
+
+import nose.tools
+import os
+import shutil
+import tempfile
+
+sources = {
+    'index.php': r"""<?php
+        use App\Controller;
+        $c = new Controller();
+        $c->run();
+        boot();
+    """,
+    'lib.php': r"""<?php
+        function boot() { strlen('x'); }
+        function unused() { boot(); }
+    """,
+    'app.php': r"""<?php
+        namespace App;
+        trait Logs { function log() { helper(); } }
+        class Base {
+            function __construct() { $this->init(); }
+            function init() {}
+        }
+        class Controller extends Base {
+            use Logs;
+            function run() { $this->log(); parent::init(); Util::go(); }
+        }
+        class Util { static function go() {} }
+        function helper() {}
+        function orphan() {}
+    """,
+}
+
+def make_graph(**kwargs):
+    graph = CallGraph(**kwargs)
+    for path, source in sorted(sources.items()):
+        graph.add_file(path, parse_source(source, path))
+    return graph
+
+def test_edges():
+    graph = make_graph()
+    nose.tools.eq_(graph.callees('index.php'),
+                   ['app\\base::__construct', 'app\\controller::run', 'boot'])
+    nose.tools.eq_(sorted(graph.callees('App\\Controller::run')),
+                   ['app\\base::init', 'app\\logs::log', 'app\\util::go'])
+    # unqualified calls prefer the namespaced function, then the global one
+    nose.tools.eq_(graph.callees('app\\logs::log'), ['app\\helper'])
+    nose.tools.eq_(graph.callees('boot'), ['strlen'])
+    nose.tools.eq_(sorted(graph.callers('boot')), ['index.php', 'unused'])
+    nose.tools.eq_(graph.edge_count, 10)
+
+def test_unknown_receivers():
+    graph = make_graph(resolve_unknown_receivers=False)
+    nose.tools.eq_(graph.callees('index.php'),
+                   ['app\\base::__construct', 'boot'])
+
+def test_reachability():
+    graph = make_graph()
+    nose.tools.assert_true(graph.is_reachable('app\\helper', ['index.php']))
+    nose.tools.assert_false(graph.is_reachable('unused', ['index.php']))
+    nose.tools.eq_(graph.unreachable_functions(['index.php']),
+                   ['app\\orphan', 'unused'])
+
+def test_incremental():
+    graph = make_graph()
+    graph.add_file('lib.php', parse_source('<?php function boot() {}'))
+    nose.tools.eq_(graph.callees('boot'), [])
+    graph.remove_file('index.php')
+    nose.tools.eq_(graph.callers('boot'), [])
+
+def test_update():
+    root = tempfile.mkdtemp()
+    try:
+        for name, source in list(sources.items()) + [('footer.php',
+                                                      '<?php } ?>')]:
+            with open(os.path.join(root, name), 'w') as f:
+                f.write(source)
+        graph = CallGraph()
+        nose.tools.eq_(graph.update(root, processes=1), 4)
+        # a partial closing a brace opened elsewhere is a file error
+        error = graph.files[os.path.join(root, 'footer.php')][3]
+        nose.tools.assert_true(error.startswith('SyntaxError'))
+        nose.tools.eq_(graph.callees('boot'), ['strlen'])
+    finally:
+        shutil.rmtree(root)
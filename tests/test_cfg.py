@@ -0,0 +1,152 @@
+from phply import phpast as ast
+from phply.cfg import build_cfg, functions, structural_hash, CFGCache, ENTRY, EXIT
+from phply.project import parse_source
+
+import nose.tools
+
+def function_cfg(code):
+    nodes = parse_source('<?php function f($a) {' + code + '}')
+    return build_cfg(nodes[0])
+
+def block_of(cfg, name):
+    # the block holding the call to name(), not counting loop headers
+    for i, block in enumerate(cfg.blocks):
+        todo = list(block)
+        while todo:
+            node = todo.pop()
+            if isinstance(node, ast.FunctionCall) and node.name == name:
+                return i
+            if isinstance(node, (ast.Foreach, ast.Catch)):
+                continue
+            if isinstance(node, ast.Node):
+                todo.extend(getattr(node, field) for field in node.fields)
+            elif isinstance(node, list):
+                todo.extend(node)
+    raise KeyError(name)
+
+def flows(cfg, src, dst):
+    # whether dst is reachable from src without passing the entry again
+    seen = set([src])
+    todo = [src]
+    while todo:
+        for b in cfg.successors(todo.pop()):
+            if b == dst:
+                return True
+            if b not in seen:
+                seen.add(b)
+                todo.append(b)
+    return False
+
+def test_straight_line():
+    cfg = function_cfg('a(); b(); return c();')
+    nose.tools.eq_(block_of(cfg, 'a'), block_of(cfg, 'c'))
+    nose.tools.eq_(list(cfg.successors(ENTRY)), [block_of(cfg, 'a')])
+    nose.tools.eq_(list(cfg.successors(block_of(cfg, 'c'))), [EXIT])
+    nose.tools.eq_(list(cfg.reverse_postorder()),
+                   [ENTRY, block_of(cfg, 'a'), EXIT])
+
+def test_if_elseif_else():
+    cfg = function_cfg('if (a()) { b(); } elseif (c()) { d(); } else { e(); }'
+                       ' f();')
+    cond, then = block_of(cfg, 'a'), block_of(cfg, 'b')
+    nose.tools.eq_(set(cfg.successors(cond)), set([then, block_of(cfg, 'c')]))
+    nose.tools.eq_(set(cfg.successors(block_of(cfg, 'c'))),
+                   set([block_of(cfg, 'd'), block_of(cfg, 'e')]))
+    for branch in 'bde':
+        nose.tools.eq_(list(cfg.successors(block_of(cfg, branch))),
+                       [block_of(cfg, 'f')])
+    nose.tools.eq_(set(cfg.predecessors(block_of(cfg, 'f'))),
+                   set([then, block_of(cfg, 'd'), block_of(cfg, 'e')]))
+
+def test_loops():
+    cfg = function_cfg('while (a()) { if (b()) break; if (c()) continue; d(); }'
+                       ' e();')
+    header = block_of(cfg, 'a')
+    nose.tools.assert_true(header in cfg.successors(block_of(cfg, 'd')))
+    nose.tools.assert_true(flows(cfg, block_of(cfg, 'b'), block_of(cfg, 'e')))
+    nose.tools.assert_true(header in cfg.successors(
+        cfg.successors(block_of(cfg, 'c'))[0]))
+
+    cfg = function_cfg('for ($i = 0; a(); inc()) { b(); } c();')
+    nose.tools.eq_(list(cfg.successors(block_of(cfg, 'b'))),
+                   [block_of(cfg, 'inc')])
+    nose.tools.eq_(list(cfg.successors(block_of(cfg, 'inc'))),
+                   [block_of(cfg, 'a')])
+
+    cfg = function_cfg('for (;;) { a(); } b();')
+    nose.tools.assert_false(flows(cfg, block_of(cfg, 'a'), EXIT))
+
+    cfg = function_cfg('do { a(); } while (b()); c();')
+    nose.tools.eq_(set(cfg.successors(block_of(cfg, 'b'))),
+                   set([block_of(cfg, 'a'), block_of(cfg, 'c')]))
+
+    cfg = function_cfg('foreach (a() as $k => $v) { b($k, $v); } c();')
+    body = block_of(cfg, 'b')
+    header, = cfg.predecessors(body)
+    nose.tools.assert_true(isinstance(cfg.blocks[header][0], ast.Foreach))
+    nose.tools.eq_(set(cfg.successors(header)), set([body, block_of(cfg, 'c')]))
+
+def test_break_levels():
+    cfg = function_cfg('while (a()) { foreach ($x as $y) { b(); break 2; } }'
+                       ' c();')
+    after = block_of(cfg, 'c')
+    nose.tools.eq_(list(cfg.successors(block_of(cfg, 'b'))), [after])
+
+def test_switch():
+    cfg = function_cfg('switch (a()) { case 1: b(); case 2: c(); break;'
+                       ' default: d(); } e();')
+    b, c, d, e = [block_of(cfg, name) for name in 'bcde']
+    nose.tools.eq_(list(cfg.successors(b)), [c])
+    nose.tools.eq_(list(cfg.successors(c)), [e])
+    nose.tools.eq_(list(cfg.successors(d)), [e])
+    nose.tools.assert_true(flows(cfg, block_of(cfg, 'a'), d))
+
+def test_try():
+    cfg = function_cfg('try { a(); } catch (E $e) { b(); } finally { c(); }'
+                       ' d();')
+    a, b, c = [block_of(cfg, name) for name in 'abc']
+    nose.tools.eq_(set(cfg.successors(a)), set([b, c]))
+    nose.tools.eq_(list(cfg.successors(b)), [c])
+    nose.tools.eq_(list(cfg.successors(c)), [block_of(cfg, 'd')])
+
+    cfg = function_cfg('try { throw a(); b(); } catch (E $e) { c(); }')
+    nose.tools.eq_(list(cfg.successors(block_of(cfg, 'a'))),
+                   [block_of(cfg, 'c')])
+    nose.tools.eq_(cfg.unreachable_blocks(), [block_of(cfg, 'b')])
+
+def test_exits():
+    cfg = function_cfg('if ($a) { return a(); } exit(b()); c();')
+    nose.tools.eq_(list(cfg.successors(block_of(cfg, 'a'))), [EXIT])
+    nose.tools.eq_(list(cfg.successors(block_of(cfg, 'b'))), [EXIT])
+    nose.tools.eq_(cfg.unreachable_blocks(), [block_of(cfg, 'c')])
+
+def test_functions_and_cache():
+    nodes = parse_source('''<?php
+        function f() { return function() { a(); }; }
+        class C { function m() {} }
+        function f2() { return function() { a(); }; }
+    ''')
+    found = list(functions(nodes))
+    nose.tools.eq_([f.__class__.__name__ for f in found],
+                   ['Function', 'Closure', 'Method', 'Function', 'Closure'])
+    nose.tools.assert_not_equal(structural_hash(found[1]),
+                                structural_hash(found[4]))
+    nose.tools.eq_(structural_hash(found[1], with_lineno=False),
+                   structural_hash(found[4], with_lineno=False))
+
+    cache = CFGCache()
+    cfg = cache.get(found[0])
+    nose.tools.assert_true(cache.get(found[0]) is cfg)
+    nose.tools.assert_true(cache.get(found[3]) is not cfg)
+
+    # an equal function from a reparsed file gets the same graph over
+    # its own nodes
+    function = parse_source('''<?php
+        function f() { return function() { a(); }; }''')[0]
+    again = cache.get(function)
+    nose.tools.assert_true(again.function is function)
+    nose.tools.eq_(again.blocks, cfg.blocks)
+    nose.tools.eq_(list(again.successors(ENTRY)), list(cfg.successors(ENTRY)))
+    nodes = [node for block in again.blocks for node in block]
+    nose.tools.assert_true(nodes[0] is function.nodes[0])
+    nose.tools.assert_true(cache.get(function) is again)
@@ -0,0 +1,71 @@
+from phply.clones import CloneDetector, fingerprints
+from phply.project import parse_source
+
+import nose.tools
+
+original = r"""<?php
+class A {
+    function total($items) {
+        $sum = 0;
+        foreach ($items as $item) {
+            if ($item->price > 10) {
+                $sum += $item->price * 2;
+            }
+        }
+        return $sum;
+    }
+}
+"""
+
+renamed = r"""<?php
+function total_of($rows) {
+    $t = 0;
+    foreach ($rows as $row) {
+        if ($row->price > 10) {
+            $t += $row->price * 2;
+        }
+    }
+    return $t;
+}
+"""
+
+changed_literal = renamed.replace('> 10', '> 20')
+
+def test_renamed_variables():
+    detector = CloneDetector(min_size=10)
+    detector.add_file('a.php', parse_source(original))
+    detector.add_file('b.php', parse_source(renamed))
+    groups = detector.groups()
+    # only the biggest duplicated subtree is reported, not its parts
+    nose.tools.eq_(len(groups), 1)
+    nose.tools.eq_([(f.path, f.start, f.end, f.kind) for f in groups[0]],
+                   [('a.php', 5, 7, 'Foreach'), ('b.php', 4, 6, 'Foreach')])
+
+def test_abstract_literals():
+    for abstract, expected in ((False, 0), (True, 1)):
+        detector = CloneDetector(min_size=10, abstract_literals=abstract)
+        detector.add_file('b.php', parse_source(renamed))
+        detector.add_file('c.php', parse_source(changed_literal))
+        groups = detector.groups()
+        nose.tools.eq_(len([g for g in groups if g[0].kind == 'Function']),
+                       expected)
+
+def test_fingerprints():
+    found, digest = fingerprints(parse_source(original), min_size=1000)
+    nose.tools.eq_(found, [])
+    found, other = fingerprints(parse_source(original.replace('$sum', '$s')))
+    nose.tools.eq_(digest, other)
+    detector = CloneDetector()
+    detector.add_file('a.php', parse_source(original))
+    detector.add_file('copy.php', parse_source(original))
+    nose.tools.eq_(detector.duplicate_files(), [['a.php', 'copy.php']])
+
+def test_shared_nodes():
+    # ?: puts its condition in the tree twice
+    found, digest = fingerprints(parse_source('<?php $x = $a ?: $b;'),
+                                 min_size=1)
+    nose.tools.eq_(sorted(kind for _, _, _, _, _, kind in found),
+                   ['Assignment', 'TernaryOp', 'Variable', 'Variable',
+                    'Variable', 'Variable'])
+    nose.tools.eq_(digest, fingerprints(parse_source('<?php $y = $c ?: $d;'),
+                                        min_size=1)[1])
@@ -0,0 +1,133 @@
+from __future__ import print_function
+
+from phply import phplex
+from phply.phpparse import make_parser
+from phply.phpast import *
+from phply.constfold import ConstantFolder, NotConstant, fold_constants
+
+import nose.tools
+import pprint
+
+parser = make_parser()
+
+def parse(input):
+    lexer = phplex.lexer.clone()
+    return parser.parse(input, lexer=lexer)
+
+def eq_folded(input, expected):
+    output = parse(input)
+    fold_constants(output)
+
+    print('Folded output:')
+    pprint.pprint(output)
+    print()
+
+    for out, exp in zip(output, expected):
+        nose.tools.eq_(out, exp)
+    assert len(output) == len(expected), \
+           'output length was %d, expected %s' % (len(output), len(expected))
+
+def eq_value(input, expected):
+    folder = ConstantFolder()
+    value = folder.evaluate(parse('<?php ' + input + ';')[0])
+    print('got:', repr(value), '\texpected:', repr(expected))
+    nose.tools.eq_(value, expected)
+    nose.tools.eq_(type(value), type(expected))
+
+def test_arithmetic():
+    eq_value('1 + 2 * 3', 7)
+    eq_value('7 / 2', 3.5)
+    eq_value('6 / 2', 3)
+    eq_value('-7 % 3', -1)
+    eq_value('1 << 3 | 1', 9)
+    eq_value('PHP_INT_MAX + 1', 9.2233720368547758e18)
+    eq_value('"10 apples" + 5', 15)
+    eq_value('"1.5" + 1', 2.5)
+
+def test_strings():
+    eq_value('"a" . 1 . 2.5', 'a12.5')
+    eq_value('1.0 . ""', '1')
+    eq_value('1e25 . ""', '1.0E+25')
+    eq_value('0.1 + 0.2 . ""', '0.3')
+    eq_value('true . false . null', '1')
+
+def test_comparisons():
+    eq_value('"abc" == 0', True)
+    eq_value('"1e1" == "10"', True)
+    eq_value('"abc" == "ABC"', False)
+    eq_value('null == false', True)
+    eq_value('1 === 1.0', False)
+    eq_value('2 > 1 ? "y" : "n"', 'y')
+
+def test_casts():
+    eq_value('(int) "12abc"', 12)
+    eq_value('(bool) "0"', False)
+    eq_value('(string) 3', '3')
+
+def test_not_constant():
+    folder = ConstantFolder()
+    for input in ['$a + 1', 'foo() . "x"', '1 / 0', 'UNKNOWN']:
+        node = parse('<?php ' + input + ';')[0]
+        nose.tools.assert_raises(NotConstant, folder.evaluate, node)
+
+def test_fold_expressions():
+    input = r"""<?php
+        $a = 1 + 2 * 3;
+        $b = $c + (2 * 3);
+        $d = -1;
+        $e = PHP_EOL . 'x';
+        $f = (1 < 2) && false;
+    ?>"""
+    expected = [
+        Assignment(Variable('$a'), 7, False),
+        Assignment(Variable('$b'), BinaryOp('+', Variable('$c'), 6), False),
+        Assignment(Variable('$d'), -1, False),
+        Assignment(Variable('$e'), '\nx', False),
+        Assignment(Variable('$f'), Constant('false'), False),
+    ]
+    eq_folded(input, expected)
+
+def test_fold_declarations():
+    input = r"""<?php
+        namespace Foo;
+        const PREFIX = 'app_';
+        class Base {
+            const SIZE = 2;
+        }
+        class Child extends Base {
+            const NAME = PREFIX . 'child';
+            const DOUBLE = parent::SIZE * self::SIZE;
+            public $map = array(self::NAME => 1, 2, 3);
+        }
+    ?>"""
+    expected = [
+        Namespace('Foo', []),
+        ConstantDeclarations([ConstantDeclaration('PREFIX', 'app_')]),
+        Class('Base', None, None, [], [], [
+            ClassConstants([ClassConstant('SIZE', 2)]),
+        ]),
+        Class('Child', None, 'Base', [], [], [
+            ClassConstants([ClassConstant('NAME', 'app_child')]),
+            ClassConstants([ClassConstant('DOUBLE', 4)]),
+            ClassVariables(['public'], [
+                ClassVariable('$map', Array([
+                    ArrayElement('app_child', 1, False),
+                    ArrayElement(None, 2, False),
+                    ArrayElement(None, 3, False),
+                ])),
+            ]),
+        ]),
+    ]
+    eq_folded(input, expected)
+
+def test_declaration_cache():
+    nodes = parse(r"""<?php
+        define('BASE', 10);
+        class A { const X = BASE * 2; const Y = self::X + 1; const Z = self::Z; }
+    """)
+    folder = fold_constants(nodes)
+    nose.tools.eq_(folder.cache[('a', 'X')], 20)
+    nose.tools.eq_(folder.cache[('a', 'Y')], 21)
+    nose.tools.eq_(folder.cache[('', 'BASE')], 10)
+    # cyclic declarations are left alone
+    nose.tools.eq_(nodes[1].nodes[2].nodes[0].initial, StaticProperty('self', 'Z'))
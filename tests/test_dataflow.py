@@ -0,0 +1,98 @@
+from phply import phpast as ast
+from phply.cfg import build_cfg, ENTRY, EXIT
+from phply.dataflow import (FunctionFacts, LiveVariables, Problem,
+                            ReachingDefinitions, TaintConfig, solve, taint)
+from phply.project import parse_source
+
+import nose.tools
+
+def function_cfg(code, params='$a'):
+    nodes = parse_source('<?php function f(%s) {%s}' % (params, code))
+    return build_cfg(nodes[0])
+
+def block_of(cfg, name):
+    for i, block in enumerate(cfg.blocks):
+        for node in block:
+            if isinstance(node, ast.FunctionCall) and node.name == name:
+                return i
+    raise KeyError(name)
+
+def test_problem():
+    # the base problem passes the boundary value through every block
+    class Entry(Problem):
+        def boundary(self):
+            return 1
+    cfg = function_cfg('if ($a) { f(); } g();')
+    inputs, outputs = solve(cfg, Entry())
+    nose.tools.eq_(outputs[EXIT], 1)
+    nose.tools.eq_(outputs[block_of(cfg, 'g')], 1)
+    nose.tools.eq_(set(solve(cfg, Problem())[1]), set([0]))
+
+def test_reaching_definitions():
+    cfg = function_cfg('$x = 1; if ($a) { $x = 2; } else { $x[] = 3; } use_($x);')
+    result = ReachingDefinitions(cfg)
+    reaching = result.reaching(block_of(cfg, 'use_'), '$x')
+    nose.tools.eq_(sorted(d.node.lineno for d in reaching), [1, 1, 1])
+    nose.tools.eq_(sorted(d.node.expr for d in reaching), [1, 2, 3])
+    nose.tools.eq_([d.variable for d in result.reaching(EXIT)
+                    if d.variable == '$a'], ['$a'])
+
+def test_reaching_definitions_loop():
+    cfg = function_cfg('$i = 0; while (check($i)) { $i++; } done($i);',
+                       params='')
+    result = ReachingDefinitions(cfg)
+    header = block_of(cfg, 'check')
+    nose.tools.eq_(sorted(d.node.__class__.__name__
+                          for d in result.reaching(header)),
+                   ['Assignment', 'PostIncDecOp'])
+
+def test_liveness():
+    cfg = function_cfg('$x = $a; $y = 1; for ($i = 0; $i < 10; $i++) {'
+                       ' $y = $y * 2; } out($x, $y);')
+    live = LiveVariables(cfg)
+    nose.tools.eq_(live.live_at_entry(cfg.successors(ENTRY)[0]), ['$a'])
+    nose.tools.eq_(sorted(live.live_at_exit(cfg.successors(ENTRY)[0])),
+                   ['$i', '$x', '$y'])
+    nose.tools.eq_(sorted(live.live_at_entry(block_of(cfg, 'out'))),
+                   ['$x', '$y'])
+    nose.tools.eq_(live.live_at_exit(block_of(cfg, 'out')), [])
+
+def test_taint():
+    cfg = function_cfg('''
+        $name = $_GET['name'];
+        $safe = htmlspecialchars($name);
+        echo $safe;
+        echo "Hello $name";
+        $q = "SELECT * FROM t WHERE id = " . (int) $_GET['id'];
+        mysql_query($q);
+        $rows = array();
+        $rows[] = file_get_contents($a);
+        foreach ($rows as $row) {
+            system($row);
+        }
+        $name = 'fixed';
+        echo $name;
+    ''')
+    findings = taint(cfg)
+    nose.tools.eq_([(f.sink, f.lineno, f.variables) for f in findings],
+                   [('echo', 5, ['$name']), ('system', 11, ['$row'])])
+
+def test_taint_through_branches():
+    code = '''
+        if ($a) { $x = $_POST['x']; } else { $x = ''; }
+        while ($a) { $y = $x; }
+        exec($y);
+    '''
+    findings = taint(function_cfg(code))
+    nose.tools.eq_([(f.sink, f.variables) for f in findings],
+                   [('exec', ['$y'])])
+    config = TaintConfig(sanitizers=['exec'])
+    nose.tools.eq_(len(taint(function_cfg(code), config)), 1)
+    config = TaintConfig(sinks=['echo'])
+    nose.tools.eq_(taint(function_cfg(code), config), [])
+
+def test_tainted_params():
+    cfg = function_cfg('eval($a);')
+    nose.tools.eq_(taint(cfg), [])
+    facts = FunctionFacts(cfg, TaintConfig(tainted_params=True))
+    nose.tools.eq_([f.variables for f in taint(cfg, facts=facts)], [['$a']])
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+
+from phply.extract import (Extractor, decode_double_quoted,
+                           decode_single_quoted, extract, extract_files)
+
+import nose.tools
+
+def values(source, types):
+    return [item.value for item in extract(source, types)]
+
+def test_single_quoted():
+    nose.tools.eq_(decode_single_quoted(r"it\'s a \\ and \n"),
+                   "it's a \\ and \\n")
+    nose.tools.eq_(values(r"<?php $a = 'it\'s \n';",
+                          ['CONSTANT_ENCAPSED_STRING']),
+                   ["it's \\n"])
+
+def test_double_quoted_escapes():
+    nose.tools.eq_(decode_double_quoted(r'\n\t\r\v\e\f\\\$\"'),
+                   '\n\t\r\v\x1b\f\\$"')
+    nose.tools.eq_(decode_double_quoted(r'\101\60\x41\x4\u{263A}'),
+                   u'A0A\x04\u263a')
+    # unknown escapes keep their backslash
+    nose.tools.eq_(decode_double_quoted(r'\q\xZz\''),
+                   r'\q\xZz' + "\\'")
+    # in heredocs a double quote is not escaped
+    nose.tools.eq_(decode_double_quoted(r'\"', None), r'\"')
+
+def test_string_states():
+    source = r'''<?php
+$a = "x\101 $b \q";
+$c = <<<EOT
+a\"b\n
+EOT;
+$d = <<<'EOT'
+raw\n
+EOT;
+$e = `ls \` -l`;
+'''
+    nose.tools.eq_(''.join(values(source, ['ENCAPSED_AND_WHITESPACE'])),
+                   'xA  \\qa\\"b\n\nraw\\n\nls ` -l')
+
+def test_comments_and_identifiers():
+    source = '<?php\n// one\n/** two */\nfunction foo() { bar(); }\n'
+    items = list(extract(source))
+    nose.tools.eq_([(item.type, item.value, item.lineno) for item in items],
+                   [('COMMENT', '// one\n', 2),
+                    ('DOC_COMMENT', '/** two */', 3),
+                    ('STRING', 'foo', 4),
+                    ('STRING', 'bar', 4)])
+    nose.tools.eq_(items[1].lexpos, source.index('/**'))
+
+def test_streams_until_error():
+    found = []
+    with nose.tools.assert_raises(SyntaxError):
+        for item in extract('<?php foo(); bar(); \x01'):
+            found.append(item.value)
+    nose.tools.eq_(found, ['foo', 'bar'])
+
+def test_unbalanced_braces():
+    # the same partial fails whatever was lexed before it
+    nose.tools.assert_raises(SyntaxError, list, extract('<?php } ?>'))
+    list(extract('<?php if ($a) { ?>'))
+    nose.tools.assert_raises(SyntaxError, list, extract('<?php } ?>'))
+
+def test_extractor():
+    comments = []
+    names = []
+    extractor = Extractor()
+    extractor.subscribe('COMMENT', lambda item, name: comments.append(
+        (name, item.value)))
+    extractor.subscribe('STRING', lambda item, name: names.append(item.value))
+    extractor.feed('<?php # hi\nfoo("bar");', 'a.php')
+    nose.tools.eq_(comments, [('a.php', '# hi\n')])
+    nose.tools.eq_(names, ['foo'])
+
+def test_extract_files():
+    root = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(root, 'a.php'), 'w') as f:
+            f.write("<?php echo 'hello';")
+        with open(os.path.join(root, 'b.php'), 'w') as f:
+            f.write('<?php \x01')
+        with open(os.path.join(root, 'c.php'), 'w') as f:
+            f.write('<?php } ?>')
+        results = dict((os.path.basename(path), (items, error))
+                       for path, items, error in extract_files(
+                           [root], ['CONSTANT_ENCAPSED_STRING'], processes=1))
+        nose.tools.eq_([item.value for item in results['a.php'][0]],
+                       ['hello'])
+        nose.tools.eq_(results['b.php'][0], None)
+        nose.tools.assert_true(results['b.php'][1].startswith('SyntaxError'))
+        nose.tools.assert_true(results['c.php'][1].startswith('SyntaxError'))
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,74 @@
+from phply.hierarchy import Hierarchy
+from phply.project import parse_source
+
+import nose.tools
+
+source = r"""<?php
+    namespace App;
+    interface Shape { function area(); }
+    interface Polygon extends Shape {}
+    trait Named {
+        function name() { return 'shape'; }
+        function describe() {}
+    }
+    trait Logs { use Named; function log() {} }
+    abstract class Base implements Polygon, \Countable {
+        function count() {}
+        function log() {}
+    }
+    class Square extends Base {
+        use Logs { name as protected shapeName; describe as private; }
+        function area() {}
+    }
+    class Cube extends Square {}
+    class Circle implements Shape { function area() {} }
+"""
+
+def make_hierarchy():
+    hierarchy = Hierarchy()
+    hierarchy.add_file(parse_source(source), 'shapes.php')
+    return hierarchy
+
+def test_subtypes():
+    h = make_hierarchy()
+    nose.tools.assert_true(h.is_subtype('App\\Cube', 'App\\Shape'))
+    nose.tools.assert_true(h.is_subtype('\\app\\cube', 'Countable'))
+    nose.tools.assert_true(h.is_subtype('App\\Square', 'App\\Square'))
+    nose.tools.assert_false(h.is_subtype('App\\Circle', 'App\\Polygon'))
+    nose.tools.assert_false(h.is_subtype('App\\Square', 'App\\Logs'))
+    nose.tools.assert_false(h.is_subtype('App\\Square', 'Unknown'))
+
+def test_closures():
+    h = make_hierarchy()
+    nose.tools.eq_(sorted(h.ancestors('App\\Cube')),
+                   ['app\\base', 'app\\polygon', 'app\\shape', 'app\\square',
+                    'countable'])
+    nose.tools.eq_(sorted(h.descendants('App\\Shape')),
+                   ['app\\base', 'app\\circle', 'app\\cube', 'app\\polygon',
+                    'app\\square'])
+    nose.tools.eq_(sorted(h.subclasses('App\\Base')),
+                   ['app\\cube', 'app\\square'])
+    nose.tools.eq_(h.descendants('App\\Cube'), [])
+
+def test_method_resolution():
+    h = make_hierarchy()
+    nose.tools.eq_(h.resolve_method('App\\Cube', 'area'),
+                   ('app\\square', 'area'))
+    # trait methods override inherited ones
+    nose.tools.eq_(h.resolve_method('App\\Cube', 'log'), ('app\\logs', 'log'))
+    nose.tools.eq_(h.resolve_method('App\\Cube', 'COUNT'), ('app\\base', 'count'))
+    nose.tools.eq_(h.resolve_method('App\\Square', 'name'), ('app\\named', 'name'))
+    nose.tools.eq_(h.resolve_method('App\\Square', 'shapeName'),
+                   ('app\\named', 'name'))
+    table = h.method_table('App\\Square')
+    nose.tools.eq_(table['shapename'][2], ['protected'])
+    nose.tools.eq_(table['describe'][2], ['private'])
+    nose.tools.eq_(h.resolve_method('App\\Circle', 'log'), None)
+
+def test_remove_file():
+    h = make_hierarchy()
+    h.add_file(parse_source('<?php class Other extends App\\Circle {}'),
+               'other.php')
+    nose.tools.assert_true(h.is_subtype('Other', 'App\\Shape'))
+    h.remove_file('shapes.php')
+    nose.tools.assert_false(h.is_subtype('Other', 'App\\Shape'))
@@ -0,0 +1,100 @@
+from phply.includegraph import IncludeGraph, find_includes
+from phply.project import parse_source
+
+import nose.tools
+import os
+import shutil
+import tempfile
+
+files = {
+    'index.php': r"""<?php
+        define('LIB', __DIR__ . '/lib/');
+        require_once __DIR__ . '/config.php';
+        include LIB . 'db.php';
+        include $dynamic;
+    """,
+    'config.php': r"""<?php
+        require_once dirname(__FILE__) . '/lib/util.php';
+    """,
+    'lib/db.php': r"""<?php
+        require_once 'lib/util.php';
+    """,
+    'lib/util.php': r"""<?php
+        function util() {}
+    """,
+}
+
+def make_tree():
+    root = tempfile.mkdtemp()
+    for name, source in files.items():
+        write(root, name, source)
+    return root
+
+def write(root, name, source):
+    path = os.path.join(root, name)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write(source)
+
+def test_find_includes():
+    includes = find_includes(parse_source(files['index.php'], '/app/index.php'))
+    nose.tools.eq_([(i.kind, i.once, i.path) for i in includes], [
+        ('require', True, '/app/config.php'),
+        ('include', False, '/app/lib/db.php'),
+        ('include', False, None),
+    ])
+
+def test_graph_queries():
+    root = make_tree()
+    try:
+        path = lambda name: os.path.join(root, name)
+        graph = IncludeGraph()
+        nose.tools.eq_(graph.build(root, processes=1), 4)
+
+        nose.tools.eq_(graph.dependencies(path('index.php')),
+                       [path('config.php'), path('lib/db.php')])
+        nose.tools.eq_(graph.dependents(path('lib/util.php')),
+                       [path('config.php'), path('lib/db.php')])
+        nose.tools.eq_(graph.transitive_dependencies(path('index.php')),
+                       [path('config.php'), path('lib/db.php'),
+                        path('lib/util.php')])
+        nose.tools.eq_(graph.transitive_dependents(path('lib/util.php')),
+                       [path('config.php'), path('index.php'),
+                        path('lib/db.php')])
+        nose.tools.eq_([(p, i.lineno) for p, i in graph.unresolved()],
+                       [(path('index.php'), 5)])
+    finally:
+        shutil.rmtree(root)
+
+def test_cache():
+    root = make_tree()
+    try:
+        cache = os.path.join(root, 'graph.json')
+        nose.tools.eq_(IncludeGraph().build(root, processes=1, cache=cache), 4)
+
+        graph = IncludeGraph()
+        nose.tools.eq_(graph.build(root, processes=1, cache=cache), 0)
+        nose.tools.eq_(len(graph.dependencies(os.path.join(root, 'index.php'))), 2)
+
+        write(root, 'lib/db.php', '<?php ')
+        graph = IncludeGraph()
+        nose.tools.eq_(graph.build(root, processes=1, cache=cache), 1)
+        nose.tools.eq_(graph.dependents(os.path.join(root, 'lib/util.php')),
+                       [os.path.join(root, 'config.php')])
+    finally:
+        shutil.rmtree(root)
+
+def test_partials():
+    # a template partial closing a brace opened elsewhere is a file error
+    root = make_tree()
+    try:
+        write(root, 'views/footer.php', '<?php } ?>\n</body>')
+        graph = IncludeGraph()
+        nose.tools.eq_(graph.build(root, processes=1), 5)
+        error = graph.files[os.path.join(root, 'views/footer.php')][3]
+        nose.tools.assert_true(error.startswith('SyntaxError'))
+        nose.tools.eq_(len(graph.dependencies(os.path.join(root,
+                                                           'index.php'))), 2)
+    finally:
+        shutil.rmtree(root)
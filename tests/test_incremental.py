@@ -0,0 +1,154 @@
+import random
+
+from phply import phplex
+from phply.incremental import IncrementalParser
+from phply.phpast import Node
+from phply.phpparse import make_parser
+
+import nose.tools
+
+parser = make_parser(spans=True)
+
+source = '''<?php
+namespace A;
+use B\\C;
+function f($a) {
+    return $a + 1;
+}
+$x = "a $b c";
+class K extends C {
+    use T;
+    const X = 1;
+    public $v = array(1, 2);
+    function m() { return $this->v; }
+    function n() { return <<<EOT
+heredoc $x
+EOT;
+    }
+}
+?>
+<b>html</b>
+<?php
+if ($x) { echo 1; } else { echo 2; }
+;
+interface I { function i(); }
+foo(); bar();
+'''
+
+def flatten(nodes):
+    # the nodes with their positions, in document order
+    result = []
+    stack = list(reversed(nodes))
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(reversed(node))
+        elif isinstance(node, Node):
+            result.append((node.__class__.__name__, node.lineno,
+                           node.start_offset, node.end_offset))
+            stack.extend(reversed([getattr(node, field)
+                                   for field in node.fields]))
+        else:
+            result.append(node)
+    return result
+
+def check(incremental):
+    expected = parser.parse(incremental.source, lexer=phplex.lexer.clone())
+    nose.tools.eq_(incremental.nodes, expected)
+    nose.tools.eq_(flatten(incremental.nodes), flatten(expected))
+
+def insert(incremental, after, text):
+    pos = incremental.source.index(after) + len(after)
+    incremental.edit(pos, pos, text)
+
+def test_reuses_statements():
+    incremental = IncrementalParser(source)
+    check(incremental)
+    before = incremental.nodes
+    insert(incremental, 'return $a + 1', '0')
+    check(incremental)
+    nose.tools.eq_(incremental.reparsed,
+                   len('\nfunction f($a) {\n    return $a + 10;\n}\n'))
+    after = incremental.nodes
+    nose.tools.assert_true(after[0] is before[0])
+    nose.tools.assert_true(after[3] is before[3])
+    nose.tools.assert_false(after[2] is before[2])
+
+def test_class_members():
+    incremental = IncrementalParser(source)
+    cls = incremental.nodes[4]
+    members = list(cls.nodes)
+    insert(incremental, 'return $this->v', 'alue')
+    check(incremental)
+    nose.tools.assert_true(incremental.nodes[4] is cls)
+    nose.tools.assert_true(cls.nodes[1] is members[1])
+    nose.tools.assert_false(cls.nodes[2] is members[2])
+    nose.tools.assert_true(cls.nodes[3] is members[3])
+    nose.tools.assert_true(incremental.reparsed < 60)
+    insert(incremental, 'const X = 1;', '\n    public $w;')
+    check(incremental)
+
+def test_lines_move():
+    incremental = IncrementalParser(source)
+    insert(incremental, '<?php\n', '$y = 1;\n\n')
+    check(incremental)
+    nose.tools.eq_(incremental.nodes[-1].lineno, 26)
+
+def test_syntax_error():
+    incremental = IncrementalParser(source)
+    with nose.tools.assert_raises(SyntaxError):
+        insert(incremental, 'foo()', ' +')
+    # the next edit parses the whole file again
+    pos = incremental.source.rindex(' +')
+    incremental.edit(pos, pos + 2, '')
+    check(incremental)
+
+def test_inline_html():
+    # an edit that breaks an open tag turns the HTML before it into more
+    # of the same INLINE_HTML token
+    incremental = IncrementalParser('<?php\n$a = 1;\n?>\nhello <?php\n')
+    pos = incremental.source.rindex('<?php') + 1
+    incremental.edit(pos, pos, '}')
+    check(incremental)
+    incremental.edit(pos, pos + 1, '')
+    check(incremental)
+
+def test_line_comments():
+    # a comment made or lengthened by an edit runs on past the region
+    incremental = IncrementalParser(
+        '<?php\nclass K {\n    public $v;\n    function m() {}\n}\n')
+    pos = incremental.source.index('    function')
+    incremental.edit(pos, pos, '#')
+    check(incremental)
+    nose.tools.eq_(incremental.nodes[0].nodes[1:], [])
+    incremental.edit(pos, pos + 1, '')
+    check(incremental)
+    incremental = IncrementalParser('<?php\n# c\n$a = 1; $b = 2;\nf();\n')
+    pos = incremental.source.index('\n$a')
+    incremental.edit(pos, pos + 1, '')
+    check(incremental)
+    nose.tools.eq_(len(incremental.nodes), 1)
+
+def test_random_edits():
+    snippets = ['x', ' ', '\n', ';', '$y = 2;', '}', '{', '"', '/*', '*/',
+                '?>', '<?php ', '1', 'function g() {}', 'public $q;', '#',
+                '//', '']
+    for seed in range(10):
+        rng = random.Random(seed)
+        incremental = IncrementalParser(source)
+        for trial in range(300):
+            current = incremental.source
+            start = rng.randrange(len(current) + 1)
+            end = min(len(current), start + rng.choice([0, 1, 5]))
+            text = rng.choice(snippets)
+            if trial % 10 == 0 and '\n' in current:
+                # join two lines
+                start = current.index('\n', rng.randrange(
+                    current.rindex('\n') + 1))
+                end, text = start + 1, ''
+            try:
+                incremental.edit(start, end, text)
+            except SyntaxError:
+                # undo it
+                incremental.edit(start, start + len(text), current[start:end])
+            check(incremental)
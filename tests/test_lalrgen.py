@@ -0,0 +1,178 @@
+from phply import lalrgen
+from phply import phpast as ast
+from phply import phplex
+from phply.lalrgen import load_driver, _passes_up
+from phply.phpparse import make_parser
+
+import nose.tools
+import os
+import shutil
+import sys
+import tempfile
+
+parser = make_parser()
+driver = load_driver()
+
+sources = [
+    '<?php $a = 1 + 2 * -$b . "x $c {$d[1]} ${e}" . `ls $f`;',
+    '''<?php
+namespace A\\B;
+use C\\D as E;
+/** f */
+function &f($a, array $b = array(1, 2), E &$c = null) {
+    static $x = 1;
+    global $y;
+    if ($a): echo 1; elseif ($b): echo 2; else: echo 3; endif;
+    foreach ($b as $k => &$v) { continue; }
+    for ($i = 0, $j = 1; $i < 10; $i++) { break 1; }
+    while (true) do { $a--; } while (false);
+    switch ($a) { case 1: default: exit; }
+    try { throw new E(); } catch (E $e) { } finally { }
+    list($p, list(, $q)) = $b;
+    return function ($x) use (&$y) { yield $x; };
+}
+/** K */
+abstract class K extends E implements I, J {
+    use T;
+    /** X */
+    const X = 1, Y = self::X;
+    /** v */
+    public static $v = array('a' => 1), $w;
+    /** m */
+    final public function m() { return $this->v[0]->w; }
+    abstract protected function n();
+}
+interface I extends J { function i(); }
+trait T { function a() { return __CLASS__; } }
+$o = new K;
+$o->m()->n(1, $r);
+print $a ? : $b;
+declare(ticks=1);
+?>
+<p><?= $a ?></p>
+<?php
+echo <<<EOT
+heredoc $a {$b->c}
+EOT;
+echo <<<'EOT'
+nowdoc
+EOT;
+''',
+]
+
+def flatten(nodes):
+    result = []
+    stack = list(reversed(nodes))
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(reversed(node))
+        elif isinstance(node, ast.Node):
+            result.append((node.__class__.__name__, node.lineno,
+                           node.doc_comment if isinstance(node,
+                                                          ast.declarations)
+                           else None))
+            stack.extend(reversed([getattr(node, field)
+                                   for field in node.fields]))
+        else:
+            result.append(node)
+    return result
+
+def parse_both(source, doc_comments=False):
+    return [p.parse(source,
+                    lexer=phplex.FilteredLexer(phplex.new_lexer(),
+                                               doc_comments))
+            for p in (parser, driver)]
+
+def test_same_trees():
+    for source in sources:
+        for doc_comments in (False, True):
+            expected, result = parse_both(source, doc_comments)
+            nose.tools.eq_(result, expected)
+            nose.tools.eq_(flatten(result), flatten(expected))
+
+def test_doc_comments():
+    expected, result = parse_both(sources[1], True)
+    nose.tools.eq_(result[3].doc_comment, '/** K */')
+    nose.tools.eq_([member.doc_comment for member in result[3].nodes],
+                   ['/** X */', '/** v */', '/** m */', None])
+
+def test_syntax_errors():
+    for source in ('<?php $a = ;', '<?php function', '<?php }'):
+        errors = []
+        for p in (parser, driver):
+            try:
+                p.parse(source, lexer=phplex.lexer.clone())
+            except SyntaxError as e:
+                errors.append((e.__class__, e.args))
+        nose.tools.eq_(len(errors), 2)
+        nose.tools.eq_(errors[0], errors[1])
+
+def test_passes_up():
+    def p_simple(p):
+        '''a : b'''
+        p[0] = p[1]
+    def p_choice(p):
+        '''a : b
+             | a PLUS b'''
+        if len(p) == 2:
+            # just b
+            p[0] = p[1]
+        else:
+            p[0] = p[1] + p[3]
+    def p_other(p):
+        '''a : b'''
+        p[0] = [p[1]]
+    def p_test(p):
+        '''a : b'''
+        if p[1]:
+            p[0] = p[1]
+    assert _passes_up(p_simple, 1)
+    assert _passes_up(p_choice, 1)
+    assert not _passes_up(p_other, 1)
+    assert not _passes_up(p_test, 1)
+
+def test_options():
+    # the driver runs phpparse's own actions
+    for options in ({'spans': True}, {'interpolated_strings': True}):
+        nose.tools.assert_raises(ValueError, lalrgen.generate,
+                                 make_parser(**options))
+
+def test_signature_without_source():
+    getsourcefile = lalrgen.inspect.getsourcefile
+    lalrgen.inspect.getsourcefile = lambda module: None
+    try:
+        signature = lalrgen.grammar_signature()
+        nose.tools.eq_(lalrgen.grammar_signature(), signature)
+    finally:
+        lalrgen.inspect.getsourcefile = getsourcefile
+    assert signature != lalrgen.grammar_signature()
+
+def test_write_driver():
+    directory = tempfile.mkdtemp()
+    try:
+        path = lalrgen.write_driver(directory)
+        nose.tools.eq_(os.listdir(directory), ['parsedriver.py'])
+        with open(path) as f:
+            compile(f.read(), path, 'exec')
+    finally:
+        shutil.rmtree(directory)
+
+def test_cut_short():
+    # a driver left half written by another process is generated again
+    path = lalrgen._default_path()
+    with open(path) as f:
+        whole = f.read()
+    module = sys.modules.pop('phply.parsedriver')
+    try:
+        with open(path, 'w') as f:
+            f.write(whole[:len(whole) // 2])
+        reloaded = load_driver()
+        nose.tools.eq_(reloaded.parse('<?php echo 1;',
+                                      lexer=phplex.lexer.clone()),
+                       parser.parse('<?php echo 1;',
+                                    lexer=phplex.lexer.clone()))
+        with open(path) as f:
+            nose.tools.eq_(f.read(), whole)
+    finally:
+        sys.modules['phply.parsedriver'] = module
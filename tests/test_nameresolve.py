@@ -0,0 +1,152 @@
+from __future__ import print_function
+
+from phply.phpast import *
+from phply.project import parse_source
+from phply.nameresolve import NameResolver, SymbolTable, resolve_names
+
+import nose.tools
+import pprint
+
+def eq_resolved(input, expected, symbols=None):
+    output = resolve_names(parse_source(input), symbols)
+
+    print('Resolved output:')
+    pprint.pprint(output)
+    print()
+
+    for out, exp in zip(output, expected):
+        nose.tools.eq_(out, exp)
+    assert len(output) == len(expected), \
+           'output length was %d, expected %s' % (len(output), len(expected))
+
+def test_global_namespace():
+    input = r"""<?php
+        new Foo;
+        Bar\baz();
+        \strlen($a);
+        PHP_EOL;
+        true;
+    ?>"""
+    expected = [
+        New('\\Foo', []),
+        FunctionCall('\\Bar\\baz', []),
+        FunctionCall('\\strlen', [Parameter(Variable('$a'), False)]),
+        Constant('\\PHP_EOL'),
+        Constant('true'),
+    ]
+    eq_resolved(input, expected)
+
+def test_use_aliases():
+    input = r"""<?php
+        namespace App;
+        use Lib\Foo, Lib\Bar as Baz;
+        new Foo;
+        Baz::make();
+        Baz\Sub::X;
+        Foo\helper();
+        namespace\local();
+        $a instanceof Foo;
+        $a instanceof self;
+        $a instanceof parent;
+        self::X;
+    ?>"""
+    expected = [
+        Namespace('App', []),
+        UseDeclarations([UseDeclaration('Lib\\Foo', None),
+                         UseDeclaration('Lib\\Bar', 'Baz')]),
+        New('\\Lib\\Foo', []),
+        StaticMethodCall('\\Lib\\Bar', 'make', []),
+        StaticProperty('\\Lib\\Bar\\Sub', 'X'),
+        FunctionCall('\\Lib\\Foo\\helper', []),
+        FunctionCall('\\App\\local', []),
+        BinaryOp('instanceof', Variable('$a'), Constant('\\Lib\\Foo')),
+        BinaryOp('instanceof', Variable('$a'), Constant('self')),
+        BinaryOp('instanceof', Variable('$a'), Constant('parent')),
+        StaticProperty('self', 'X'),
+    ]
+    eq_resolved(input, expected)
+
+def test_declarations():
+    input = r"""<?php
+        namespace App {
+            use Lib\Base;
+            class A extends Base implements \Countable, Contracts\Named {
+                use Helpers;
+                function f(Base $b, array $c) {
+                    try {} catch (Exception $e) {}
+                }
+            }
+            interface I extends Base {}
+        }
+    ?>"""
+    expected = [
+        Namespace('App', [
+            UseDeclarations([UseDeclaration('Lib\\Base', None)]),
+            Class('A', None, '\\Lib\\Base',
+                  ['\\Countable', '\\App\\Contracts\\Named'],
+                  [TraitUse('\\App\\Helpers', [])], [
+                Method('f', [], [
+                    FormalParameter('$b', None, False, '\\Lib\\Base'),
+                    FormalParameter('$c', None, False, 'array'),
+                ], [
+                    Try([], [Catch('\\App\\Exception', Variable('$e'), [])],
+                        None),
+                ], False),
+            ]),
+            Interface('I', ['\\Lib\\Base'], []),
+        ]),
+    ]
+    eq_resolved(input, expected)
+
+def test_function_fallback():
+    symbols = SymbolTable()
+    symbols.add_nodes(parse_source(r"""<?php
+        namespace App;
+        function helper() {}
+        const LIMIT = 1;
+    """))
+    input = r"""<?php
+        namespace App;
+        helper();
+        strlen('');
+        LIMIT;
+        E_ALL;
+    ?>"""
+    expected = [
+        Namespace('App', []),
+        FunctionCall('\\App\\helper', []),
+        FunctionCall('\\strlen', [Parameter('', False)]),
+        Constant('\\App\\LIMIT'),
+        Constant('\\E_ALL'),
+    ]
+    eq_resolved(input, expected, symbols)
+
+def test_own_definitions():
+    # without symbols, the file's own definitions are known
+    input = r"""<?php
+        namespace App;
+        function helper() {}
+        const LIMIT = 1;
+        helper(LIMIT);
+        strlen(E_ALL);
+    ?>"""
+    expected = [
+        Namespace('App', []),
+        Function('helper', [], [], False),
+        ConstantDeclarations([ConstantDeclaration('LIMIT', 1)]),
+        FunctionCall('\\App\\helper',
+                     [Parameter(Constant('\\App\\LIMIT'), False)]),
+        FunctionCall('\\strlen', [Parameter(Constant('\\E_ALL'), False)]),
+    ]
+    eq_resolved(input, expected)
+
+def test_import_maps():
+    resolver = NameResolver()
+    resolver.resolve(parse_source(r"""<?php
+        namespace A; use X\Y;
+        namespace B; use X\Z as W;
+    """), 'two.php')
+    first, second = resolver.import_maps['two.php']
+    nose.tools.eq_(first.resolve_class('Y'), '\\X\\Y')
+    nose.tools.eq_(second.resolve_class('W\\V'), '\\X\\Z\\V')
+    nose.tools.eq_(second.resolve_class('Y'), '\\B\\Y')
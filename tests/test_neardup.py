@@ -0,0 +1,115 @@
+import array
+import os
+import random
+import shutil
+import tempfile
+
+from phply import neardup
+from phply.neardup import (NearDuplicates, shingles, signature, similarity,
+                           tokens)
+
+import nose.tools
+
+def make_source(seed, lines=200):
+    rng = random.Random(seed)
+    words = ['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta']
+    body = ['<?php']
+    for i in range(lines):
+        body.append('$x%d = %s($y, "%d") + %s();' % (
+            i, rng.choice(words), i, rng.choice(words)))
+    return '\n'.join(body) + '\n'
+
+def test_tokens():
+    nose.tools.eq_(tokens("<?php $a = Foo(1, 'x'); // hi"),
+                   ['$', 'EQUALS', 'foo', 'LPAREN', '0', 'COMMA', "''",
+                    'RPAREN', 'SEMI'])
+
+def test_signature_estimates_jaccard():
+    a = set(range(0, 3000))
+    b = set(range(1000, 4000))
+    estimate = similarity(signature(a, 256), signature(b, 256))
+    # the true Jaccard similarity is 0.5
+    nose.tools.assert_true(0.4 < estimate < 0.6, estimate)
+    nose.tools.eq_(similarity(signature(a), signature(set(a))), 1.0)
+    nose.tools.eq_(signature(set()), None)
+    nose.tools.eq_(len(shingles(tokens('<?php foo();'), 5)), 1)
+
+def test_groups():
+    root = tempfile.mkdtemp()
+    try:
+        original = make_source(1)
+        files = {
+            'lib.php': original,
+            # a fork with renamed variables and a few edits
+            'vendor/lib.php': original.replace('$x1', '$renamed').replace(
+                'alpha($y, "5")', 'omega($z)'),
+            'other.php': '<?php\n' + ''.join(
+                'class C%d extends Base { public $v = array(%d); }\n' % (i, i)
+                for i in range(100)),
+            'empty.php': '',
+            'broken.php': '<?php $a = "unterminated',
+        }
+        for name, source in files.items():
+            path = os.path.join(root, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(source)
+        with NearDuplicates(threshold=0.7) as finder:
+            finder.add_files(root, processes=1)
+            groups = [[os.path.relpath(p, root) for p in group]
+                      for group in finder.groups()]
+        nose.tools.eq_(groups, [['lib.php', os.path.join('vendor', 'lib.php')]])
+    finally:
+        shutil.rmtree(root)
+
+def test_partials():
+    # unbalanced braces are a per-file error, whatever came before
+    nose.tools.assert_raises(SyntaxError, tokens, '<?php } ?>')
+    tokens('<?php if ($a) { ?>')
+    nose.tools.assert_raises(SyntaxError, tokens, '<?php } ?>')
+    root = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(root, 'partial.php'), 'w') as f:
+            f.write('<?php } ?>')
+        with NearDuplicates() as finder:
+            finder.add_files(root, processes=1)
+            nose.tools.eq_(finder.groups(), [])
+            nose.tools.eq_(list(finder.errors), [os.path.join(root,
+                                                             'partial.php')])
+    finally:
+        shutil.rmtree(root)
+
+def test_whole_buckets():
+    # all three share the first band, but only b and c are close, and
+    # they share no other band
+    signatures = {
+        'a': [1, 1, 2, 3],
+        'b': [1, 1, 5, 6],
+        'c': [1, 1, 5, 7],
+    }
+    with NearDuplicates(bands=2, rows=2, threshold=0.75) as finder:
+        for path in sorted(signatures):
+            finder.paths.append(path)
+            finder._file.write(neardup._tobytes(array.array(
+                'I', signatures[path])))
+        nose.tools.eq_(finder.groups(), [['b', 'c']])
+
+def test_crowded_bucket():
+    # every file shares the first band, and only the last two are close
+    compared = []
+    def counted(a, b):
+        compared.append(1)
+        return similarity(a, b)
+    with NearDuplicates(bands=2, rows=2, threshold=0.75,
+                        max_bucket=10) as finder:
+        for i in range(500):
+            finder.paths.append('%03d' % i)
+            row = [1, 1, 498, 0] if i == 499 else [1, 1, i, i + 1000]
+            finder._file.write(neardup._tobytes(array.array('I', row)))
+        neardup.similarity = counted
+        try:
+            nose.tools.eq_(finder.groups(), [['498', '499']])
+        finally:
+            neardup.similarity = similarity
+    assert len(compared) <= 500 * 10
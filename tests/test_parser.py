@@ -1001,3 +1001,115 @@ def test_exit_loc():
         Exit(1, 'exit', lineno=2)
     ]
     eq_ast(input, expected, with_top_lineno=True)
+
+def test_doc_comments():
+    input = r"""<?
+        /** header */
+        $x = 1;
+        /** Function */
+        function f() {}
+        /** Class */
+        abstract class C {
+            /** Method */
+            public static function m() {}
+            /** Variables */
+            var $v = 1, $w;
+            /** Constants */
+            const K = 1;
+            // not a doc comment
+            function n() {}
+        }
+        /** Interface */ interface I {}
+        /** Trait */ trait T { /** Trait method */ function t() {} }
+    ?>"""
+    lexer = phplex.FilteredLexer(phplex.full_lexer.clone(), doc_comments=True)
+    output = parser.parse(input, lexer=lexer)
+    nose.tools.eq_([node.doc_comment for node in output if
+                    isinstance(node, declarations)],
+                   ['/** Function */', '/** Class */', '/** Interface */',
+                    '/** Trait */'])
+    nose.tools.eq_([node.doc_comment for node in output[2].nodes],
+                   ['/** Method */', '/** Variables */', '/** Constants */',
+                    None])
+    nose.tools.eq_(output[4].nodes[0].doc_comment, '/** Trait method */')
+
+    # without the option doc comments are skipped as before
+    output = parser.parse(input, lexer=phplex.lexer.clone())
+    nose.tools.eq_(output[1].doc_comment, None)
+    nose.tools.eq_(output[2].nodes[0].doc_comment, None)
+
+def test_node_factory():
+    import collections
+    import phply.phpast
+
+    class Tuples(object):
+        pass
+    for name, cls in vars(phply.phpast).items():
+        if isinstance(cls, type) and issubclass(cls, Node) and cls is not Node:
+            # rename=True for fields that are keywords, like Try's finally
+            tuple_type = collections.namedtuple(name, cls.fields + ['lineno'],
+                                                rename=True)
+            tuple_type.__new__.__defaults__ = (None,)
+            setattr(Tuples, name, tuple_type)
+
+    def to_tuples(value):
+        if isinstance(value, list):
+            return [to_tuples(item) for item in value]
+        if isinstance(value, Node):
+            cls = getattr(Tuples, value.__class__.__name__)
+            return cls(*[to_tuples(getattr(value, field))
+                         for field in value.fields], lineno=value.lineno)
+        return value
+
+    input = r"""<?php
+        class C extends B { use T; const X = 1; function f($a = 1) {} }
+        foreach ($a as $k => $v) { echo "a $b c", <<<EOT
+heredoc $x
+EOT;
+        }
+    ?>"""
+    output = make_parser(factory=Tuples).parse(input,
+                                               lexer=phplex.lexer.clone())
+    expected = parser.parse(input, lexer=phplex.lexer.clone())
+    assert isinstance(output[0], tuple)
+    nose.tools.eq_(output, to_tuples(expected))
+    nose.tools.eq_(output[0].traits[0].lineno, 2)
+
+def test_interpolated_strings():
+    flat_parser = make_parser(interpolated_strings=True)
+    def parse_both(input):
+        return [p.parse(input, lexer=phplex.lexer.clone())
+                for p in (parser, flat_parser)]
+
+    input = r"""<?php
+        echo "a $b c {$d["k $e"]} f", "plain", "$g", `ls $h`, <<<EOT
+heredoc $i
+EOT;
+    ?>"""
+    expected, output = parse_both(input)
+    nose.tools.eq_(output[0].nodes, [
+        InterpolatedString(['a ', Variable('$b'), ' c ',
+                            ArrayOffset(Variable('$d'),
+                                        InterpolatedString(['k ',
+                                                            Variable('$e')])),
+                            ' f']),
+        'plain',
+        InterpolatedString([Variable('$g')]),
+        FunctionCall('shell_exec',
+                     [Parameter(InterpolatedString(['ls ', Variable('$h')]),
+                                False)]),
+        InterpolatedString(['heredoc ', Variable('$i')]),
+    ])
+    nose.tools.eq_(output[0].nodes[0].lineno, 2)
+    nose.tools.eq_(expand_interpolated_strings(output), expected)
+
+    # long strings stay flat
+    input = '<?php "%s";' % ('$a ' * 2000)
+    output = flat_parser.parse(input, lexer=phplex.lexer.clone())
+    nose.tools.eq_(len(output[0].parts), 4000)
+    nose.tools.eq_(output[0].parts[-2:], [Variable('$a'), ' '])
+
+    spans_parser = make_parser(spans=True, interpolated_strings=True)
+    output = spans_parser.parse('<?php $x = "a $b";', lexer=phplex.lexer.clone())
+    nose.tools.eq_((output[0].expr.start_offset, output[0].expr.end_offset),
+                   (11, 17))
@@ -0,0 +1,71 @@
+import json
+
+from phply import phplex
+from phply.phpast import *
+from phply.phpparse import make_parser
+
+import nose.tools
+
+parser = make_parser()
+
+source = r"""<?php
+namespace A;
+function f($a, &$b = array(1, 'x' => 2)) {
+    list($c, list($d, $e)) = $a;
+    return $b ? "a $c {$d[1]} e" : <<<EOT
+heredoc $e
+EOT;
+}
+class K extends B implements I { const X = 1; private static $v; }
+try { f(1.5); } catch (E $e) { } finally { echo true, null; }
+?>html"""
+
+def parse(text):
+    return parser.parse(text, lexer=phplex.lexer.clone())
+
+def test_generic():
+    nose.tools.eq_(Echo([BinaryOp('+', 1, Variable('$a'))], lineno=3)
+                   .generic(with_lineno=True),
+                   ('Echo', {'lineno': 3, 'nodes': [
+                       ('BinaryOp', {'lineno': None, 'op': '+', 'left': 1,
+                                     'right': ('Variable', {'lineno': None,
+                                                            'name': '$a'})})
+                   ]}))
+    # nested lists are exported too
+    assignment = parse('<?php list($a, list($b)) = $c;')[0]
+    nose.tools.eq_(assignment.generic()[1]['nodes'][1],
+                   [('Variable', {'name': '$b'})])
+
+def test_round_trip():
+    nodes = parse(source)
+    for with_lineno in (False, True):
+        exported = to_generic(nodes, with_lineno)
+        result = from_generic(exported)
+        nose.tools.eq_(result, nodes)
+        nose.tools.eq_(to_generic(result, with_lineno), exported)
+    result = from_generic(to_generic(nodes, True))
+    nose.tools.eq_([node.lineno for node in result[1:4]], [3, 9, 10])
+    nose.tools.eq_(from_generic(to_generic(nodes[0])), nodes[0])
+
+def test_json_round_trip():
+    nodes = parse(source)
+    exported = json.loads(json.dumps(to_generic(nodes, True)))
+    nose.tools.eq_(from_generic(exported), nodes)
+
+def test_deep_tree():
+    nodes = parse('<?php echo $a' + ' . $a' * 5000 + ';')
+    exported = to_generic(nodes)
+    depth = 0
+    value = exported[0][1]['nodes'][0]
+    while value[0] == 'BinaryOp':
+        depth += 1
+        value = value[1]['left']
+    nose.tools.eq_(depth, 5000)
+    # comparing trees this deep would recurse, so walk down the chain
+    value = from_generic(exported)[0].nodes[0]
+    depth = 0
+    while isinstance(value, BinaryOp):
+        depth += 1
+        value = value.left
+    nose.tools.eq_(depth, 5000)
+    nose.tools.eq_(value, Variable('$a'))
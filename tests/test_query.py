@@ -0,0 +1,89 @@
+from phply import phpast as ast
+from phply.query import compile_pattern, query, search_files, NodeIndex, \
+    PatternCache, PatternError
+from phply.project import parse_source
+
+import nose.tools
+import os
+import shutil
+import tempfile
+
+source = r"""<?php
+    function find($db, $id) {
+        $db->query("SELECT * FROM t WHERE id = " . $id);
+        $db->query('SELECT 1');
+        $db->Query(sprintf('%d', $id));
+        foo(1, 'two');
+        if ($id) {
+            return function() use ($db) { return $db->query("x" . $y); };
+        }
+    }
+"""
+
+def linenos(nodes):
+    return [node.lineno for node in nodes]
+
+def test_nested_patterns():
+    nodes = parse_source(source)
+    found = query('MethodCall[name="query"][params.0.node=BinaryOp[op="."]]',
+                  nodes)
+    nose.tools.eq_(linenos(found), [3, 8])
+    found = query('MethodCall[name~="(?i)^query$"]'
+                  '[params.0.node!=BinaryOp]', nodes)
+    nose.tools.eq_(linenos(found), [4, 5])
+    found = query('FunctionCall[name=foo][params.1.node="two"]', nodes)
+    nose.tools.eq_(linenos(found), [6])
+    nose.tools.eq_(query('FunctionCall[params.0.node=1]', nodes), found)
+
+def test_alternatives_and_pseudo_classes():
+    nodes = parse_source(source)
+    found = query('Closure|Function:has(BinaryOp[op="."])', nodes)
+    nose.tools.eq_([n.__class__.__name__ for n in found],
+                   ['Function', 'Closure'])
+    found = query('Return:not(Return[node=Closure])', nodes)
+    nose.tools.eq_(linenos(found), [8])
+    found = query('Closure[vars.0.is_ref=false][vars]', nodes)
+    nose.tools.eq_(len(found), 1)
+    nose.tools.eq_(len(query('*[lineno]', nodes)), 0)
+    nose.tools.eq_(len(query('*', nodes)), len(NodeIndex(nodes).nodes))
+
+def test_index():
+    nodes = parse_source(source)
+    index = NodeIndex(nodes)
+    nose.tools.eq_(index.count(ast.MethodCall), 4)
+    nose.tools.eq_(index.count(ast.Switch), 0)
+    pattern = compile_pattern('MethodCall[name="query"]')
+    nose.tools.assert_true(compile_pattern('MethodCall[name="query"]')
+                           is pattern)
+    nose.tools.eq_(linenos(pattern.search(index)), [3, 4, 8])
+    nose.tools.eq_(compile_pattern('Switch').search(index), [])
+
+def test_errors():
+    for text in ('Methodcall', 'MethodCall[nme="x"]', 'MethodCall[name="x"',
+                 'MethodCall[name~=x]', 'MethodCall ]', '[name=x]',
+                 'Variable[name~="("]'):
+        nose.tools.assert_raises(PatternError, compile_pattern, text)
+
+def test_pattern_cache():
+    compiled = []
+    cache = PatternCache(lambda text: compiled.append(text) or text, size=2)
+    for text in ('a', 'b', 'a', 'c', 'b', 'a'):
+        cache.get(text)
+    nose.tools.eq_(compiled, ['a', 'b', 'c', 'b', 'a'])
+    nose.tools.eq_(len(cache), 2)
+
+def test_search_files():
+    root = tempfile.mkdtemp()
+    try:
+        for name, text in (('a.php', source), ('b.php', '<?php } ?>')):
+            with open(os.path.join(root, name), 'w') as f:
+                f.write(text)
+        results = dict((os.path.basename(path), (matches, error))
+                       for path, matches, error
+                       in search_files('MethodCall', [root], processes=1))
+        nose.tools.eq_(linenos(results['a.php'][0]), [3, 4, 5, 8])
+        # a partial closing a brace opened elsewhere is a file error
+        nose.tools.eq_(results['b.php'][0], None)
+        nose.tools.assert_true(results['b.php'][1].startswith('SyntaxError'))
+    finally:
+        shutil.rmtree(root)
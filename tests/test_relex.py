@@ -0,0 +1,102 @@
+import random
+
+from phply import phplex
+from phply.relex import TokenStream
+
+import nose.tools
+
+source = '''<?php
+function f($a) {
+    return $a + 1; // one
+}
+$x = "a $b {$c[1]} ${d} $e->f c";
+$y = `ls $x`;
+$z = <<<EOT
+heredoc $x
+EOT;
+$w = <<<'EOT'
+nowdoc $x
+EOT;
+/* comment */
+?>
+<b>html</b>
+<?php
+echo 1 . 2;
+'''
+
+def lex(text):
+    lexer = phplex.new_lexer()
+    lexer.input(text)
+    return [(t.type, t.value, t.lexpos, t.lineno) for t in lexer]
+
+def check(stream):
+    nose.tools.eq_([(t.type, t.value, t.lexpos, t.lineno)
+                    for t in stream.tokens], lex(stream.source))
+
+def test_checkpoints():
+    stream = TokenStream(source, interval=4)
+    check(stream)
+    nose.tools.eq_([c.index for c in stream.checkpoints],
+                   list(range(0, len(stream.tokens) + 1, 4)))
+    for c in stream.checkpoints[1:]:
+        nose.tools.eq_(c.position, stream.tokens[c.index].lexpos)
+    states = set(c.state.state for c in stream.checkpoints)
+    assert 'heredoc' in states or 'nowdoc' in states or 'quoted' in states
+
+def test_local_edit():
+    text = source + ''.join('$v%d = %d;\n' % (i, i) for i in range(200))
+    stream = TokenStream(text, interval=8)
+    tokens = list(stream.tokens)
+    start = text.index('$a + 1')
+    index, count, new = stream.edit(start, start + 2, '$bb')
+    check(stream)
+    nose.tools.eq_([t.value for t in new], ['$bb'])
+    nose.tools.eq_(tokens[index].value, '$a')
+    nose.tools.eq_(count, 1)
+    # the tokens after the edit are reused
+    assert stream.tokens[-1] is tokens[-1]
+
+def test_edit_changes_state():
+    stream = TokenStream(source, interval=4)
+    start = source.index('heredoc $x')
+    index, count, new = stream.edit(start, start, 'EOT;\n')
+    check(stream)
+    assert count > 1 and new
+
+def test_close_comment():
+    text = '<?php $a /* b; $c = 1;\n$d = 2;\n'
+    stream = TokenStream(text, interval=2)
+    stream.edit(len(text), len(text), '*/')
+    check(stream)
+    nose.tools.eq_(stream.tokens[-1].type, 'COMMENT')
+    text = '<?php $a /*= b; $c = 1;\n' + '$d = 2;\n' * 20
+    stream = TokenStream(text, interval=2)
+    stream.edit(len(text), len(text), '*/')
+    check(stream)
+    nose.tools.eq_(stream.tokens[-1].type, 'COMMENT')
+    # an empty comment opens a doc comment that a later */ closes
+    text = '<?php /**/ $a = 1;\n' + '$b = 2;\n' * 20
+    stream = TokenStream(text, interval=2)
+    stream.edit(len(text), len(text), '*/')
+    check(stream)
+    nose.tools.eq_([t.type for t in stream.tokens],
+                   ['OPEN_TAG', 'DOC_COMMENT'])
+
+def test_random_edits():
+    rng = random.Random(2)
+    snippets = ['x', ' ', '\n', ';', '$y', '"', "'", '`', '{', '}', '$',
+                '/*', '*/', '/**/', '//', '?>', '<?php ', 'EOT', '<<<EOT\n', '->a',
+                '[', ']', '']
+    for interval in (1, 3, 16):
+        stream = TokenStream(source, interval)
+        for trial in range(200):
+            current = stream.source
+            start = rng.randrange(len(current) + 1)
+            end = min(len(current), start + rng.choice([0, 1, 4]))
+            try:
+                stream.edit(start, end, rng.choice(snippets))
+            except SyntaxError:
+                # the edit made the source unlexable
+                stream = TokenStream(current, interval)
+                continue
+            check(stream)
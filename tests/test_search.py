@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+
+from phply import phpast as ast
+from phply.project import parse_source
+from phply.query import PatternError
+from phply import phplex
+from phply.search import compile_search, search_files, IdentifierCache, \
+    identifiers
+
+import nose.tools
+
+source = r"""<?php
+    $db->query("SELECT * FROM t WHERE id = " . $id);
+    $db->Query('SELECT 1');
+    $conn->query($sql . $where);
+    strlen($a, $a);
+    strlen($a, $b);
+    function f($x) {
+        log_start();
+        $x = clean($x);
+        echo $x;
+        log_end();
+    }
+"""
+
+def test_metavariables():
+    nodes = parse_source(source)
+    matches = compile_search('$X->query($Y . $Z)').search(nodes)
+    nose.tools.eq_([m.lineno for m in matches], [2, 4])
+    nose.tools.eq_(matches[1].bindings,
+                   {'$X': ast.Variable('$conn'), '$Y': ast.Variable('$sql'),
+                    '$Z': ast.Variable('$where')})
+    matches = compile_search('$DB->$METHOD(...)').search(nodes)
+    nose.tools.eq_([m.bindings['$METHOD'] for m in matches],
+                   ['query', 'Query', 'query'])
+    # repeated metavariables must bind to equal nodes
+    matches = compile_search('strlen($A, $A)').search(nodes)
+    nose.tools.eq_([m.lineno for m in matches], [5])
+
+def test_ellipsis_and_sequences():
+    nodes = parse_source(source)
+    matches = compile_search('$X = clean($X); echo $X;').search(nodes)
+    nose.tools.eq_([m.lineno for m in matches], [9])
+    nose.tools.eq_(len(matches[0].nodes), 2)
+    matches = compile_search('array(..., $LAST)').search(
+        parse_source('<?php $a = array(1, 2, 3); $b = array();'))
+    nose.tools.eq_([m.bindings['$LAST'] for m in matches], [3])
+    matches = compile_search('log_start(); ...; log_end();').search(nodes)
+    nose.tools.eq_([len(m.nodes) for m in matches], [4])
+    matches = compile_search('function f($P) { ...; echo $V; ...; }')
+    nose.tools.eq_([(m.bindings['$P'], m.bindings['$V'])
+                    for m in matches.search(nodes)],
+                   [('$x', ast.Variable('$x'))])
+
+def test_pattern_identifiers():
+    pattern = compile_search('$X->query(mysql_escape($Y), $db)')
+    nose.tools.eq_(pattern.identifiers,
+                   frozenset(['query', 'mysql_escape', '$db']))
+    nose.tools.assert_raises(PatternError, compile_search, '$X->(')
+    nose.tools.assert_raises(PatternError, compile_search, '}')
+    nose.tools.assert_true(compile_search('$X->query(mysql_escape($Y), $db)')
+                           is pattern)
+
+def test_identifiers():
+    nose.tools.eq_(identifiers('<?php $A = Foo();'), set(['$a', 'foo']))
+    # template partials with unbalanced braces, in either order
+    nose.tools.eq_(identifiers('<?php } ?>'), None)
+    nose.tools.eq_(identifiers('<?php if ($a) { ?>x'), set(['$a']))
+    nose.tools.eq_(identifiers('<?php } ?>'), None)
+    nose.tools.eq_(phplex.full_lexer.lexstatestack, [])
+
+def test_search_files():
+    root = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(root, 'a.php'), 'w') as f:
+            f.write(source)
+        with open(os.path.join(root, 'b.php'), 'w') as f:
+            f.write('<?php $x = ;')
+        with open(os.path.join(root, 'c.php'), 'w') as f:
+            f.write('<?php $db->query($a . $b);')
+        with open(os.path.join(root, 'd.php'), 'w') as f:
+            f.write('<?php } ?>')
+        cache = os.path.join(root, 'identifiers.json')
+        results = dict((os.path.basename(path), (matches, error))
+                       for path, matches, error in
+                       search_files('$X->query($Y . $Z)', root, cache, 1))
+        # b.php has no `query` so it is never parsed; d.php can not be
+        # tokenized, so it has to be, and fails on its own
+        nose.tools.eq_(sorted(results), ['a.php', 'c.php', 'd.php'])
+        nose.tools.eq_(len(results['a.php'][0]), 2)
+        assert results['d.php'][1].startswith('SyntaxError')
+
+        index = IdentifierCache(cache)
+        nose.tools.eq_(len(index.files), 4)
+        nose.tools.eq_(index.update(root), 0)
+        nose.tools.eq_([os.path.basename(p) for p in
+                        index.candidates(frozenset(['$where']))],
+                       ['a.php', 'd.php'])
+    finally:
+        shutil.rmtree(root)
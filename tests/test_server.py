@@ -0,0 +1,201 @@
+import os
+import shutil
+import signal
+import tempfile
+
+from phply import phpast as ast
+from phply import phplex
+from phply.phpparse import make_parser
+from phply.server import Client, Server, ServerError
+
+import nose.tools
+
+source = '''<?php
+namespace A;
+class K { function m() { return 1; } }
+function f($a) { return "x $a"; }
+'''
+
+def serve(**options):
+    directory = tempfile.mkdtemp()
+    server = Server(os.path.join(directory, 'phply.sock'), **options)
+    server.start()
+    server.directory = directory
+    return server
+
+def shut(server):
+    server.close()
+    shutil.rmtree(server.directory)
+
+def test_methods():
+    server = serve(workers=2)
+    try:
+        with Client(server.path) as client:
+            expected = make_parser().parse(source, lexer=phplex.lexer.clone())
+            nose.tools.eq_(ast.from_generic(client.parse(source)), expected)
+            tokens = client.lex('<?php $a;')
+            nose.tools.eq_([t[0] for t in tokens],
+                           ['OPEN_TAG', 'VARIABLE', 'SEMI'])
+            nose.tools.eq_(tokens[1], ['VARIABLE', '$a', 1, 6])
+            nose.tools.eq_(client.outline(source),
+                           [['namespace', 'A', 2, None],
+                            ['class', 'A\\K', 3, None],
+                            ['method', 'A\\K::m', 3, 'A\\K'],
+                            ['function', 'A\\f', 4, None]])
+            path = os.path.join(server.directory, 'f.php')
+            with open(path, 'w') as f:
+                f.write(source)
+            nose.tools.eq_(client.outline(path=path)[0],
+                           ['namespace', 'A', 2, None])
+    finally:
+        shut(server)
+
+def test_errors():
+    server = serve(workers=1, limits={'max_nodes': 100})
+    try:
+        with Client(server.path) as client:
+            try:
+                client.parse('<?php $a = ;')
+            except ServerError as e:
+                nose.tools.eq_(e.type, 'SyntaxError')
+            else:
+                raise AssertionError('no error')
+            try:
+                client.parse(source, budget={'max_tokens': 10})
+            except ServerError as e:
+                nose.tools.eq_(e.type, 'BudgetExceeded')
+                nose.tools.eq_(e.data['limit'], 'max_tokens')
+                nose.tools.eq_(e.data['stats']['tokens'], 11)
+            else:
+                raise AssertionError('no error')
+            try:
+                client.parse('<?php echo 1' + ' + 1' * 200 + ';')
+            except ServerError as e:
+                nose.tools.eq_(e.data['limit'], 'max_nodes')
+            else:
+                raise AssertionError('no error')
+            try:
+                client.call('compile', source=source)
+            except ServerError as e:
+                nose.tools.eq_(e.type, 'ValueError')
+            else:
+                raise AssertionError('no error')
+            nose.tools.eq_(client.stats()['errors'], 4)
+    finally:
+        shut(server)
+
+def test_params():
+    server = serve(workers=1, limits={'max_nodes': 100})
+    try:
+        with Client(server.path) as client:
+            for params in ({'source': 5}, {'path': ['a.php']},
+                           {'source': source, 'filename': 1},
+                           {'source': source, 'budget': [1]},
+                           {'source': source, 'budget': {'max_nodes': 'x'}},
+                           {'source': source, 'budget': {'max_size': True}},
+                           {'source': source, 'budget': {'cancel': 1}}):
+                try:
+                    client.call('parse', **params)
+                except ServerError as e:
+                    nose.tools.eq_(e.type, 'ValueError')
+                else:
+                    raise AssertionError('%r accepted' % params)
+            # the connection is still served, and the server's limits
+            # are caps the request can lower but not raise
+            try:
+                client.parse('<?php echo 1' + ' + 1' * 200 + ';',
+                             budget={'max_nodes': 10 ** 6})
+            except ServerError as e:
+                nose.tools.eq_(e.data['limit'], 'max_nodes')
+                nose.tools.eq_(e.data['stats']['nodes'], 101)
+            else:
+                raise AssertionError('no error')
+            try:
+                client.parse(source, budget={'max_nodes': 5,
+                                             'max_tokens': None})
+            except ServerError as e:
+                nose.tools.eq_(e.data['stats']['nodes'], 6)
+            else:
+                raise AssertionError('no error')
+            nose.tools.eq_(len(client.parse(source)), 3)
+    finally:
+        shut(server)
+
+def test_access():
+    directory = tempfile.mkdtemp()
+    try:
+        inside = os.path.join(directory, 'inside')
+        os.mkdir(inside)
+        for name in ('inside/a.php', 'b.php'):
+            with open(os.path.join(directory, name), 'w') as f:
+                f.write('<?php echo 1;')
+        os.symlink(os.path.join(directory, 'b.php'),
+                   os.path.join(inside, 'c.php'))
+        server = serve(workers=1, root=inside)
+        try:
+            nose.tools.eq_(os.stat(server.path).st_mode & 0o777, 0o600)
+            with Client(server.path) as client:
+                tokens = client.lex(path=os.path.join(inside, 'a.php'))
+                nose.tools.eq_(tokens[0], ['OPEN_TAG', '<?php ', 1, 0])
+                for name in ('b.php', 'inside/c.php', 'inside/../b.php'):
+                    try:
+                        client.lex(path=os.path.join(directory, name))
+                    except ServerError as e:
+                        nose.tools.eq_(e.type, 'ValueError')
+                    else:
+                        raise AssertionError('%s was read' % name)
+        finally:
+            shut(server)
+    finally:
+        shutil.rmtree(directory)
+
+def test_batches():
+    server = serve(workers=1)
+    try:
+        with Client(server.path) as client:
+            sources = ['<?php echo %d;' % i for i in range(50)] + \
+                ['<?php echo ;']
+            results = client.call_many('parse', [{'source': s}
+                                                 for s in sources])
+            nose.tools.eq_([ast.from_generic(r)[0].nodes[0]
+                            for r in results[:-1]], list(range(50)))
+            assert isinstance(results[-1], ServerError)
+            stats = client.stats()
+            nose.tools.eq_(stats['requests'], 51)
+            assert stats['batches'] < 51
+    finally:
+        shut(server)
+
+def test_restarts():
+    server = serve(workers=1)
+    try:
+        with Client(server.path) as client:
+            os.kill(server.pool[0].process.pid, signal.SIGKILL)
+            server.pool[0].process.join()
+            client.parse(source)
+            nose.tools.eq_(client.stats()['restarts'], 1)
+    finally:
+        shut(server)
+    # workers stuck on a request are killed
+    server = serve(workers=1, timeout=0.05)
+    try:
+        with Client(server.path) as client:
+            try:
+                client.parse('<?php ' + '$a = f(1 + 2);' * 20000)
+            except ServerError as e:
+                nose.tools.eq_(e.type, 'WorkerTimeout')
+            else:
+                raise AssertionError('no error')
+            client.parse(source)
+            nose.tools.eq_(client.stats()['restarts'], 1)
+    finally:
+        shut(server)
+    # workers over the memory limit are replaced after answering
+    server = serve(workers=1, max_memory=1)
+    try:
+        with Client(server.path) as client:
+            client.parse(source)
+            client.parse(source)
+            nose.tools.eq_(client.stats()['restarts'], 2)
+    finally:
+        shut(server)
@@ -0,0 +1,85 @@
+from phply import phplex
+from phply.phpast import *
+from phply.phpparse import make_parser
+from phply.spans import LineIndex
+
+import nose.tools
+
+parser = make_parser(spans=True)
+
+def parse(source):
+    return parser.parse(source, lexer=phplex.lexer.clone())
+
+def text(source, node):
+    return source[node.start_offset:node.end_offset]
+
+def test_line_index():
+    index = LineIndex('ab\ncd\n\nef')
+    nose.tools.eq_(index.position(0), (1, 0))
+    nose.tools.eq_(index.position(2), (1, 2))
+    nose.tools.eq_(index.position(3), (2, 0))
+    nose.tools.eq_(index.position(7), (4, 0))
+    nose.tools.eq_(index.line(8), 4)
+    nose.tools.eq_(index.offset(2, 1), 4)
+
+def test_byte_offsets():
+    source = u'<?php\n$a = "\u00e9\u20ac";\n$b = "\u00e9"; $c;'
+    encoded = source.encode('utf-8')
+    index = LineIndex(source)
+    for offset in range(len(source) + 1):
+        nose.tools.eq_(index.byte_offset(offset),
+                       len(source[:offset].encode('utf-8')))
+    nose.tools.eq_(index.byte_offset(len(source), 'utf-16-le'),
+                   2 * len(source))
+    node = parse(source)[-1]
+    nose.tools.eq_(encoded[index.byte_offset(node.start_offset):
+                           index.byte_offset(node.end_offset)], b'$c')
+
+def test_expression_spans():
+    source = '<?php $x = foo($a, $b + 1) . (2);'
+    assignment, = parse(source)
+    nose.tools.eq_(text(source, assignment), '$x = foo($a, $b + 1) . (2)')
+    concat = assignment.expr
+    nose.tools.eq_(text(source, concat), 'foo($a, $b + 1) . (2)')
+    call = concat.left
+    nose.tools.eq_(text(source, call), 'foo($a, $b + 1)')
+    nose.tools.eq_([text(source, param) for param in call.params],
+                   ['$a', '$b + 1'])
+    nose.tools.eq_(text(source, call.params[1].node.left), '$b')
+
+def test_declaration_spans():
+    source = '''<?php
+abstract class C {
+    public static $v = 1, $w;
+    final public function m(&$p, $q = array(1, 'k' => 2)) {
+        if ($p) { return $q; }
+    }
+}
+'''
+    cls, = parse(source)
+    index = LineIndex(source)
+    nose.tools.eq_(index.span(cls), ((2, 0), (7, 1)))
+    variables, method = cls.nodes
+    nose.tools.eq_(text(source, variables), 'public static $v = 1, $w;')
+    nose.tools.eq_([text(source, v) for v in variables.nodes],
+                   ['$v = 1', '$w'])
+    nose.tools.eq_(index.span(method), ((4, 4), (6, 5)))
+    nose.tools.eq_([text(source, p) for p in method.params],
+                   ['&$p', "$q = array(1, 'k' => 2)"])
+    nose.tools.eq_([text(source, e) for e in method.params[1].default.nodes],
+                   ['1', "'k' => 2"])
+    if_ = method.nodes[0]
+    nose.tools.eq_(text(source, if_), 'if ($p) { return $q; }')
+    nose.tools.eq_(text(source, if_.node), '{ return $q; }')
+
+def test_same_tree():
+    source = '<?php function f($a) { return $a->b()->c[1]; } echo "x $y";'
+    expected = make_parser().parse(source, lexer=phplex.lexer.clone())
+    output = parse(source)
+    nose.tools.eq_(output, expected)
+    nose.tools.eq_(expected[0].start_offset, None)
+    def check(node):
+        assert node.start_offset is not None, node
+        assert node.start_offset <= node.end_offset, node
+    for node in output:
+        node.accept(check)
@@ -0,0 +1,110 @@
+from phply.symbolindex import SymbolIndex, extract_symbols
+from phply.project import parse_source
+
+import nose.tools
+import os
+import shutil
+import tempfile
+import time
+
+files = {
+    'models/user.php': r"""<?php
+        namespace App\Models;
+        const VERSION = 2;
+        interface HasName { function name(); }
+        class User implements HasName {
+            const TABLE = 'users';
+            function name() { return 'user'; }
+        }
+        function helper() {}
+    """,
+    'lib/util.php': r"""<?php
+        define('DEBUG', true);
+        trait Loggable { function log() {} }
+        function helper() {}
+    """,
+}
+
+def make_tree():
+    root = tempfile.mkdtemp()
+    for name, source in files.items():
+        path = os.path.join(root, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(source)
+    return root
+
+def test_extract_symbols():
+    symbols = extract_symbols(parse_source(files['models/user.php']))
+    nose.tools.eq_([(kind, name) for kind, name, lineno, container in symbols], [
+        ('namespace', 'App\\Models'),
+        ('constant', 'App\\Models\\VERSION'),
+        ('interface', 'App\\Models\\HasName'),
+        ('method', 'App\\Models\\HasName::name'),
+        ('class', 'App\\Models\\User'),
+        ('class_constant', 'App\\Models\\User::TABLE'),
+        ('method', 'App\\Models\\User::name'),
+        ('function', 'App\\Models\\helper'),
+    ])
+
+def test_lookup():
+    root = make_tree()
+    try:
+        index = SymbolIndex()
+        nose.tools.eq_(index.update([root], processes=1), 2)
+        user = os.path.join(root, 'models', 'user.php')
+
+        found = index.lookup('\\app\\models\\USER')
+        nose.tools.eq_([(s.kind, s.name, s.path, s.lineno) for s in found],
+                       [('class', 'App\\Models\\User', user, 5)])
+        nose.tools.eq_(len(index.lookup('App\\Models\\User::TABLE')), 1)
+        # constants are case-sensitive
+        nose.tools.eq_(index.lookup('App\\Models\\User::table'), [])
+        nose.tools.eq_(len(index.lookup('App\\Models\\user::NAME')), 1)
+        nose.tools.eq_(sorted(s.name for s in index.search('helper')),
+                       ['App\\Models\\helper', 'helper'])
+        nose.tools.eq_([s.kind for s in index.lookup('DEBUG')], ['constant'])
+    finally:
+        shutil.rmtree(root)
+
+def test_incremental_update():
+    root = make_tree()
+    try:
+        index = SymbolIndex(os.path.join(root, 'index.db'))
+        nose.tools.eq_(index.update(root, processes=1), 2)
+        nose.tools.eq_(index.update(root, processes=1), 0)
+
+        util = os.path.join(root, 'lib', 'util.php')
+        # touching a file without changing it does not reparse it
+        os.utime(util, (time.time() + 10, time.time() + 10))
+        nose.tools.eq_(index.update(root, processes=1), 0)
+
+        with open(util, 'w') as f:
+            f.write('<?php function replacement() {}')
+        nose.tools.eq_(index.update(root, processes=1), 1)
+        nose.tools.eq_(index.lookup('Loggable'), [])
+        nose.tools.eq_(len(index.lookup('replacement')), 1)
+
+        os.remove(util)
+        index.update(root, processes=1)
+        nose.tools.eq_(index.lookup('replacement'), [])
+        index.close()
+    finally:
+        shutil.rmtree(root)
+
+def test_unbalanced_braces():
+    # a template partial closing a brace opened elsewhere is a file error,
+    # not the end of the update
+    root = make_tree()
+    try:
+        partial = os.path.join(root, 'views', 'footer.php')
+        os.makedirs(os.path.dirname(partial))
+        with open(partial, 'w') as f:
+            f.write('<?php } ?>\n</body>')
+        index = SymbolIndex()
+        nose.tools.eq_(index.update([root], processes=1), 3)
+        nose.tools.eq_([path for path, error in index.errors()], [partial])
+        nose.tools.eq_(len(index.lookup('helper')), 1)
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+# bench_driver.py - Compares PLY's parse loop with the generated driver
+# Usage: bench_driver.py [-n REPEAT] file.php...
+
+import argparse
+import sys
+import time
+sys.path.append('..')
+
+from phply import phplex
+from phply.lalrgen import load_driver
+from phply.phpparse import make_parser
+
+def timed(func, sources, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        for source in sources:
+            func(source)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def lexed(source):
+    lexer = phplex.lexer.clone()
+    lexer.input(source)
+    return lexer, list(iter(lexer.token, None))
+
+def replay(parser, item):
+    # parse tokens lexed beforehand, to time the parse loop alone
+    lexer, tokens = item
+    tokens = iter(tokens)
+    parser.parse(None, lexer=lexer, tokenfunc=lambda: next(tokens, None))
+
+ap = argparse.ArgumentParser()
+ap.add_argument('-n', dest='repeat', type=int, default=3)
+ap.add_argument('files', metavar='FILE', nargs='+')
+args = ap.parse_args()
+
+sources = []
+for path in args.files:
+    with open(path) as f:
+        sources.append(f.read())
+size = sum(len(source) for source in sources) / 1024.0 / 1024.0
+tokens = [lexed(source) for source in sources]
+parser = make_parser()
+driver = load_driver()
+
+for name, p in (('ply', parser), ('driver', driver)):
+    elapsed = timed(lambda source: p.parse(source, lexer=phplex.lexer.clone()),
+                    sources, args.repeat)
+    print('%-8s %8.3fs %8.2f MB/s' % (name, elapsed, size / elapsed))
+    elapsed = timed(lambda item: replay(p, item), tokens, args.repeat)
+    print('%-8s %8.3fs %8.2f MB/s (parse loop only)'
+          % (name, elapsed, size / elapsed))
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+# bench_extract.py - Compares lexer-only extraction with a full parse
+# Usage: bench_extract.py [-n REPEAT] file.php...
+
+import argparse
+import sys
+import time
+sys.path.append('..')
+
+from phply import phpast as ast
+from phply.extract import extract
+from phply.phplex import lexer
+from phply.phpparse import make_parser
+
+def walk_strings(nodes):
+    # what a parse-based extractor has to do: visit the whole tree
+    found = []
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, ast.Node):
+            stack.extend(getattr(node, field) for field in node.fields)
+        elif isinstance(node, str):
+            found.append(node)
+    return found
+
+def timed(func, sources, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        for source in sources:
+            func(source)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+ap = argparse.ArgumentParser()
+ap.add_argument('-n', dest='repeat', type=int, default=3)
+ap.add_argument('files', metavar='FILE', nargs='+')
+args = ap.parse_args()
+
+sources = []
+for path in args.files:
+    with open(path) as f:
+        sources.append(f.read())
+size = sum(len(source) for source in sources) / 1024.0 / 1024.0
+parser = make_parser()
+
+def parse(source):
+    walk_strings(parser.parse(source, lexer=lexer.clone(), tracking=True))
+
+def lex(source):
+    list(extract(source))
+
+for name, func in (('parse', parse), ('extract', lex)):
+    elapsed = timed(func, sources, args.repeat)
+    print('%-8s %8.3fs %8.2f MB/s' % (name, elapsed, size / elapsed))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+# bench_generic.py - Times exporting parsed files with generic() and
+# loading them back with from_generic()
+# Usage: bench_generic.py [-n REPEAT] file.php...
+
+import argparse
+import sys
+import time
+sys.path.append('..')
+
+from phply import phpast as ast
+from phply.phplex import lexer
+from phply.phpparse import make_parser
+
+def recursive_generic(node, with_lineno=False):
+    # generic() as it used to be, for comparison
+    values = {}
+    if with_lineno:
+        values['lineno'] = node.lineno
+    for field in node.fields:
+        value = getattr(node, field)
+        if hasattr(value, 'generic'):
+            value = recursive_generic(value, with_lineno)
+        elif isinstance(value, list):
+            items = value
+            value = []
+            for item in items:
+                if hasattr(item, 'generic'):
+                    item = recursive_generic(item, with_lineno)
+                value.append(item)
+        values[field] = value
+    return (node.__class__.__name__, values)
+
+def timed(func, items, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        for item in items:
+            func(item)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+ap = argparse.ArgumentParser()
+ap.add_argument('-n', dest='repeat', type=int, default=3)
+ap.add_argument('files', metavar='FILE', nargs='+')
+args = ap.parse_args()
+
+parser = make_parser()
+trees = []
+for path in args.files:
+    with open(path) as f:
+        trees.append(parser.parse(f.read(), lexer=lexer.clone()))
+exported = [ast.to_generic(nodes, True) for nodes in trees]
+count = []
+for nodes in trees:
+    for node in nodes:
+        if isinstance(node, ast.Node):
+            node.accept(count.append)
+count = len(count)
+
+def old_export(nodes):
+    [recursive_generic(node, True) if isinstance(node, ast.Node) else node
+     for node in nodes]
+
+for name, func, items in (
+        ('recursive generic()', old_export, trees),
+        ('to_generic()', lambda nodes: ast.to_generic(nodes, True), trees),
+        ('from_generic()', ast.from_generic, exported)):
+    elapsed = timed(func, items, args.repeat)
+    print('%-20s %8.3fs %10d nodes/s' % (name, elapsed, count / elapsed))
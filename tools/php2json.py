@@ -6,6 +6,7 @@
 import sys
 sys.path.append('..')
 
+from phply.phpast import to_generic
 from phply.phplex import lexer
 from phply.phpparse import make_parser
 
@@ -16,13 +17,7 @@ output = sys.stdout
 with_lineno = True
 
 def export(items):
-    result = []
-    if items:
-       for item in items:
-           if hasattr(item, 'generic'):
-               item = item.generic(with_lineno=with_lineno)
-           result.append(item)
-    return result
+    return to_generic(items or [], with_lineno)
 
 parser = make_parser()
 simplejson.dump(export(parser.parse(input.read(),